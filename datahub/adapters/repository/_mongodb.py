@@ -16,10 +16,12 @@ from pymongo.errors import DuplicateKeyError
 
 from datahub.spec import *
 from datahub.model import DumpContext
-from datahub.errors import BadValueError, DuplicatedKeyError, ModelNotFoundError
+from datahub.errors import BadValueError, DuplicatedKeyError, ModelNotFoundError, InvalidParameterError
 from datahub.updates import PushAction, PushsAction, PopAction, SetAction, ClearAction
-from datahub.conditions import AndCondition, OrCondition, NotCondition, KeyValueCondition, KeyValuesCondition, ExistCondition, \
-    NonExistCondition, GreaterCondition, LesserCondition
+from datahub.mongoquery import compileQuery, getKeysetFind
+from datahub.projection import loadFields, getMongoProjection
+from datahub import mongobulk
+from datahub.bulk import CreateOperation, ReplaceOperation
 from datahub.repository import Repository
 
 class MongodbRepository(Repository):
@@ -32,22 +34,30 @@ class MongodbRepository(Repository):
         FEATURE_STORE_EXIST,
         FEATURE_STORE_GET,
         FEATURE_STORE_CREATE,
+        FEATURE_STORE_CREATE_MANY,
         FEATURE_STORE_REPLACE,
         FEATURE_STORE_UPDATE,
         FEATURE_STORE_DELETE,
         FEATURE_STORE_COUNT,
+        FEATURE_STORE_BULK_WRITE,
         # The query feature
         FEATURE_QUERY_EXIST,
         FEATURE_QUERY_GET,
         FEATURE_QUERY_UPDATE,
         FEATURE_QUERY_DELETE,
         FEATURE_QUERY_COUNT,
+        # The high level feature
+        FEATURE_KEYSET_PAGING,
         ]
 
-    def __init__(self, cls, database, sorts = None):
+    def __init__(self, cls, database, sorts = None, strictLoad = False):
         """Create a new MongodbRepository
+        Parameters:
+            strictLoad                      Validate the models loaded from mongodb, by default the documents are trusted
+                                            since they're validated when written
         """
         super(MongodbRepository, self).__init__(cls, sorts)
+        self.strictLoad = strictLoad
         # Check the metadata
         metadata = cls.getMetadata()
         if not metadata:
@@ -64,104 +74,13 @@ class MongodbRepository(Repository):
         if indices:
             self.collection.create_indexes(indices)
 
-    def __getquerybycondition__(self, condition):
-        """Get query by condition
-        """
-        if isinstance(condition, AndCondition):
-            return { '$and': [ self.__getquerybycondition__(x) for x in condition.conditions ] }
-        elif isinstance(condition, OrCondition):
-            return { '$or': [ self.__getquerybycondition__(x) for x in condition.conditions ] }
-        elif isinstance(condition, NotCondition):
-            return { '$nor': [ self.__getquerybycondition__(condition.condition) ] }
-        elif isinstance(condition, KeyValueCondition):
-            if condition.equals:
-                return { condition.key: condition.value }
-            else:
-                return { condition.key: { '$ne': condition.value } }
-        elif isinstance(condition, KeyValuesCondition):
-            if condition.includes:
-                return { condition.key: { '$in': condition.values } }
-            else:
-                return { condition.key: { '$nin': condition.values } }
-        elif isinstance(condition, ExistCondition):
-            return { condition.key: { '$exists': True } }
-        elif isinstance(condition, NonExistCondition):
-            return { condition.key: { '$exists': False } }
-        elif isinstance(condition, GreaterCondition):
-            if condition.equals:
-                return { condition.key: { '$gte': condition.value } }
-            else:
-                return { condition.key: { '$gt': condition.value } }
-        elif isinstance(condition, LesserCondition):
-            if condition.equals:
-                return { condition.key: { '$lte': condition.value } }
-            else:
-                return { condition.key: { '$lt': condition.value } }
-        else:
-            raise TypeError('Unknown condition type [%s]' % type(condition).__name__)
-
-    def __optimizequery__(self, query):
-        """Optimize the query
-        """
-        if len(query) == 1:
-            # Check if a logic query
-            key, value = query.keys()[0], query.values()[0]
-            if key in ('$and', '$or'):
-                # Optimize children
-                value = [ self.__optimizequery__(x) for x in value ]
-                # Merge queries
-                ands, ors, others = [], [], []
-                for q in value:
-                    k, v = q.keys()[0], q.values()[0]
-                    if k == '$and':
-                        ands.extend(v)
-                    elif k == '$or':
-                        ors.extend(v)
-                    else:
-                        others.append(q)
-                value = []
-                value.extend(others)
-                if key == '$and':
-                    value.extend(ands)
-                    if ors:
-                        value.append({ '$or': ors })
-                else:
-                    value.extend(ors)
-                    if ands:
-                        value.append({ '$and': ands })
-                # Done
-                return { key: value }
-            elif key == '$nor':
-                nors, others = [], []
-                # Optimize children
-                value = [ self.__optimizequery__(x) for x in value ]
-                for q in value:
-                    k, v = q.keys()[0], q.values()[0]
-                    if k == '$nor':
-                        nors.extend(v)
-                    if k == '$and':
-                        others.extend(v)
-                    else:
-                        others.append(q)
-                if not nors:
-                    return { '$nor': others }
-                else:
-                    if others:
-                        return { '$and': [ { '$nor': others } ] + nors }
-                    else:
-                        return { '$and': nors }
-            # Done
-        return query
-
     def getMongoQueryByCondition(self, condition):
-        """Get mongodb query by condition
+        """Get mongodb query by condition (See datahub.mongoquery)
+        NOTE: The returned query is shared, please do not change it
+        Returns:
+            The mongodb query or None if the condition is always false
         """
-        # Get original query
-        query = self.__getquerybycondition__(condition)
-        # Optimize the query
-        query = self.__optimizequery__(query)
-        # Done
-        return query
+        return compileQuery(condition, self.cls)
 
     def getMongoSortBySortRule(self, sort):
         """Get mongodb sort by sort
@@ -205,6 +124,69 @@ class MongodbRepository(Repository):
         # Done
         return mongoUpdateArgs
 
+    def loadModel(self, doc, configs = None):
+        """Load the model from the mongodb document
+        Configs:
+            strictLoad                      Validate the loaded model, use the repository setting by default
+            lazyLoad                        Decode the fields when they're accessed the first time, false by default
+            fields                          The document is a projection of the fields (See datahub.projection)
+        """
+        strictLoad = configs.get('strictLoad', self.strictLoad) if configs else self.strictLoad
+        if configs and configs.get('fields'):
+            model = self.cls.loadPartial(doc, trusted = not strictLoad, lazy = bool(configs.get('lazyLoad')))
+            if strictLoad:
+                model.validate(required = False)
+            return model
+        elif strictLoad:
+            model = self.cls(doc)
+            model.validate()
+            return model
+        elif configs and configs.get('lazyLoad'):
+            return self.cls.loadLazy(doc)
+        else:
+            return self.cls.loadTrusted(doc)
+
+    def find(self, query, sorts = None, start = 0, size = 0, configs = None):
+        """Find the models
+        Configs:
+            after                           The continuation token (See datahub.paging), the keyset pagination is used
+                                            instead of skipping start if this config is set (To None for the first page)
+            batchSize                       The count of the documents fetched from mongodb in one round trip, the
+                                            models are loaded lazily so the memory is bounded by it
+            fields                          The fields to select (See datahub.projection), all fields by default
+        Returns:
+            Yield of model
+        """
+        sorts = sorts or self.sorts
+        configs, fields = self.loadFieldsConfig(configs)
+        if configs and 'after' in configs:
+            # Keyset pagination
+            query, sorts = getKeysetFind(query, sorts, configs['after'])
+            if query is None:
+                return
+            start = 0
+            if fields:
+                # The sort keys are required by the continuation token
+                fields = loadFields(fields + tuple(x.key for x in sorts))
+        for doc in self.collection.find(query,
+            projection = getMongoProjection(fields),
+            sort = [ self.getMongoSortBySortRule(x) for x in sorts or [] ],
+            skip = start,
+            limit = size,
+            batch_size = configs.get('batchSize') or 0 if configs else 0
+            ):
+            yield self.loadModel(doc, configs)
+
+    def loadFieldsConfig(self, configs):
+        """Load the fields config (See datahub.projection)
+        Returns:
+            A tuple of (configs, fields)
+        """
+        fields = loadFields(configs.get('fields'), self.cls) if configs else None
+        if fields:
+            configs = dict(configs, fields = fields)
+        return configs, fields
+
     def exist(self, id = None, configs = None):
         """Exist
         Parameters:
@@ -226,68 +208,58 @@ class MongodbRepository(Repository):
         Returns:
             True / False
         """
-        return not self.collection.find_one(self.getMongoQueryByCondition(query), projection = {}) is None
+        mongoQuery = self.getMongoQueryByCondition(query)
+        if mongoQuery is None:
+            return False
+        return not self.collection.find_one(mongoQuery, projection = {}) is None
 
     def getOne(self, id, configs = None):
         """Get one by id
+        Configs:
+            fields                          The fields to select (See datahub.projection), all fields by default
         Returns:
             Model object
         """
-        doc = self.collection.find_one(id)
+        configs, fields = self.loadFieldsConfig(configs)
+        doc = self.collection.find_one(id, projection = getMongoProjection(fields))
         if doc:
-            model = self.cls(doc)
-            model.validate()
-            return model
+            return self.loadModel(doc, configs)
 
     def get(self, id = None, start = 0, size = 0, sorts = None, configs = None):
         """Get by id
+        Configs:
+            after                           The continuation token of the keyset pagination (See find)
         Returns:
             Yield of Model object
         """
         if isinstance(id, (list, tuple)):
             # Get models
-            for doc in self.collection.find(
-                { '_id': { '$in': id } },
-                sort = [ self.getMongoSortBySortRule(x) for x in sorts or self.sorts or [] ],
-                skip = start,
-                limit = size
-                ):
-                model = self.cls(doc)
-                model.validate()
+            for model in self.find({ '_id': { '$in': id } }, sorts, start, size, configs):
                 yield model
         elif not id is None:
             # Get a single model
             # NOTE: Ignore the sorts parameters
-            doc = self.collection.find_one(id)
-            if doc:
-                model = self.cls(doc)
-                model.validate()
+            model = self.getOne(id, configs)
+            if model:
                 yield model
         else:
             # Get all models
-            for doc in self.collection.find(
-                sort = [ self.getMongoSortBySortRule(x) for x in sorts or self.sorts or [] ],
-                skip = start,
-                limit = size
-                ):
-                model = self.cls(doc)
-                model.validate()
+            for model in self.find({}, sorts, start, size, configs):
                 yield model
 
     def getByQuery(self, query, sorts = None, start = 0, size = 0, configs = None):
         """Gets by query
         Parameters:
             query                       The condition
+        Configs:
+            after                       The continuation token of the keyset pagination (See find)
         Returns:
             Yield of model
         """
-        for doc in self.collection.find(self.getMongoQueryByCondition(query),
-            sort = [ self.getMongoSortBySortRule(x) for x in sorts or self.sorts or [] ],
-            skip = start,
-            limit = size
-            ):
-            model = self.cls(doc)
-            model.validate()
+        mongoQuery = self.getMongoQueryByCondition(query)
+        if mongoQuery is None:
+            return
+        for model in self.find(mongoQuery, sorts, start, size, configs):
             yield model
 
     def create(self, model, configs = None):
@@ -318,6 +290,26 @@ class MongodbRepository(Repository):
             self.collection.replace_one({ '_id': model.id }, doc, upsert = True)
         # Done
 
+    def createMany(self, models, ordered = False, configs = None):
+        """Create a couple of models by batches
+        Parameters:
+            models                          A list of model objects
+            ordered                         Stop at the first failed model, the remaining models are skipped
+            configs                         A dict of configs
+        Returns:
+            The CreateManyResult object
+        Configs:
+            overwrite                       Overwrite the models if exist, false by default
+            batchSize                       The max count of the models written in one round trip
+        """
+        # Check model type
+        for model in models:
+            if not isinstance(model, self.cls):
+                raise TypeError('model must be an instance of class [%s]' % self.cls.__name__)
+        # Write to mongodb
+        configs = configs or {}
+        return mongobulk.createMany(self.collection, models, ordered, configs.get('batchSize'), configs.get('overwrite', False))
+
     def replace(self, model, configs = None):
         """Replace a model by id
         Parameters:
@@ -343,6 +335,31 @@ class MongodbRepository(Repository):
             raise ModelNotFoundError
         # Done
 
+    def save(self, model, configs = None):
+        """Save the changes of the model (See DataModel.changes) by update
+        Parameters:
+            model                           The model object
+            configs                         A dict of configs
+        Returns:
+            The model id (As the save of the data services)
+        Errors:
+            - ModelNotFoundError will be raised if the model not found
+        """
+        # Check model type
+        if not isinstance(model, self.cls):
+            raise TypeError('model must be an instance of class [%s]' % self.cls.__name__)
+        # Validate model & get the changes
+        model.validate()
+        updates = model.changes(DumpContext(datetime2str = False))
+        # Update mongodb
+        if updates:
+            res = self.collection.update_one({ '_id': model.id }, self.getMongoUpdatesByUpdates(updates))
+            if res.matched_count == 0:
+                raise ModelNotFoundError
+        # Done
+        model.resetChanges()
+        return model.id
+
     def update(self, id, updates, configs = None):
         """Update model
         Parameters:
@@ -360,6 +377,22 @@ class MongodbRepository(Repository):
         # Return the count of matched models
         return res.matched_count
 
+    def bulkWrite(self, operations, ordered = False, configs = None):
+        """Write a couple of operations by a single bulk write
+        Parameters:
+            operations                      A list of WriteOperation (See datahub.bulk)
+            ordered                         Stop at the first failed operation, the remaining operations are skipped
+            configs                         A dict of configs
+        Returns:
+            The BulkWriteResult object
+        """
+        # Check model type
+        for operation in operations:
+            if isinstance(operation, (CreateOperation, ReplaceOperation)) and not isinstance(operation.model, self.cls):
+                raise TypeError('model must be an instance of class [%s]' % self.cls.__name__)
+        # Write to mongodb
+        return mongobulk.bulkWrite(self.collection, operations, ordered, self.getMongoUpdatesByUpdates)
+
     def updateByQuery(self, query, updates, configs = None):
         """Update a couple of models by query
         Parameters:
@@ -369,7 +402,13 @@ class MongodbRepository(Repository):
         Returns:
             The count of matched models
         """
-        return self.collection.update_many(self.getMongoQueryByCondition(query), self.getMongoUpdatesByUpdates(updates)).modified_count
+        mongoQuery = self.getMongoQueryByCondition(query)
+        if mongoQuery is None:
+            return 0
+        elif not mongoQuery:
+            # Instead of update all models, we raise an exception in order to avoid potential misoperation risk
+            raise InvalidParameterError(reason = 'Require query')
+        return self.collection.update_many(mongoQuery, self.getMongoUpdatesByUpdates(updates)).modified_count
 
     def delete(self, id, configs = None):
         """Delete model
@@ -394,7 +433,13 @@ class MongodbRepository(Repository):
         Returns:
             The count of deleted models
         """
-        return self.collection.delete_many(self.getMongoQueryByCondition(query)).deleted_count
+        mongoQuery = self.getMongoQueryByCondition(query)
+        if mongoQuery is None:
+            return 0
+        elif not mongoQuery:
+            # Instead of delete all models, we raise an exception in order to avoid potential misoperation risk
+            raise InvalidParameterError(reason = 'Require query')
+        return self.collection.delete_many(mongoQuery).deleted_count
 
     def count(self, id = None, configs = None):
         """Count models
@@ -420,7 +465,10 @@ class MongodbRepository(Repository):
         Returns:
             The count of the counting models
         """
-        return self.collection.count(self.getMongoQueryByCondition(query))
+        mongoQuery = self.getMongoQueryByCondition(query)
+        if mongoQuery is None:
+            return 0
+        return self.collection.count(mongoQuery)
 
     def support(self, name):
         """Check if the feature is supported
@@ -17,6 +17,10 @@ import requests
 
 from datahub.spec import *
 from datahub.utils import json as _json
+from datahub.bulk import CreateManyResult, BulkWriteResult
+from datahub.paging import Page
+from datahub.projection import loadFields
+from datahub.streaming import FORMAT_JSON, STREAM_PATHS, iterStreamLines
 from datahub.errors import ModelNotFoundError, DuplicatedKeyError
 
 class Connection(object):
@@ -183,12 +187,29 @@ class ResourceConnector(object):
         else:
                 self.handleError(rsp)
 
-    def get(self, url, id = None, query = None, start = 0, size = 0, sorts = None, configs = None, cls = None):
+    def loadModel(self, cls, raw, fields = None):
+        """Load and validate the model
+        Parameters:
+            fields                              The selected fields, the model is partially loaded if specified
+        Returns:
+            The model object
+        """
+        if fields:
+            model = cls.loadPartial(raw)
+            model.validate(required = False)
+        else:
+            model = cls.load(raw)
+            model.validate()
+        return model
+
+    def get(self, url, id = None, query = None, start = 0, size = 0, sorts = None, configs = None, cls = None, fields = None):
         """Get
         Parameters:
             url                                 The request url
             id                                  The id or a list / tuple of ids or None
             query                               The Condition object or None
+            fields                              The fields to select (See datahub.projection), the models are partially
+                                                loaded if specified
         Returns:
             - For single id get request, returns None or A model object
             - Otherwise returns a list of models (May be empty)
@@ -207,6 +228,9 @@ class ResourceConnector(object):
             body['size'] = size
         if sorts:
             body['sorts'] = [ x.dump() for x in sorts ]
+        fields = loadFields(fields)
+        if fields:
+            body['fields'] = fields
         if configs:
             body['configs'] = configs
         # Send request
@@ -221,17 +245,96 @@ class ResourceConnector(object):
         raw = _json.loads(rsp.content)['value']
         if isinstance(raw, list):
             # A list of result
-            models = [ cls.load(x) for x in raw ]
-            for model in models:
-                model.validate()
-            # Done
-            return models
+            return [ self.loadModel(cls, x, fields) for x in raw ]
         else:
             # Single result
-            model = cls.load(raw)
-            model.validate()
-            # Done
-            return model
+            return self.loadModel(cls, raw, fields)
+
+    def getPage(self, url, id = None, query = None, size = 0, sorts = None, after = None, configs = None, cls = None, fields = None):
+        """Get a page of models by the keyset pagination
+        Parameters:
+            url                                 The request url
+            id                                  A list / tuple of ids or None
+            query                               The Condition object or None
+            after                               The continuation token of the previous page, None for the first page
+        Returns:
+            The Page object
+        """
+        if not id is None and query:
+            raise ValueError('Cannot both specify id and query')
+        # Create body
+        body = { 'after': after }
+        if not id is None:
+            body['id'] = id
+        if query:
+            body['query'] = query.dump()
+        if size:
+            body['size'] = size
+        if sorts:
+            body['sorts'] = [ x.dump() for x in sorts ]
+        fields = loadFields(fields)
+        if fields:
+            body['fields'] = fields
+        if configs:
+            body['configs'] = configs
+        # Send request
+        rsp = self.connection.get(self.getFeatureUrl(url, FEATURE_QUERY_GET), json = body)
+        # Handle response
+        if rsp.status_code != 200:
+            self.handleError(rsp)
+        # Load the models
+        cls = cls or self.cls
+        raw = _json.loads(rsp.content)['value']
+        return Page([ self.loadModel(cls, x, fields) for x in raw['models'] ], raw.get('next'))
+
+    def stream(self, url, id = None, query = None, start = 0, size = 0, sorts = None, batchSize = 0, configs = None, cls = None, fields = None, format = FORMAT_JSON):
+        """Stream models, the response is decoded line by line
+        Parameters:
+            url                                 The request url
+            id                                  A list / tuple of ids or None
+            query                               The Condition object or None
+            batchSize                           The count of the models fetched from the backend in one round trip
+            format                              The stream format (See datahub.streaming)
+        Returns:
+            Yield of model objects
+        """
+        if not id is None and query:
+            raise ValueError('Cannot both specify id and query')
+        if not format in STREAM_PATHS:
+            raise ValueError('Unknown stream format [%s]' % format)
+        # Create body
+        body = {}
+        if not id is None:
+            body['id'] = id
+        if query:
+            body['query'] = query.dump()
+        if start:
+            body['start'] = start
+        if size:
+            body['size'] = size
+        if sorts:
+            body['sorts'] = [ x.dump() for x in sorts ]
+        if batchSize:
+            body['batchSize'] = batchSize
+        fields = loadFields(fields)
+        if fields:
+            body['fields'] = fields
+        if configs:
+            body['configs'] = configs
+        # Send request
+        if url.endswith('/'):
+            url = url[: -1]
+        rsp = self.connection.post(url + STREAM_PATHS[format], json = body, stream = True)
+        # Handle response
+        if rsp.status_code != 200:
+            self.handleError(rsp)
+        # Load the models
+        cls = cls or self.cls
+        try:
+            for value in iterStreamLines(rsp.iter_lines(), format):
+                yield self.loadModel(cls, value, fields)
+        finally:
+            rsp.close()
 
     def create(self, url, model, configs = None):
         """Create a model
@@ -264,6 +367,31 @@ class ResourceConnector(object):
             self.handleError(rsp)
         # Done
 
+    def createMany(self, url, models, ordered = False, configs = None):
+        """Create models
+        Parameters:
+            url                             The request url
+            models                          A list of model objects
+            ordered                         Stop at the first failed model, the remaining models are skipped
+            configs                         A dict of configs
+        Returns:
+            The CreateManyResult object
+        """
+        # Create the body
+        body = {
+            'models': [ x.dump() for x in models ],
+            'ordered': ordered,
+        }
+        if configs:
+            body['configs'] = configs
+        # Send request
+        rsp = self.connection.post(self.getFeatureUrl(url, FEATURE_STORE_CREATE_MANY), json = body)
+        # Handle response
+        if rsp.status_code != 200:
+            self.handleError(rsp)
+        # Load the result
+        return CreateManyResult.load(_json.loads(rsp.content)['value'])
+
     def replace(self, url, model, configs = None):
         """Replace
         Returns:
@@ -284,6 +412,31 @@ class ResourceConnector(object):
             self.handleError(rsp)
         # Done
 
+    def bulkWrite(self, url, operations, ordered = False, configs = None):
+        """Write operations
+        Parameters:
+            url                             The request url
+            operations                      A list of WriteOperation (See datahub.bulk)
+            ordered                         Stop at the first failed operation, the remaining operations are skipped
+            configs                         A dict of configs
+        Returns:
+            The BulkWriteResult object
+        """
+        # Create the body
+        body = {
+            'operations': [ x.dump() for x in operations ],
+            'ordered': ordered,
+        }
+        if configs:
+            body['configs'] = configs
+        # Send request
+        rsp = self.connection.post(self.getFeatureUrl(url, FEATURE_STORE_BULK_WRITE), json = body)
+        # Handle response
+        if rsp.status_code != 200:
+            self.handleError(rsp)
+        # Load the result
+        return BulkWriteResult.load(_json.loads(rsp.content)['value'])
+
     def update(self, url, updates, id = None, query = None, configs = None):
         """Update a model
         Returns:
@@ -20,11 +20,17 @@ from unifiedrpc.content.container import PlainContentContainer
 from datahub.spec import *
 from datahub.utils import json
 from datahub.sorts import SortRule
-from datahub.model import DataModel
-from datahub.errors import DataHubError, ModelNotFoundError, WatchTimeoutError, WatchResetError, DuplicatedKeyError
+from datahub.diff import diff
+from datahub.model import DataModel, DumpContext
+from datahub.errors import DataHubError, DataModelError, InvalidParameterError, ModelNotFoundError, WatchTimeoutError, WatchResetError, DuplicatedKeyError
 from datahub.updates import UpdateAction, SetAction
+from datahub.parsing import loadCondition, loadUpdateActions
+from datahub.bulk import WriteOperation, CreateOperation, ReplaceOperation
+from datahub.paging import PageTracker
+from datahub.projection import loadFields
+from datahub.streaming import FORMAT_JSON, FORMAT_NDJSON, MIMETYPES, STREAM_PATHS, iterModels, iterStream
 from datahub.repository import Repository
-from datahub.conditions import Condition, AndCondition, KeyValueCondition
+from datahub.conditions import Condition, AndCondition, KeyValueCondition, KeyValuesCondition, ValueSet
 
 CONFIG_WATCH_KEEP_ALIVE         = 10
 
@@ -76,6 +82,8 @@ class ResourceService(Service):
     """
     def __init__(self, repository, locations, name = None, configs = None):
         """Create a new ResourceService
+        Configs:
+            replaceByDiff                       Replace the model by updating the differences to the stored model, false by default
         """
         self.configs = configs
         self.locations = locations
@@ -137,7 +145,7 @@ class ResourceService(Service):
             if body:
                 query = body.pop(key, None)
                 if query:
-                    return Condition.load(query)
+                    return loadCondition(query)
             # Done
         except DataHubError as error:
             raise BadRequestError(reason = 'Invalid query [%s]' % error)
@@ -246,12 +254,30 @@ class ResourceService(Service):
             get(path = self.getLocationPath(location, '/<id>'))(endpoint)
             post(path = self.getLocationPath(location, '/_query'))(endpoint)
             yield 'get', endpoint
+            # The streams of get, one endpoint per format since the mimetype is bound to the endpoint
+            for name, format, method in (('stream', FORMAT_JSON, self.stream), ('streamNDJSON', FORMAT_NDJSON, self.streamNDJSON)):
+                endpoint = Endpoint(self.getEndpointHandler(location, method))
+                container(PlainContentContainer)(endpoint)
+                mimetype(MIMETYPES[format])(endpoint)
+                get(path = self.getLocationPath(location, STREAM_PATHS[format]))(endpoint)
+                post(path = self.getLocationPath(location, STREAM_PATHS[format]))(endpoint)
+                yield name, endpoint
         # Get create feature
         if not location.features or FEATURE_STORE_CREATE in location.features:
             endpoint = Endpoint(self.getEndpointHandler(location, self.create))
             post(path = self.getLocationPath(location))(endpoint)
             #post(path = self.getLocationPath(location, '/'))(endpoint)
             yield 'create', endpoint
+        # The create many feature
+        if not location.features or FEATURE_STORE_CREATE_MANY in location.features:
+            endpoint = Endpoint(self.getEndpointHandler(location, self.createMany))
+            post(path = self.getLocationPath(location, '/_creates'))(endpoint)
+            yield 'createMany', endpoint
+        # The bulk write feature
+        if not location.features or FEATURE_STORE_BULK_WRITE in location.features:
+            endpoint = Endpoint(self.getEndpointHandler(location, self.bulkWrite))
+            post(path = self.getLocationPath(location, '/_bulk'))(endpoint)
+            yield 'bulkWrite', endpoint
         # The replace feature
         if not location.features or FEATURE_STORE_REPLACE in location.features:
             endpoint = Endpoint(self.getEndpointHandler(location, self.replace))
@@ -300,8 +326,12 @@ class ResourceService(Service):
             return self.get(location, params, body)
         elif feature == FEATURE_STORE_CREATE:
             return self.create(location, params, body)
+        elif feature == FEATURE_STORE_CREATE_MANY:
+            return self.createMany(location, params, body)
         elif feature == FEATURE_STORE_REPLACE:
             return self.replace(location, params, body)
+        elif feature == FEATURE_STORE_BULK_WRITE:
+            return self.bulkWrite(location, params, body)
         elif feature in (FEATURE_STORE_UPDATE, FEATURE_QUERY_UPDATE):
             return self.update(location, params, body)
         elif feature in (FEATURE_STORE_DELETE, FEATURE_QUERY_DELETE):
@@ -350,7 +380,7 @@ class ResourceService(Service):
                 if isinstance(id, basestring):
                     query.append(KeyValueCondition(key = '_id', value = id))
                 else:
-                    query.append(KeyValuesCondition(key = '_id', values = id))
+                    query.append(KeyValuesCondition(key = '_id', values = ValueSet.unique(id)))
             if len(query) == 1:
                 query = query[0]
             else:
@@ -370,8 +400,16 @@ class ResourceService(Service):
         """
         return model
 
-    def get(self, location, params, body):
-        """Exist entry
+    def get(self, location, params, body, stream = None):
+        """Get entry
+        Parameters:
+            stream                              The stream format (FORMAT_JSON or FORMAT_NDJSON), return the chunks of the
+                                                models (See datahub.streaming) which are read, processed and dumped lazily
+        NOTE:
+            If [after] (The continuation token, see datahub.paging) is in the parameters or body (Empty for the first
+            page), a page of models is returned by the keyset pagination: { 'models': models, 'next': token }
+            If [fields] (A comma separated string or a list, see datahub.projection) is in the parameters or body, the
+            models are partially returned with the selected fields only
         """
         id, query = self.popIDFromParamsOrBody(params, body), self.popQueryFromBody(body)
         if id and query:
@@ -399,10 +437,41 @@ class ResourceService(Service):
             size = size1
         # Pop sorts
         sorts = self.popSortsFromBody(body)
+        # Pop the continuation token
+        if 'after' in params and 'after' in body:
+            raise BadRequestError(reason = 'Cannot specify after multiple times')
+        paging = 'after' in params or 'after' in body
+        after = params.pop('after', None) or body.pop('after', None)
         # Pop conditions
         queryFromParams = self.popModelAttributeConditionsFromParams(location, params)
         # Pop configs
         configs = body.pop('configs', None)
+        # Pop fields
+        if 'fields' in params and 'fields' in body:
+            raise BadRequestError(reason = 'Cannot specify fields multiple times')
+        try:
+            fields = loadFields(params.pop('fields', None) or body.pop('fields', None), repo.cls)
+        except InvalidParameterError as error:
+            raise BadRequestError(reason = 'Invalid fields. Error [%s]' % error)
+        if fields:
+            configs = dict(configs or {}, fields = fields)
+        if paging:
+            if isinstance(id, basestring):
+                raise BadRequestError(reason = 'Cannot get a page by a single id')
+            if stream:
+                raise BadRequestError(reason = 'Cannot stream a page')
+            if not repo.support(FEATURE_KEYSET_PAGING):
+                raise BadRequestError(reason = 'Unsupported feature [%s]' % FEATURE_KEYSET_PAGING)
+            configs = dict(configs or {}, after = after)
+        if stream:
+            if isinstance(id, basestring):
+                raise BadRequestError(reason = 'Cannot stream a single id')
+            batchSize = params.pop('batchSize', None) or body.pop('batchSize', None)
+            if batchSize:
+                try:
+                    configs = dict(configs or {}, batchSize = int(batchSize))
+                except ValueError:
+                    raise BadRequestError(reason = 'Invalid batchSize')
         # Check params & body
         if params:
             raise BadRequestError(reason = 'Invalid parameter')
@@ -421,7 +490,7 @@ class ResourceService(Service):
                 if isinstance(id, basestring):
                     query.append(KeyValueCondition(key = '_id', value = id))
                 else:
-                    query.append(KeyValuesCondition(key = '_id', values = id))
+                    query.append(KeyValuesCondition(key = '_id', values = ValueSet.unique(id)))
             if len(query) == 1:
                 query = query[0]
             else:
@@ -433,9 +502,21 @@ class ResourceService(Service):
             if location.features and not FEATURE_STORE_GET in location.features:
                 raise BadRequestError(reason = 'Unsupported feature [%s]' % FEATURE_STORE_GET)
             # Call repository
-            models = self.invoke(location, FEATURE_STORE_GET, repo.get, dict(id = id, configs = configs))
+            if paging or stream:
+                models = self.invoke(location, FEATURE_STORE_GET, repo.get, dict(id = id, sorts = sorts, start = start, size = size, configs = configs))
+            else:
+                models = self.invoke(location, FEATURE_STORE_GET, repo.get, dict(id = id, configs = configs))
         # Return result
-        models = filter(lambda x: x, map(lambda x: self.afterGet(repo, x, configs), models))
+        if stream:
+            return iterStream((x.dump() for x in iterModels(models, lambda x: self.afterGet(repo, x, configs))), stream)
+        if paging:
+            try:
+                tracker = PageTracker(models, sorts or repo.sorts, size)
+                models = list(iterModels(tracker, lambda x: self.afterGet(repo, x, configs)))
+            except InvalidParameterError as error:
+                raise BadRequestError(reason = 'Invalid after. Error [%s]' % error)
+            return { 'models': [ x.dump() for x in models ], 'next': tracker.getNextToken() }
+        models = list(iterModels(models, lambda x: self.afterGet(repo, x, configs)))
         if isinstance(id, basestring):
             # A single result
             if not models:
@@ -448,6 +529,16 @@ class ResourceService(Service):
             # Multiple result
             return [ x.dump() for x in models ]
 
+    def stream(self, location, params, body):
+        """Stream entry as a json array (See get)
+        """
+        return self.get(location, params, body, FORMAT_JSON)
+
+    def streamNDJSON(self, location, params, body):
+        """Stream entry as NDJSON (See get)
+        """
+        return self.get(location, params, body, FORMAT_NDJSON)
+
     def beforeCreate(self, repository, model, configs):
         """Before the create write
         """
@@ -493,6 +584,48 @@ class ResourceService(Service):
             raise BadRequestError(code = ERROR_DUPLICATED_KEY, reason = 'Duplicated key found')
         # Done
 
+    def createMany(self, location, params, body):
+        """Create many entry
+        Returns:
+            The dumped CreateManyResult, the models failed to write are reported in the result instead of an error
+        """
+        # Get repository
+        repo = self.popRepositoryFromParams(params)
+        if not repo:
+            raise NotFoundError(reason = 'Repository not found')
+        # Check feature
+        if location.features and not FEATURE_STORE_CREATE_MANY in location.features:
+            raise BadRequestError(reason = 'Unsupported feature [%s]' % FEATURE_STORE_CREATE_MANY)
+        models, ordered, configs = body.pop('models', None), body.pop('ordered', False), body.pop('configs', None)
+        if not models or not isinstance(models, list):
+            raise BadRequestError(reason = 'Require models')
+        # Get updates
+        updateActions = self.popModelAttributeUpdateActionsFromParams(location, params)
+        # Check params & body
+        if params:
+            raise BadRequestError(reason = 'Invalid parameter')
+        if body:
+            raise BadRequestError(reason = 'Invalid body')
+        # Create the model objects
+        # NOTE: The models are validated by the repository, the invalid ones are reported in the result
+        createModels = []
+        for index, model in enumerate(models):
+            if not isinstance(model, dict):
+                raise BadRequestError(reason = 'Invalid model at [%d]' % index)
+            try:
+                model = repo.cls(model)
+                if updateActions:
+                    model.update(updateActions)
+            except DataModelError as error:
+                raise BadRequestError(reason = 'Invalid model at [%d]. Error [%s]' % (index, error))
+            # Before create write
+            model = self.beforeCreate(repo, model, configs)
+            if not model:
+                raise BadRequestError(reason = 'Create of the model at [%d] is denied' % index)
+            createModels.append(model)
+        # Call repository
+        return self.invoke(location, FEATURE_STORE_CREATE_MANY, repo.createMany, dict(models = createModels, ordered = bool(ordered), configs = configs)).dump()
+
     def beforeReplace(self, repository, model, configs):
         """Before the replace write
         """
@@ -533,11 +666,84 @@ class ResourceService(Service):
             raise BadRequestError(reason = 'No model to replace')
         # Call repository
         try:
-            self.invoke(location, FEATURE_STORE_REPLACE, repo.replace, dict(model = model, configs = configs))
+            if not self.replaceByDiff(location, repo, model, configs):
+                self.invoke(location, FEATURE_STORE_REPLACE, repo.replace, dict(model = model, configs = configs))
         except ModelNotFoundError:
             raise NotFoundError
         # Done
 
+    def replaceByDiff(self, location, repository, model, configs):
+        """Replace the model by updating the differences to the stored model if enabled by the [replaceByDiff] config
+        NOTE: The stored model is read before updating, the concurrent writes between the read and the update may be lost
+        Returns:
+            True if the model is replaced, False if the model should be replaced as a whole
+            ModelNotFoundError is raised if the model is deleted between the read and the update
+        """
+        enabled = self.configs.get('replaceByDiff', False) if self.configs else False
+        if configs and 'replaceByDiff' in configs:
+            enabled = configs['replaceByDiff']
+        if not enabled or not repository.support(FEATURE_STORE_GET) or not repository.support(FEATURE_STORE_UPDATE):
+            return False
+        # Get the stored model
+        storedModel = self.invoke(location, FEATURE_STORE_GET, repository.getOne, dict(id = model.id, configs = configs))
+        if not storedModel:
+            return False
+        # Update the differences
+        updates = diff(storedModel, model, DumpContext(datetime2str = False))
+        if updates and not self.invoke(location, FEATURE_STORE_UPDATE, repository.update, dict(id = model.id, updates = updates, configs = configs)):
+            # Deleted concurrently
+            raise ModelNotFoundError
+        # Done
+        return True
+
+    def bulkWrite(self, location, params, body):
+        """Bulk write entry
+        Returns:
+            The dumped BulkWriteResult, the operations failed to write are reported in the result instead of an error
+        """
+        # Get repository
+        repo = self.popRepositoryFromParams(params)
+        if not repo:
+            raise NotFoundError(reason = 'Repository not found')
+        # Check feature
+        if location.features and not FEATURE_STORE_BULK_WRITE in location.features:
+            raise BadRequestError(reason = 'Unsupported feature [%s]' % FEATURE_STORE_BULK_WRITE)
+        operations, ordered, configs = body.pop('operations', None), body.pop('ordered', False), body.pop('configs', None)
+        if not operations or not isinstance(operations, list):
+            raise BadRequestError(reason = 'Require operations')
+        # Get updates
+        updateActions = self.popModelAttributeUpdateActionsFromParams(location, params)
+        # Check params & body
+        if params:
+            raise BadRequestError(reason = 'Invalid parameter')
+        if body:
+            raise BadRequestError(reason = 'Invalid body')
+        # Load the operations
+        writeOperations = []
+        for index, operation in enumerate(operations):
+            try:
+                operation = WriteOperation.load(operation, repo.cls)
+                if isinstance(operation, (CreateOperation, ReplaceOperation)):
+                    # Apply the location attributes and validate the model
+                    if updateActions:
+                        operation.model.update(updateActions)
+                    operation.model.validate()
+                elif updateActions:
+                    # NOTE: The update and delete operations are written by id which cannot be scoped to the location
+                    raise BadRequestError(reason = 'Cannot update or delete by id in the location at [%d]' % index)
+            except DataHubError as error:
+                raise BadRequestError(reason = 'Invalid operation at [%d]. Error [%s]' % (index, error))
+            # Before write
+            if isinstance(operation, CreateOperation):
+                operation.model = self.beforeCreate(repo, operation.model, configs)
+            elif isinstance(operation, ReplaceOperation):
+                operation.model = self.beforeReplace(repo, operation.model, configs)
+            if isinstance(operation, (CreateOperation, ReplaceOperation)) and not operation.model:
+                raise BadRequestError(reason = 'Write of the operation at [%d] is denied' % index)
+            writeOperations.append(operation)
+        # Call repository
+        return self.invoke(location, FEATURE_STORE_BULK_WRITE, repo.bulkWrite, dict(operations = writeOperations, ordered = bool(ordered), configs = configs)).dump()
+
     def update(self, location, params, body):
         """Update entry
         """
@@ -555,7 +761,7 @@ class ResourceService(Service):
         if not updates:
             raise BadRequestError(reason = 'Require updates')
         try:
-            updates = [ UpdateAction.load(x) for x in updates ]
+            updates = loadUpdateActions(updates)
         except:
             raise BadRequestError(reason = 'Invalid updates')
         # Pop query
@@ -577,7 +783,7 @@ class ResourceService(Service):
                 if isinstance(id, basestring):
                     query.append(KeyValueCondition(key = '_id', value = id))
                 else:
-                    query.append(KeyValuesCondition(key = '_id', values = id))
+                    query.append(KeyValuesCondition(key = '_id', values = ValueSet.unique(id)))
             if len(query) == 1:
                 query = query[0]
             else:
@@ -633,7 +839,7 @@ class ResourceService(Service):
                 if isinstance(id, basestring):
                     query.append(KeyValueCondition(key = '_id', value = id))
                 else:
-                    query.append(KeyValuesCondition(key = '_id', values = id))
+                    query.append(KeyValuesCondition(key = '_id', values = ValueSet.unique(id)))
             if len(query) == 1:
                 query = query[0]
             else:
@@ -687,7 +893,7 @@ class ResourceService(Service):
                 if isinstance(id, basestring):
                     query.append(KeyValueCondition(key = '_id', value = id))
                 else:
-                    query.append(KeyValuesCondition(key = '_id', values = id))
+                    query.append(KeyValuesCondition(key = '_id', values = ValueSet.unique(id)))
             if len(query) == 1:
                 query = query[0]
             else:
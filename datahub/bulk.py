@@ -0,0 +1,358 @@
+# encoding=utf8
+
+""" The bulk write results
+    Author: lipixun
+    Created Time : 六 10/17 22:48:37 2026
+
+    File Name: bulk.py
+    Description:
+
+        The bulk writes report a WriteResult for each model (Or operation) in the request order, so the callers could
+        tell which ones failed and why. In the ordered mode the writes after the first failed one are not executed
+        and reported as skipped.
+
+        The operations of bulkWrite are dumped like the update actions:
+
+        create      Create a model
+        { 'create': { 'model': model, 'overwrite': true / false } }
+
+        replace     Replace a model by id
+        { 'replace': { 'model': model, 'autoCreate': true / false } }
+
+        update      Update a model by id
+        { 'update': { 'id': id, 'updates': [ update action, ... ] } }
+
+        delete      Delete a model by id
+        { 'delete': { 'id': id } }
+
+"""
+
+from spec import *
+from model import DataModel, StringType, IntegerType, AnyType, ListType, ModelType
+from errors import DataHubError, BadValueError, DuplicatedKeyError, ModelNotFoundError, FeatureNotSupportedError
+from updates import UpdateAction
+
+WRITE_STATUS_OK         = 'ok'          # Written
+WRITE_STATUS_ERROR      = 'error'       # Failed
+WRITE_STATUS_SKIPPED    = 'skipped'     # Not executed since a previous write is failed in the ordered mode
+
+class WriteResult(DataModel):
+    """The result of a write
+    """
+    # The index of the model / operation in the request
+    index = IntegerType(required = True)
+    # The model id
+    id = AnyType()
+    # The status
+    status = StringType(required = True, default = WRITE_STATUS_OK, choices = [ WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_SKIPPED ])
+    # The error code (For example: ERROR_DUPLICATED_KEY)
+    code = IntegerType()
+    # The error reason
+    reason = StringType()
+
+    def isOK(self):
+        """Tell if the write is succeeded
+        """
+        return self.status == WRITE_STATUS_OK
+
+    def getError(self):
+        """Get the error of the failed write
+        Returns:
+            The DataHubError object (DuplicatedKeyError if the code is ERROR_DUPLICATED_KEY) or None if not failed
+        """
+        if self.status != WRITE_STATUS_ERROR:
+            return
+        if self.code == ERROR_DUPLICATED_KEY:
+            return DuplicatedKeyError(self.reason, self.id)
+        return DataHubError(self.reason)
+
+class BulkResult(DataModel):
+    """The base result of the bulk writes
+    """
+    # The results of the models / operations in the request order
+    results = ListType(ModelType(WriteResult), required = True, default = lambda: [])
+
+    def isOK(self):
+        """Tell if all models are created
+        """
+        return all(x.isOK() for x in self.results)
+
+    def getErrors(self):
+        """Get the errors
+        Returns:
+            A list of (index, DataHubError)
+        """
+        return [ (x.index, x.getError()) for x in self.results if x.status == WRITE_STATUS_ERROR ]
+
+class CreateManyResult(BulkResult):
+    """The result of createMany
+    """
+    # The count of the created models
+    created = IntegerType(required = True, default = 0)
+
+class BulkWriteResult(BulkResult):
+    """The result of bulkWrite
+    """
+    # The count of the inserted models
+    inserted = IntegerType(required = True, default = 0)
+    # The count of the models matched by the replaces and updates
+    matched = IntegerType(required = True, default = 0)
+    # The count of the models modified by the replaces and updates
+    modified = IntegerType(required = True, default = 0)
+    # The count of the models upserted by the creates (With overwrite) and replaces (With autoCreate)
+    upserted = IntegerType(required = True, default = 0)
+    # The count of the deleted models
+    deleted = IntegerType(required = True, default = 0)
+
+class WriteOperation(object):
+    """The write operation of bulkWrite
+    """
+    NAME = None
+
+    def getID(self):
+        """Get the id of the model which is written
+        """
+        raise NotImplementedError
+
+    def dumpArgs(self):
+        """Dump the arguments
+        Returns:
+            A dict
+        """
+        raise NotImplementedError
+
+    def dump(self):
+        """Dump this operation
+        """
+        return { self.NAME: self.dumpArgs() }
+
+    @classmethod
+    def loadArgs(cls, args, modelCls):
+        """Load the operation from the arguments
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, raw, modelCls):
+        """Load the operation
+        Parameters:
+            raw                             The dumped operation
+            modelCls                        The data model class
+        Returns:
+            The WriteOperation object
+        """
+        if not isinstance(raw, dict) or len(raw) != 1:
+            raise BadValueError('Write operation dict must have only one key and value')
+        k, v = raw.keys()[0], raw.values()[0]
+        if not k in OPERATIONS:
+            raise BadValueError('Write operation [%s] not found' % k)
+        if not isinstance(v, dict):
+            raise BadValueError('Invalid arguments of write operation [%s]' % k)
+        return OPERATIONS[k].loadArgs(v, modelCls)
+
+class CreateOperation(WriteOperation):
+    """Create a model
+    """
+    NAME = 'create'
+
+    def __init__(self, model, overwrite = False):
+        """Create a new CreateOperation
+        """
+        self.model = model
+        self.overwrite = overwrite
+
+    def getID(self):
+        """Get the id of the model which is written
+        """
+        return self.model.id
+
+    def dumpArgs(self):
+        """Dump the arguments
+        """
+        return { 'model': self.model.dump(), 'overwrite': self.overwrite }
+
+    @classmethod
+    def loadArgs(cls, args, modelCls):
+        """Load the operation from the arguments
+        """
+        if not args.get('model'):
+            raise BadValueError('Require model')
+        return cls(modelCls.load(args['model']), bool(args.get('overwrite')))
+
+class ReplaceOperation(WriteOperation):
+    """Replace a model by id
+    """
+    NAME = 'replace'
+
+    def __init__(self, model, autoCreate = False):
+        """Create a new ReplaceOperation
+        """
+        self.model = model
+        self.autoCreate = autoCreate
+
+    def getID(self):
+        """Get the id of the model which is written
+        """
+        return self.model.id
+
+    def dumpArgs(self):
+        """Dump the arguments
+        """
+        return { 'model': self.model.dump(), 'autoCreate': self.autoCreate }
+
+    @classmethod
+    def loadArgs(cls, args, modelCls):
+        """Load the operation from the arguments
+        """
+        if not args.get('model'):
+            raise BadValueError('Require model')
+        return cls(modelCls.load(args['model']), bool(args.get('autoCreate')))
+
+class UpdateOperation(WriteOperation):
+    """Update a model by id
+    """
+    NAME = 'update'
+
+    def __init__(self, id, updates):
+        """Create a new UpdateOperation
+        """
+        self.id = id
+        self.updates = updates
+
+    def getID(self):
+        """Get the id of the model which is written
+        """
+        return self.id
+
+    def dumpArgs(self):
+        """Dump the arguments
+        """
+        return { 'id': self.id, 'updates': [ x.dump() for x in self.updates ] }
+
+    @classmethod
+    def loadArgs(cls, args, modelCls):
+        """Load the operation from the arguments
+        """
+        if args.get('id') is None:
+            raise BadValueError('Require id')
+        if not args.get('updates'):
+            raise BadValueError('Require updates')
+        return cls(args['id'], [ UpdateAction.load(x) for x in args['updates'] ])
+
+class DeleteOperation(WriteOperation):
+    """Delete a model by id
+    """
+    NAME = 'delete'
+
+    def __init__(self, id):
+        """Create a new DeleteOperation
+        """
+        self.id = id
+
+    def getID(self):
+        """Get the id of the model which is written
+        """
+        return self.id
+
+    def dumpArgs(self):
+        """Dump the arguments
+        """
+        return { 'id': self.id }
+
+    @classmethod
+    def loadArgs(cls, args, modelCls):
+        """Load the operation from the arguments
+        """
+        if args.get('id') is None:
+            raise BadValueError('Require id')
+        return cls(args['id'])
+
+OPERATIONS = {
+    'create':       CreateOperation,
+    'replace':      ReplaceOperation,
+    'update':       UpdateOperation,
+    'delete':       DeleteOperation,
+}
+
+def createOneByOne(create, models, ordered = False):
+    """Create the models one by one (For the backends which do not support bulk writes)
+    Parameters:
+        create                              The method: (model) which creates a model
+        models                              The models to create
+        ordered                             Stop at the first failed model
+    Returns:
+        The CreateManyResult object
+    """
+    result, failed = CreateManyResult(), False
+    for index, model in enumerate(models):
+        if failed:
+            result.results.append(WriteResult(index = index, id = model.id, status = WRITE_STATUS_SKIPPED))
+            continue
+        try:
+            create(model)
+        except FeatureNotSupportedError:
+            raise
+        except DuplicatedKeyError as error:
+            result.results.append(WriteResult(index = index, id = model.id, status = WRITE_STATUS_ERROR, code = ERROR_DUPLICATED_KEY, reason = error.message))
+            failed = ordered
+        except DataHubError as error:
+            result.results.append(WriteResult(index = index, id = model.id, status = WRITE_STATUS_ERROR, reason = str(error)))
+            failed = ordered
+        else:
+            result.results.append(WriteResult(index = index, id = model.id))
+            result.created += 1
+    # Done
+    return result
+
+def writeOneByOne(operations, ordered, create, replace, update, delete):
+    """Write the operations one by one (For the backends which do not support bulk writes)
+    Parameters:
+        operations                          The WriteOperation objects
+        ordered                             Stop at the first failed operation
+        create                              The method: (model, overwrite) which creates a model
+        replace                             The method: (model, autoCreate) which replaces a model
+        update                              The method: (id, updates) returns the count of the matched models
+        delete                              The method: (id) returns the count of the deleted models
+    Returns:
+        The BulkWriteResult object
+    NOTE:
+        Like mongodb bulk writes, the replaces and updates of the models which are not found are not errors, they're
+        only not counted in the matched count
+    """
+    result, failed = BulkWriteResult(), False
+    for index, operation in enumerate(operations):
+        writeResult = WriteResult(index = index, id = operation.getID())
+        result.results.append(writeResult)
+        if failed:
+            writeResult.status = WRITE_STATUS_SKIPPED
+            continue
+        try:
+            if isinstance(operation, CreateOperation):
+                create(operation.model, operation.overwrite)
+                result.inserted += 1
+            elif isinstance(operation, ReplaceOperation):
+                try:
+                    replace(operation.model, operation.autoCreate)
+                except ModelNotFoundError:
+                    pass
+                else:
+                    result.matched += 1
+                    result.modified += 1
+            elif isinstance(operation, UpdateOperation):
+                count = update(operation.id, operation.updates)
+                result.matched += count
+                result.modified += count
+            elif isinstance(operation, DeleteOperation):
+                result.deleted += delete(operation.id)
+            else:
+                raise TypeError('Unknown write operation type [%s]' % type(operation).__name__)
+        except FeatureNotSupportedError:
+            raise
+        except DuplicatedKeyError as error:
+            writeResult.status, writeResult.code, writeResult.reason = WRITE_STATUS_ERROR, ERROR_DUPLICATED_KEY, error.message
+            failed = ordered
+        except DataHubError as error:
+            writeResult.status, writeResult.reason = WRITE_STATUS_ERROR, str(error)
+            failed = ordered
+    # Done
+    return result
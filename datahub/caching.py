@@ -0,0 +1,559 @@
+# encoding=utf8
+
+""" The read-through caching of the models
+    Author: lipixun
+    Created Time : 日 10/18 02:51:26 2026
+
+    File Name: caching.py
+    Description:
+
+        The CachingRepository (And the CachingDataService) wraps a repository (Or a data service) and caches the models
+        read by id in a bounded LRU cache with ttl. The not found ids are cached as well. The cached entries are
+        invalidated by the writes which go through the wrapper, the writes by query clear the whole cache since the
+        written ids are unknown.
+
+        NOTE: The writes which do not go through the wrapper (For example, by another process) are seen after the ttl
+
+        The cached models are shared:
+
+            - By default a cached model is cloned before it's returned, so the callers could change it
+            - In the frozen mode the cached models are frozen (See DataModel.freeze) and returned as they are, which
+              saves the clones on the hot paths but the callers must clone a model before changing it
+
+        Only the plain reads are cached, the reads with configs (Or ctx) are passed through to the underlying.
+
+        A read which runs concurrently with a write of the same id may return the model before the write, such a
+        model is not cached: the version (The generation of the id and the epoch of the cache) is taken when the read
+        starts and the read model is cached only if the id is not invalidated (Or the cache is not cleared) since then.
+
+"""
+
+import threading
+
+from contextlib import contextmanager
+
+from datahub.utils import LRUCache
+from datahub.sorts import sortModels
+from datahub.repository import Repository
+from datahub.dataservice.interface import DataServiceInterface
+
+# The default max count of the cached ids
+DEFAULT_CACHE_SIZE = 10000
+# The default seconds a model is cached for
+DEFAULT_CACHE_TTL = 60
+
+class CacheMark(object):
+    """The mark of the cached state of an id which is not a model
+    """
+    def __init__(self, name):
+        """Create a new CacheMark
+        """
+        self.name = name
+
+    def __repr__(self):
+        """Repr
+        """
+        return '<cache %s>' % self.name
+
+# The model is not found
+NOT_FOUND = CacheMark('not found')
+# The model exists but is not loaded
+EXISTS = CacheMark('exists')
+
+class ModelCache(object):
+    """The cache of the models by id
+    Attributes:
+        cache                               The LRUCache object
+        frozen                              Cache and return the frozen models
+        epoch                               Increased when the cache is cleared
+        reads                               The [count of the in-flight reads, generation] by the id being read, the
+                                            generation is increased when the id is invalidated
+    """
+    def __init__(self, size = DEFAULT_CACHE_SIZE, ttl = DEFAULT_CACHE_TTL, frozen = False):
+        """Create a new ModelCache
+        """
+        self.cache = LRUCache(size, ttl)
+        self.frozen = frozen
+        self.epoch = 0
+        self.reads = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def reading(self, ids):
+        """The context of the reads of the ids from the underlying
+        Returns:
+            The versions (A dict) of the ids, which are passed to setModel / setExist
+        """
+        versions = {}
+        with self.lock:
+            for id in ids:
+                read = self.reads.setdefault(id, [ 0, 0 ])
+                read[0] += 1
+                versions[id] = (self.epoch, read[1])
+        try:
+            yield versions
+        finally:
+            with self.lock:
+                for id in ids:
+                    read = self.reads[id]
+                    read[0] -= 1
+                    if not read[0]:
+                        del self.reads[id]
+
+    def isCurrent(self, id, version):
+        """Check if the id is not invalidated since the version is taken (Called with the lock)
+        """
+        read = self.reads.get(id)
+        return not read is None and version == (self.epoch, read[1])
+
+    def get(self, id):
+        """Get the cached state of id
+        Returns:
+            The model object, NOT_FOUND, EXISTS or None if not cached
+        """
+        value = self.cache.get(id)
+        if value is None or isinstance(value, CacheMark) or self.frozen:
+            return value
+        return value.clone()
+
+    def setModel(self, id, model, version):
+        """Cache the model read with the version
+        Returns:
+            The model to return to the caller
+        """
+        if model is None:
+            value = NOT_FOUND
+        elif self.frozen:
+            value = model.freeze()
+        else:
+            value = model.clone()
+        with self.lock:
+            if self.isCurrent(id, version):
+                self.cache.set(id, value)
+        return model
+
+    def setExist(self, id, exists, version):
+        """Cache the existence of id read with the version
+        """
+        with self.lock:
+            if self.isCurrent(id, version):
+                self.cache.set(id, EXISTS if exists else NOT_FOUND)
+
+    def invalidate(self, id):
+        """Invalidate the id or a list / tuple of ids
+        """
+        with self.lock:
+            for x in id if isinstance(id, (list, tuple)) else ([ id ] if not id is None else []):
+                read = self.reads.get(x)
+                if read:
+                    read[1] += 1
+                self.cache.delete(x)
+
+    def clear(self):
+        """Clear the cache
+        """
+        with self.lock:
+            self.epoch += 1
+            self.cache.clear()
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return self.cache.getStats()
+
+    def resetStats(self):
+        """Reset the statistics
+        """
+        self.cache.resetStats()
+
+def orderByIDs(ids, models):
+    """Order the models in the order of the ids (The duplicated ids are returned once)
+    Parameters:
+        ids                                 A list of ids
+        models                              The models by id
+    Returns:
+        A list of models
+    """
+    ordered, seen = [], set()
+    for id in ids:
+        if id in models and not id in seen:
+            seen.add(id)
+            ordered.append(models[id])
+    return ordered
+
+def getWrittenIDs(operations):
+    """Get the ids written by the operations of bulkWrite
+    Returns:
+        A list of ids
+    """
+    return [ x.getID() for x in operations ]
+
+class CachingRepository(Repository):
+    """The read-through caching repository
+    Attributes:
+        repository                          The underlying repository
+        cache                               The ModelCache object
+    """
+    def __init__(self, repository, size = DEFAULT_CACHE_SIZE, ttl = DEFAULT_CACHE_TTL, frozen = False):
+        """Create a new CachingRepository
+        Parameters:
+            repository                      The underlying Repository object
+            size                            The max count of the cached ids
+            ttl                             The seconds a model is cached for, None means never expire
+            frozen                          Return the frozen cached models without clone
+        """
+        super(CachingRepository, self).__init__(repository.cls, repository.sorts)
+        self.repository = repository
+        self.cache = ModelCache(size, ttl, frozen)
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return self.cache.getStats()
+
+    def exist(self, id = None, configs = None):
+        """Exist
+        """
+        if configs or id is None or isinstance(id, (list, tuple)):
+            return self.repository.exist(id, configs)
+        value = self.cache.get(id)
+        if not value is None:
+            return value is not NOT_FOUND
+        with self.cache.reading([ id ]) as versions:
+            exists = self.repository.exist(id)
+            self.cache.setExist(id, exists, versions[id])
+        return exists
+
+    def existByQuery(self, query, configs = None):
+        """Exist by query
+        """
+        return self.repository.existByQuery(query, configs)
+
+    def getOne(self, id, configs = None):
+        """Get one by id
+        """
+        if configs:
+            return self.repository.getOne(id, configs)
+        value = self.cache.get(id)
+        if value is NOT_FOUND:
+            return
+        elif not value is None and not value is EXISTS:
+            return value
+        with self.cache.reading([ id ]) as versions:
+            return self.cache.setModel(id, self.repository.getOne(id), versions[id])
+
+    def get(self, id = None, start = 0, size = 0, sorts = None, configs = None):
+        """Get
+        """
+        if configs or id is None or (isinstance(id, (list, tuple)) and (start or size or sorts)):
+            return self.repository.get(id, start, size, sorts, configs)
+        if not isinstance(id, (list, tuple)):
+            model = self.getOne(id)
+            return [ model ] if model else []
+        # Get the cached ones and read the others
+        models, ids = {}, []
+        for x in id:
+            value = self.cache.get(x)
+            if value is None or value is EXISTS:
+                ids.append(x)
+            elif not value is NOT_FOUND:
+                models[x] = value
+        if ids:
+            with self.cache.reading(ids) as versions:
+                for model in self.repository.get(ids):
+                    models[model.id] = self.cache.setModel(model.id, model, versions.get(model.id))
+                for x in ids:
+                    if not x in models:
+                        self.cache.setModel(x, None, versions[x])
+        # Return in the order of the underlying: the default sorts of the repository or the ids
+        models = orderByIDs(id, models)
+        return sortModels(models, self.sorts) if self.sorts else models
+
+    def getByQuery(self, query, sorts = None, start = 0, size = 0, configs = None):
+        """Gets by query
+        """
+        return self.repository.getByQuery(query, sorts, start, size, configs)
+
+    def create(self, model, configs = None):
+        """Create a new model
+        """
+        try:
+            return self.repository.create(model, configs)
+        finally:
+            self.cache.invalidate(model.id)
+
+    def createMany(self, models, ordered = False, configs = None):
+        """Create a couple of models
+        """
+        try:
+            return self.repository.createMany(models, ordered, configs)
+        finally:
+            self.cache.invalidate([ x.id for x in models ])
+
+    def replace(self, model, configs = None):
+        """Replace a model by id
+        """
+        try:
+            return self.repository.replace(model, configs)
+        finally:
+            self.cache.invalidate(model.id)
+
+    def update(self, id, updates, configs = None):
+        """Update model
+        """
+        try:
+            return self.repository.update(id, updates, configs)
+        finally:
+            self.cache.invalidate(id)
+
+    def bulkWrite(self, operations, ordered = False, configs = None):
+        """Write a couple of operations
+        """
+        try:
+            return self.repository.bulkWrite(operations, ordered, configs)
+        finally:
+            self.cache.invalidate(getWrittenIDs(operations))
+
+    def updatesByQuery(self, query, updates, configs = None):
+        """Update a couple of models by query
+        """
+        try:
+            return self.repository.updatesByQuery(query, updates, configs)
+        finally:
+            self.cache.clear()
+
+    def updateByQuery(self, query, updates, configs = None):
+        """Update a couple of models by query (The name used by the mongodb repository)
+        """
+        try:
+            return self.repository.updateByQuery(query, updates, configs)
+        finally:
+            self.cache.clear()
+
+    def delete(self, id, configs = None):
+        """Delete model
+        """
+        try:
+            return self.repository.delete(id, configs)
+        finally:
+            self.cache.invalidate(id)
+
+    def deleteByQuery(self, query, configs = None):
+        """Delete a couple of models by query
+        """
+        try:
+            return self.repository.deleteByQuery(query, configs)
+        finally:
+            self.cache.clear()
+
+    def count(self, id = None, configs = None):
+        """Count models
+        """
+        return self.repository.count(id, configs)
+
+    def countByQuery(self, query, configs = None):
+        """Count the model numbers by condition
+        """
+        return self.repository.countByQuery(query, configs)
+
+    def watch(self, query = None, configs = None):
+        """Watch the models
+        """
+        return self.repository.watch(query, configs)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return self.repository.support(name)
+
+class CachingDataService(DataServiceInterface):
+    """The read-through caching data service
+    Attributes:
+        underlying                          The underlying data service
+        cache                               The ModelCache object
+    """
+    def __init__(self, underlying, size = DEFAULT_CACHE_SIZE, ttl = DEFAULT_CACHE_TTL, frozen = False):
+        """Create a new CachingDataService
+        Parameters:
+            underlying                      The underlying DataServiceInterface object
+            size                            The max count of the cached ids
+            ttl                             The seconds a model is cached for, None means never expire
+            frozen                          Return the frozen cached models without clone
+        """
+        self.underlying = underlying
+        self.cache = ModelCache(size, ttl, frozen)
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return self.cache.getStats()
+
+    def invalidate(self, ids):
+        """Invalidate the ids, the whole cache is cleared if ids is None (All models are written)
+        """
+        if ids is None:
+            self.cache.clear()
+        else:
+            self.cache.invalidate(ids)
+
+    def exist(self, id, **ctx):
+        """Check if a model with id exists
+        """
+        if ctx:
+            return self.underlying.exist(id, **ctx)
+        value = self.cache.get(id)
+        if not value is None:
+            return value is not NOT_FOUND
+        with self.cache.reading([ id ]) as versions:
+            exists = self.underlying.exist(id)
+            self.cache.setExist(id, exists, versions[id])
+        return exists
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        if ctx:
+            return self.underlying.getOne(id, **ctx)
+        value = self.cache.get(id)
+        if value is NOT_FOUND:
+            return
+        elif not value is None and not value is EXISTS:
+            return value
+        with self.cache.reading([ id ]) as versions:
+            return self.cache.setModel(id, self.underlying.getOne(id), versions[id])
+
+    def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models
+        """
+        if ctx or not isinstance(ids, (list, tuple)) or start or size or sorts:
+            return self.underlying.gets(ids, start, size, sorts, **ctx)
+        # Get the cached ones and read the others
+        models, missing = {}, []
+        for id in ids:
+            value = self.cache.get(id)
+            if value is None or value is EXISTS:
+                missing.append(id)
+            elif not value is NOT_FOUND:
+                models[id] = value
+        if missing:
+            with self.cache.reading(missing) as versions:
+                for model in self.underlying.gets(missing) or []:
+                    models[model.id] = self.cache.setModel(model.id, model, versions.get(model.id))
+                for id in missing:
+                    if not id in models:
+                        self.cache.setModel(id, None, versions[id])
+        return orderByIDs(ids, models)
+
+    def getByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query
+        """
+        return self.underlying.getByQuery(query, start, size, sorts, **ctx)
+
+    def create(self, model, overwrite = False, **ctx):
+        """Create a model
+        """
+        try:
+            return self.underlying.create(model, overwrite, **ctx)
+        finally:
+            self.cache.invalidate(model.id)
+
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        """
+        try:
+            return self.underlying.createMany(models, ordered, overwrite, **ctx)
+        finally:
+            self.cache.invalidate([ x.id for x in models ])
+
+    def replace(self, model, autoCreate = False, **ctx):
+        """Replace a model
+        """
+        try:
+            return self.underlying.replace(model, autoCreate, **ctx)
+        finally:
+            self.cache.invalidate(model.id)
+
+    def save(self, model, **ctx):
+        """Save a model
+        """
+        try:
+            return self.underlying.save(model, **ctx)
+        finally:
+            self.cache.invalidate(model.id)
+
+    def updateOne(self, id, updates, **ctx):
+        """Update a model
+        """
+        try:
+            return self.underlying.updateOne(id, updates, **ctx)
+        finally:
+            self.cache.invalidate(id)
+
+    def updates(self, ids, updates, **ctx):
+        """Update models
+        """
+        try:
+            return self.underlying.updates(ids, updates, **ctx)
+        finally:
+            self.invalidate(ids)
+
+    def updateByQuery(self, query, updates, **ctx):
+        """Update by query
+        """
+        try:
+            return self.underlying.updateByQuery(query, updates, **ctx)
+        finally:
+            self.cache.clear()
+
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        """
+        try:
+            return self.underlying.bulkWrite(operations, ordered, **ctx)
+        finally:
+            self.cache.invalidate(getWrittenIDs(operations))
+
+    def deleteOne(self, id, **ctx):
+        """Delete a model
+        """
+        try:
+            return self.underlying.deleteOne(id, **ctx)
+        finally:
+            self.cache.invalidate(id)
+
+    def deletes(self, ids, **ctx):
+        """Delete models
+        """
+        try:
+            return self.underlying.deletes(ids, **ctx)
+        finally:
+            self.invalidate(ids)
+
+    def deleteByQuery(self, query, **ctx):
+        """Delete by query
+        """
+        try:
+            return self.underlying.deleteByQuery(query, **ctx)
+        finally:
+            self.cache.clear()
+
+    def counts(self, ids, **ctx):
+        """Count by ids
+        """
+        return self.underlying.counts(ids, **ctx)
+
+    def countByQuery(self, query, **ctx):
+        """Count by query
+        """
+        return self.underlying.countByQuery(query, **ctx)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return self.underlying.support(name)
@@ -10,8 +10,21 @@
 """
 
 from datahub.model import nullValue, DataModel, DataType, StringType, BooleanType, ListType, ModelType, AnyType
+from datahub.model._canonical import canonicalValue
+from datahub.model._frozen import FrozenList
+from datahub.model._query import QueryPath
 from datahub.errors import BadValueError
 
+def alwaysTrue(model):
+    """The predicate which is always true
+    """
+    return True
+
+def alwaysFalse(model):
+    """The predicate which is always false
+    """
+    return False
+
 class ConditionType(ModelType):
     """The condition data type
     NOTE:
@@ -32,6 +45,57 @@ class Condition(DataModel):
         """
         raise NotImplementedError
 
+    def compile(self, modelCls):
+        """Compile this condition to a predicate of the models of the class
+        NOTE:
+            The predicate is built from the current values of the condition, it won't be changed when the condition is changed
+        Parameters:
+            modelCls                        The data model class
+        Returns:
+            The method: (model) returns True / False
+        """
+        predicate, check = self.normalize(modelCls).__compile__(modelCls), self.check
+        def compiled(model):
+            """Check if the model satisfy the condition
+            """
+            if type(model) is modelCls:
+                return predicate(model)
+            # Not the class which the condition is compiled for
+            return check(model)
+        return compiled
+
+    def __compile__(self, modelCls):
+        """Compile this condition to a predicate of the models of the class (Without the model class check)
+        """
+        return self.check
+
+    def normalize(self, modelCls = None):
+        """Get the normalized condition (See datahub.normalize)
+        Parameters:
+            modelCls                        The data model class which the condition is applied to, optional
+        Returns:
+            The normalized Condition object
+        """
+        from datahub.normalize import normalize
+        return normalize(self, modelCls)
+
+    def isAlwaysTrue(self):
+        """Tell if the condition is always true
+        """
+        return False
+
+    def isAlwaysFalse(self):
+        """Tell if the condition is always false
+        """
+        return False
+
+    def getQuery(self, modelCls, key):
+        """Get the compiled query method of the key
+        Returns:
+            The method: (model) returns a list of values
+        """
+        return QueryPath.get(modelCls, key).getter
+
     def dump(self, context = None):
         """Dump this condition
         """
@@ -65,6 +129,36 @@ class AndCondition(Condition):
                 return False
         return True
 
+    def isAlwaysTrue(self):
+        """Tell if the condition is always true
+        """
+        return not self.conditions
+
+    def canonical(self):
+        """Get the canonical form of this condition (The sub conditions are sorted and deduplicated)
+        """
+        return (type(self).__name__, tuple(sorted(set(x.canonical() for x in self.conditions or ()))))
+
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        predicates = [ x.__compile__(modelCls) for x in self.conditions ]
+        if not predicates:
+            return alwaysTrue
+        elif len(predicates) == 1:
+            return predicates[0]
+        elif len(predicates) == 2:
+            p1, p2 = predicates
+            return lambda model: p1(model) and p2(model)
+        def predicate(model):
+            """Check the conditions
+            """
+            for p in predicates:
+                if not p(model):
+                    return False
+            return True
+        return predicate
+
 class OrCondition(Condition):
     """Or condition
     """
@@ -82,6 +176,36 @@ class OrCondition(Condition):
                 return True
         return False
 
+    def isAlwaysFalse(self):
+        """Tell if the condition is always false
+        """
+        return not self.conditions
+
+    def canonical(self):
+        """Get the canonical form of this condition (The sub conditions are sorted and deduplicated)
+        """
+        return (type(self).__name__, tuple(sorted(set(x.canonical() for x in self.conditions or ()))))
+
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        predicates = [ x.__compile__(modelCls) for x in self.conditions ]
+        if not predicates:
+            return alwaysFalse
+        elif len(predicates) == 1:
+            return predicates[0]
+        elif len(predicates) == 2:
+            p1, p2 = predicates
+            return lambda model: p1(model) or p2(model)
+        def predicate(model):
+            """Check the conditions
+            """
+            for p in predicates:
+                if p(model):
+                    return True
+            return False
+        return predicate
+
 class NotCondition(Condition):
     """Create a not condition
     """
@@ -96,6 +220,12 @@ class NotCondition(Condition):
         """
         return not self.condition.check(model)
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        p = self.condition.__compile__(modelCls)
+        return lambda model: not p(model)
+
 class KeyValueCondition(Condition):
     """The key value condition
     """
@@ -130,13 +260,150 @@ class KeyValueCondition(Condition):
             # Done
         return False
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        query, value = self.getQuery(modelCls, self.key), self.value
+        if self.equals:
+            def predicate(model):
+                """Check if any value equals
+                """
+                for v in query(model):
+                    if v == value:
+                        return True
+                return False
+        else:
+            def predicate(model):
+                """Check if any value not equals or no value
+                """
+                values = query(model)
+                if not values:
+                    return True
+                for v in values:
+                    if v != value:
+                        return True
+                return False
+        return predicate
+
+class ValueSet(object):
+    """The set of values for membership test
+    The hashable values are checked by hash, the unhashable values (Such as dict and list) are compared one by one
+    Attributes:
+        hashables                           The set of the hashable values
+        unhashables                         The list of the unhashable values
+    """
+    __slots__ = ('hashables', 'unhashables')
+
+    def __init__(self, values):
+        """Create a new ValueSet
+        """
+        self.hashables, self.unhashables = set(), []
+        for value in values:
+            try:
+                self.hashables.add(value)
+            except TypeError:
+                self.unhashables.append(value)
+
+    def __contains__(self, value):
+        """Check if the value is in the set
+        """
+        try:
+            if value in self.hashables:
+                return True
+        except TypeError:
+            # Unhashable value
+            pass
+        return len(self.unhashables) > 0 and value in self.unhashables
+
+    def __len__(self):
+        """Get the count of the values
+        """
+        return len(self.hashables) + len(self.unhashables)
+
+    @classmethod
+    def unique(cls, values):
+        """Remove the duplicated values and keep the order
+        Returns:
+            A list of values
+        """
+        uniqueValues, valueSet = [], cls(())
+        for value in values:
+            if not value in valueSet:
+                try:
+                    valueSet.hashables.add(value)
+                except TypeError:
+                    valueSet.unhashables.append(value)
+                uniqueValues.append(value)
+        return uniqueValues
+
+def changeValues(method):
+    """Wrap the list method which changes the values, the value set is rebuilt when checked after the change
+    """
+    def change(self, *args, **kwargs):
+        """Change the values
+        """
+        result = method(self, *args, **kwargs)
+        self.valueSet = None
+        return result
+    return change
+
+class ValueList(list):
+    """The list of values which keeps the ValueSet of the values
+    The set is built when the list is created, and rebuilt when checked after the list is changed (In place)
+    Attributes:
+        valueSet                            The ValueSet object, None if the list is changed
+    """
+    __slots__ = ('valueSet', )
+
+    def __init__(self, values = ()):
+        """Create a new ValueList
+        """
+        super(ValueList, self).__init__(values)
+        self.valueSet = ValueSet(self)
+
+    __setitem__ = changeValues(list.__setitem__)
+    __delitem__ = changeValues(list.__delitem__)
+    __setslice__ = changeValues(list.__setslice__)
+    __delslice__ = changeValues(list.__delslice__)
+    __iadd__ = changeValues(list.__iadd__)
+    __imul__ = changeValues(list.__imul__)
+    append = changeValues(list.append)
+    extend = changeValues(list.extend)
+    insert = changeValues(list.insert)
+    pop = changeValues(list.pop)
+    remove = changeValues(list.remove)
+
+    def getValueSet(self):
+        """Get the ValueSet of the values
+        """
+        valueSet = self.valueSet
+        if valueSet is None:
+            valueSet = self.valueSet = ValueSet(self)
+        return valueSet
+
+    def __reduce__(self):
+        """Pickle (And copy) as a new ValueList
+        """
+        return (ValueList, (list(self), ))
+
+def loadValueList(t, value, model, container):
+    """Load the list of values as a ValueList
+    """
+    values = t.__loadvalue__(value, model, container)
+    if values is None:
+        return values
+    return ValueList(values)
+
 class KeyValuesCondition(Condition):
     """The key values condition
+    NOTE:
+        The values are hashed when checking (See getValueSet), the values are loaded as a ValueList which builds the
+        hashed set when the condition is created or the values are set, and rebuilds it after the values are changed
     """
     NAME = 'kvs'
 
     key = StringType(required = True)
-    values = ListType(AnyType(), required = True)
+    values = ListType(AnyType(), required = True, loader = loadValueList)
     includes = BooleanType(required = True, default = True)
 
     def check(self, model):
@@ -144,10 +411,11 @@ class KeyValuesCondition(Condition):
         Returns:
             True / False
         """
+        values = self.getValueSet()
         if self.includes:
             # Includes
             for v in model.query(self.key):
-                if v in self.values:
+                if v in values:
                     return True
             # Done
         else:
@@ -156,7 +424,7 @@ class KeyValuesCondition(Condition):
             #   - Field not exists
             hasValue = False
             for v in model.query(self.key):
-                if not v in self.values:
+                if not v in values:
                     return True
                 hasValue = True
             if not hasValue:
@@ -164,6 +432,57 @@ class KeyValuesCondition(Condition):
             # Done
         return False
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        query, values = self.getQuery(modelCls, self.key), ValueSet(self.values)
+        if self.includes:
+            def predicate(model):
+                """Check if any value is included
+                """
+                for v in query(model):
+                    if v in values:
+                        return True
+                return False
+        else:
+            def predicate(model):
+                """Check if any value is not included or no value
+                """
+                vs = query(model)
+                if not vs:
+                    return True
+                for v in vs:
+                    if not v in values:
+                        return True
+                return False
+        return predicate
+
+    def canonical(self):
+        """Get the canonical form of this condition (The values are sorted and deduplicated)
+        """
+        return (type(self).__name__, (
+            ('includes', canonicalValue(self.includes)),
+            ('key', canonicalValue(self.key)),
+            ('values', tuple(sorted(set(canonicalValue(x) for x in self.values or ())))),
+            ))
+
+    def getValueSet(self):
+        """Get the hashed set of the values
+        Returns:
+            The ValueSet object
+        """
+        values = self.values
+        if isinstance(values, ValueList):
+            return values.getValueSet()
+        elif isinstance(values, FrozenList):
+            # The values of the frozen condition cannot be changed, build the set once
+            cached = self.__dict__.get('_valueSet')
+            if cached is None or not cached[0] is values:
+                cached = (values, ValueSet(values))
+                self.__dict__['_valueSet'] = cached
+            return cached[1]
+        return ValueSet(values or [])
+
 class ExistCondition(Condition):
     """The exist condition
     """
@@ -181,6 +500,12 @@ class ExistCondition(Condition):
         # Done
         return False
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        query = self.getQuery(modelCls, self.key)
+        return lambda model: len(query(model)) > 0
+
 class NonExistCondition(Condition):
     """The non-exist condition
     """
@@ -198,6 +523,12 @@ class NonExistCondition(Condition):
         # Done
         return True
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        query = self.getQuery(modelCls, self.key)
+        return lambda model: len(query(model)) == 0
+
 class GreaterCondition(Condition):
     """The greater condition
     """
@@ -222,6 +553,28 @@ class GreaterCondition(Condition):
         # Done
         return False
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        query, value = self.getQuery(modelCls, self.key), self.value
+        if self.equals:
+            def predicate(model):
+                """Check if any value is greater than or equals to the value
+                """
+                for v in query(model):
+                    if v >= value:
+                        return True
+                return False
+        else:
+            def predicate(model):
+                """Check if any value is greater than the value
+                """
+                for v in query(model):
+                    if v > value:
+                        return True
+                return False
+        return predicate
+
 class LesserCondition(Condition):
     """The lesser condition
     """
@@ -246,6 +599,28 @@ class LesserCondition(Condition):
         # Done
         return False
 
+    def __compile__(self, modelCls):
+        """Compile this condition
+        """
+        query, value = self.getQuery(modelCls, self.key), self.value
+        if self.equals:
+            def predicate(model):
+                """Check if any value is lesser than or equals to the value
+                """
+                for v in query(model):
+                    if v <= value:
+                        return True
+                return False
+        else:
+            def predicate(model):
+                """Check if any value is lesser than the value
+                """
+                for v in query(model):
+                    if v < value:
+                        return True
+                return False
+        return predicate
+
 CONDITIONS = dict(map(lambda x: (x.NAME, x), (
     AndCondition,
     OrCondition,
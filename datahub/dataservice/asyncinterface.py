@@ -0,0 +1,421 @@
+# encoding=utf8
+
+""" The asynchronous interface of data service
+    Author: lipixun
+    Created Time : 日 10/18 06:03:41 2026
+
+    File Name: asyncinterface.py
+    Description:
+
+        The AsyncDataServiceInterface has the methods of the DataServiceInterface, which return the Future objects
+        (See datahub.futures) instead of the results, so a thread is not held by each in-flight request. The lazy reads
+        are exposed by the iterGets / iterByQuery methods, which return the AsyncCursor objects to fetch the models
+        batch by batch.
+
+        The AsyncDataService exposes a data service as an asynchronous one, the calls are run by a bounded Executor
+        (And the yields of models are read in it), and the SyncDataService exposes an asynchronous data service as a
+        normal one by waiting for the results.
+
+"""
+
+import threading
+
+from datahub.errors import FeatureNotSupportedError
+from datahub.futures import Executor
+from datahub.dataservice.interface import DataServiceInterface
+
+# The default count of the models fetched by the cursor in one call
+DEFAULT_FETCH_SIZE = 100
+
+def readModels(models):
+    """Read the models (A list or a yield) into a list
+    """
+    if models is None or isinstance(models, list):
+        return models
+    return list(models)
+
+class AsyncCursor(object):
+    """The cursor to fetch the models asynchronously
+    Attributes:
+        executor                            The Executor object which fetches the models
+        open                                The method: () returns the models (A list or a yield), called when the
+                                            first batch is fetched
+    """
+    def __init__(self, executor, open):
+        """Create a new AsyncCursor
+        """
+        self.executor = executor
+        self.open = open
+        self.iterator = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        """Iterate the models by waiting for the batches
+        """
+        while True:
+            models = self.fetch().result()
+            if not models:
+                break
+            for model in models:
+                yield model
+
+    def fetch(self, size = DEFAULT_FETCH_SIZE):
+        """Fetch the next batch of models
+        Returns:
+            The Future object of a list of models, an empty list when exhausted
+        """
+        return self.executor.submit(self.read, size)
+
+    def read(self, size):
+        """Read the next batch of models
+        """
+        with self.lock:
+            if self.closed:
+                return []
+            if self.iterator is None:
+                self.iterator = iter(self.open() or [])
+            models = []
+            for model in self.iterator:
+                models.append(model)
+                if len(models) >= size:
+                    break
+            return models
+
+    def close(self):
+        """Close the cursor
+        """
+        with self.lock:
+            self.closed = True
+            if hasattr(self.iterator, 'close'):
+                self.iterator.close()
+
+class AsyncDataServiceInterface(object):
+    """The asynchronous data service interface
+    NOTE: The methods return the Future objects of the results of the methods of the DataServiceInterface
+    """
+    def exist(self, id, **ctx):
+        """Check if a model with id exists
+        """
+        raise FeatureNotSupportedError
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        raise FeatureNotSupportedError
+
+    def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models
+        Returns:
+            The Future object of a list of models (Not a yield)
+        """
+        raise FeatureNotSupportedError
+
+    def iterGets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models lazily
+        Returns:
+            The AsyncCursor object
+        """
+        raise FeatureNotSupportedError
+
+    def getByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query
+        Returns:
+            The Future object of a list of models (Not a yield)
+        """
+        raise FeatureNotSupportedError
+
+    def iterByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query lazily
+        Returns:
+            The AsyncCursor object
+        """
+        raise FeatureNotSupportedError
+
+    def create(self, model, overwrite = False, **ctx):
+        """Create a model
+        """
+        raise FeatureNotSupportedError
+
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        """
+        raise FeatureNotSupportedError
+
+    def replace(self, model, autoCreate = False, **ctx):
+        """Replace a model
+        """
+        raise FeatureNotSupportedError
+
+    def save(self, model, **ctx):
+        """Save the changes of a model
+        """
+        raise FeatureNotSupportedError
+
+    def updateOne(self, id, updates, **ctx):
+        """Update a model
+        """
+        raise FeatureNotSupportedError
+
+    def updates(self, ids, updates, **ctx):
+        """Update models
+        """
+        raise FeatureNotSupportedError
+
+    def updateByQuery(self, query, updates, **ctx):
+        """Update by query
+        """
+        raise FeatureNotSupportedError
+
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        """
+        raise FeatureNotSupportedError
+
+    def deleteOne(self, id, **ctx):
+        """Delete a model
+        """
+        raise FeatureNotSupportedError
+
+    def deletes(self, ids, **ctx):
+        """Delete models
+        """
+        raise FeatureNotSupportedError
+
+    def deleteByQuery(self, query, **ctx):
+        """Delete by query
+        """
+        raise FeatureNotSupportedError
+
+    def counts(self, ids, **ctx):
+        """Count by ids
+        """
+        raise FeatureNotSupportedError
+
+    def countByQuery(self, query, **ctx):
+        """Count by query
+        """
+        raise FeatureNotSupportedError
+
+    def support(self, name):
+        """Check if the feature is supported
+        NOTE: Not a Future
+        """
+        return False
+
+class AsyncDataService(AsyncDataServiceInterface):
+    """Expose a data service as an asynchronous one
+    Attributes:
+        underlying                          The underlying DataServiceInterface object
+        executor                            The Executor object which runs the calls
+    """
+    def __init__(self, underlying, executor = None):
+        """Create a new AsyncDataService
+        Parameters:
+            underlying                      The underlying DataServiceInterface object
+            executor                        The Executor object, a new one with the default size by default
+        """
+        self.underlying = underlying
+        self.executor = executor or Executor()
+
+    def exist(self, id, **ctx):
+        """Check if a model with id exists
+        """
+        return self.executor.submit(self.underlying.exist, id, **ctx)
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        return self.executor.submit(self.underlying.getOne, id, **ctx)
+
+    def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models
+        """
+        return self.executor.submit(lambda: readModels(self.underlying.gets(ids, start, size, sorts, **ctx)))
+
+    def iterGets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models lazily
+        """
+        return AsyncCursor(self.executor, lambda: self.underlying.gets(ids, start, size, sorts, **ctx))
+
+    def getByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query
+        """
+        return self.executor.submit(lambda: readModels(self.underlying.getByQuery(query, start, size, sorts, **ctx)))
+
+    def iterByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query lazily
+        """
+        return AsyncCursor(self.executor, lambda: self.underlying.getByQuery(query, start, size, sorts, **ctx))
+
+    def create(self, model, overwrite = False, **ctx):
+        """Create a model
+        """
+        return self.executor.submit(self.underlying.create, model, overwrite, **ctx)
+
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        """
+        return self.executor.submit(self.underlying.createMany, models, ordered, overwrite, **ctx)
+
+    def replace(self, model, autoCreate = False, **ctx):
+        """Replace a model
+        """
+        return self.executor.submit(self.underlying.replace, model, autoCreate, **ctx)
+
+    def save(self, model, **ctx):
+        """Save the changes of a model
+        """
+        return self.executor.submit(self.underlying.save, model, **ctx)
+
+    def updateOne(self, id, updates, **ctx):
+        """Update a model
+        """
+        return self.executor.submit(self.underlying.updateOne, id, updates, **ctx)
+
+    def updates(self, ids, updates, **ctx):
+        """Update models
+        """
+        return self.executor.submit(self.underlying.updates, ids, updates, **ctx)
+
+    def updateByQuery(self, query, updates, **ctx):
+        """Update by query
+        """
+        return self.executor.submit(self.underlying.updateByQuery, query, updates, **ctx)
+
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        """
+        return self.executor.submit(self.underlying.bulkWrite, operations, ordered, **ctx)
+
+    def deleteOne(self, id, **ctx):
+        """Delete a model
+        """
+        return self.executor.submit(self.underlying.deleteOne, id, **ctx)
+
+    def deletes(self, ids, **ctx):
+        """Delete models
+        """
+        return self.executor.submit(self.underlying.deletes, ids, **ctx)
+
+    def deleteByQuery(self, query, **ctx):
+        """Delete by query
+        """
+        return self.executor.submit(self.underlying.deleteByQuery, query, **ctx)
+
+    def counts(self, ids, **ctx):
+        """Count by ids
+        """
+        return self.executor.submit(self.underlying.counts, ids, **ctx)
+
+    def countByQuery(self, query, **ctx):
+        """Count by query
+        """
+        return self.executor.submit(self.underlying.countByQuery, query, **ctx)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return self.underlying.support(name)
+
+class SyncDataService(DataServiceInterface):
+    """Expose an asynchronous data service as a normal one
+    Attributes:
+        underlying                          The underlying AsyncDataServiceInterface object
+        timeout                             The seconds to wait for the results, None to wait forever
+    """
+    def __init__(self, underlying, timeout = None):
+        """Create a new SyncDataService
+        """
+        self.underlying = underlying
+        self.timeout = timeout
+
+    def exist(self, id, **ctx):
+        """Check if a model with id exists
+        """
+        return self.underlying.exist(id, **ctx).result(self.timeout)
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        return self.underlying.getOne(id, **ctx).result(self.timeout)
+
+    def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models
+        """
+        return self.underlying.gets(ids, start, size, sorts, **ctx).result(self.timeout)
+
+    def getByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query
+        """
+        return self.underlying.getByQuery(query, start, size, sorts, **ctx).result(self.timeout)
+
+    def create(self, model, overwrite = False, **ctx):
+        """Create a model
+        """
+        return self.underlying.create(model, overwrite, **ctx).result(self.timeout)
+
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        """
+        return self.underlying.createMany(models, ordered, overwrite, **ctx).result(self.timeout)
+
+    def replace(self, model, autoCreate = False, **ctx):
+        """Replace a model
+        """
+        return self.underlying.replace(model, autoCreate, **ctx).result(self.timeout)
+
+    def save(self, model, **ctx):
+        """Save the changes of a model
+        """
+        return self.underlying.save(model, **ctx).result(self.timeout)
+
+    def updateOne(self, id, updates, **ctx):
+        """Update a model
+        """
+        return self.underlying.updateOne(id, updates, **ctx).result(self.timeout)
+
+    def updates(self, ids, updates, **ctx):
+        """Update models
+        """
+        return self.underlying.updates(ids, updates, **ctx).result(self.timeout)
+
+    def updateByQuery(self, query, updates, **ctx):
+        """Update by query
+        """
+        return self.underlying.updateByQuery(query, updates, **ctx).result(self.timeout)
+
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        """
+        return self.underlying.bulkWrite(operations, ordered, **ctx).result(self.timeout)
+
+    def deleteOne(self, id, **ctx):
+        """Delete a model
+        """
+        return self.underlying.deleteOne(id, **ctx).result(self.timeout)
+
+    def deletes(self, ids, **ctx):
+        """Delete models
+        """
+        return self.underlying.deletes(ids, **ctx).result(self.timeout)
+
+    def deleteByQuery(self, query, **ctx):
+        """Delete by query
+        """
+        return self.underlying.deleteByQuery(query, **ctx).result(self.timeout)
+
+    def counts(self, ids, **ctx):
+        """Count by ids
+        """
+        return self.underlying.counts(ids, **ctx).result(self.timeout)
+
+    def countByQuery(self, query, **ctx):
+        """Count by query
+        """
+        return self.underlying.countByQuery(query, **ctx).result(self.timeout)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return self.underlying.support(name)
@@ -9,6 +9,7 @@
 
 """
 
+from datahub.bulk import createOneByOne, writeOneByOne
 from datahub.errors import FeatureNotSupportedError
 
 class DataServiceInterface(object):
@@ -23,6 +24,9 @@ class DataServiceInterface(object):
 
     def getOne(self, id, **ctx):
         """Get one model
+        Parameters:
+            fields                          The fields to select (See datahub.projection), the model is partially
+                                            loaded if specified
         Returns:
             Model object or None
         """
@@ -30,6 +34,9 @@ class DataServiceInterface(object):
 
     def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
         """Get models
+        Parameters:
+            fields                          The fields to select (See datahub.projection), the models are partially
+                                            loaded if specified
         Returns:
             A list of model objects or empty list or None
             NOTE: Yield of models is also allowed
@@ -38,6 +45,9 @@ class DataServiceInterface(object):
 
     def getByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
         """Get by query
+        Parameters:
+            fields                          The fields to select (See datahub.projection), the models are partially
+                                            loaded if specified
         Returns:
             A list of model objects or empty list or None
             NOTE: Yield of models is also allowed
@@ -51,6 +61,13 @@ class DataServiceInterface(object):
         """
         raise FeatureNotSupportedError
 
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models, the models are created one by one by default
+        Returns:
+            The CreateManyResult object
+        """
+        return createOneByOne(lambda model: self.create(model, overwrite, **ctx), models, ordered)
+
     def replace(self, model, autoCreate = False, **ctx):
         """Replace a model
         Returns:
@@ -58,6 +75,13 @@ class DataServiceInterface(object):
         """
         raise FeatureNotSupportedError
 
+    def save(self, model, **ctx):
+        """Save the changes of a model (See DataModel.changes)
+        Returns:
+            The model id
+        """
+        raise FeatureNotSupportedError
+
     def updateOne(self, id, updates, **ctx):
         """Update a model
         Returns:
@@ -79,6 +103,18 @@ class DataServiceInterface(object):
         """
         raise FeatureNotSupportedError
 
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations (See datahub.bulk), the operations are written one by one by default
+        Returns:
+            The BulkWriteResult object
+        """
+        return writeOneByOne(operations, ordered,
+            lambda model, overwrite: self.create(model, overwrite, **ctx),
+            lambda model, autoCreate: self.replace(model, autoCreate, **ctx),
+            lambda id, updates: 1 if self.updateOne(id, updates, **ctx) else 0,
+            lambda id: 1 if self.deleteOne(id, **ctx) else 0
+            )
+
     def deleteOne(self, id, **ctx):
         """Delete a model
         Returns:
@@ -113,3 +149,8 @@ class DataServiceInterface(object):
             The number of found models
         """
         raise FeatureNotSupportedError
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return False
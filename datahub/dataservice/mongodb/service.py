@@ -16,114 +16,23 @@ from datahub.spec import *
 from datahub.model import DumpContext
 from datahub.errors import BadValueError, DuplicatedKeyError, ModelNotFoundError, InvalidParameterError
 from datahub.updates import PushAction, PushsAction, PopAction, SetAction, ClearAction
-from datahub.conditions import AndCondition, OrCondition, NotCondition, KeyValueCondition, KeyValuesCondition, ExistCondition, \
-    NonExistCondition, GreaterCondition, LesserCondition
+from datahub.mongoquery import compileQuery, getKeysetFind
+from datahub.projection import loadFields, getMongoProjection
+from datahub import mongobulk
 from datahub.dataservice.interface import DataServiceInterface
+from datahub.dataservice.asyncinterface import AsyncDataService
 
 class MongodbDataStorage(object):
     """The mongodb data storage
     """
     @classmethod
-    def __getquerybycondition__(cls, condition):
-        """Get query by condition
-        """
-        if isinstance(condition, AndCondition):
-            return { "$and": [ cls.__getquerybycondition__(x) for x in condition.conditions ] }
-        elif isinstance(condition, OrCondition):
-            return { "$or": [ cls.__getquerybycondition__(x) for x in condition.conditions ] }
-        elif isinstance(condition, NotCondition):
-            return { "$nor": [ cls.__getquerybycondition__(condition.condition) ] }
-        elif isinstance(condition, KeyValueCondition):
-            if condition.equals:
-                return { condition.key: condition.value }
-            else:
-                return { condition.key: { "$ne": condition.value } }
-        elif isinstance(condition, KeyValuesCondition):
-            if condition.includes:
-                return { condition.key: { "$in": condition.values } }
-            else:
-                return { condition.key: { "$nin": condition.values } }
-        elif isinstance(condition, ExistCondition):
-            return { condition.key: { "$exists": True } }
-        elif isinstance(condition, NonExistCondition):
-            return { condition.key: { "$exists": False } }
-        elif isinstance(condition, GreaterCondition):
-            if condition.equals:
-                return { condition.key: { "$gte": condition.value } }
-            else:
-                return { condition.key: { "$gt": condition.value } }
-        elif isinstance(condition, LesserCondition):
-            if condition.equals:
-                return { condition.key: { "$lte": condition.value } }
-            else:
-                return { condition.key: { "$lt": condition.value } }
-        else:
-            raise TypeError("Unknown condition type [%s]" % type(condition).__name__)
-
-    @classmethod
-    def __optimizequery__(cls, query):
-        """Optimize the query
-        """
-        if len(query) == 1:
-            # Check if a logic query
-            key, value = query.keys()[0], query.values()[0]
-            if key in ("$and", "$or"):
-                # Optimize children
-                value = [ cls.__optimizequery__(x) for x in value ]
-                # Merge queries
-                ands, ors, others = [], [], []
-                for q in value:
-                    k, v = q.keys()[0], q.values()[0]
-                    if k == "$and":
-                        ands.extend(v)
-                    elif k == "$or":
-                        ors.extend(v)
-                    else:
-                        others.append(q)
-                value = []
-                value.extend(others)
-                if key == "$and":
-                    value.extend(ands)
-                    if ors:
-                        value.append({ "$or": ors })
-                else:
-                    value.extend(ors)
-                    if ands:
-                        value.append({ "$and": ands })
-                # Done
-                return { key: value }
-            elif key == "$nor":
-                nors, others = [], []
-                # Optimize children
-                value = [ cls.__optimizequery__(x) for x in value ]
-                for q in value:
-                    k, v = q.keys()[0], q.values()[0]
-                    if k == "$nor":
-                        nors.extend(v)
-                    if k == "$and":
-                        others.extend(v)
-                    else:
-                        others.append(q)
-                if not nors:
-                    return { "$nor": others }
-                else:
-                    if others:
-                        return { "$and": [ { "$nor": others } ] + nors }
-                    else:
-                        return { "$and": nors }
-            # Done
-        return query
-
-    @classmethod
-    def getQueryByCondition(cls, condition):
-        """Get mongodb query by condition
+    def getQueryByCondition(cls, condition, modelCls = None):
+        """Get mongodb query by condition (See datahub.mongoquery)
+        NOTE: The returned query is shared, please do not change it
+        Returns:
+            The mongodb query or None if the condition is always false
         """
-        # Get original query
-        query = cls.__getquerybycondition__(condition)
-        # Optimize the query
-        query = cls.__optimizequery__(query)
-        # Done
-        return query
+        return compileQuery(condition, modelCls)
 
     @classmethod
     def getUpdatesByUpdates(cls, updates):
@@ -175,6 +84,61 @@ class MongodbDataStorage(object):
         """
         return cls.instance(modelCls, StaticMongodbCollectionContext(collection))
 
+    @classmethod
+    def loadModel(cls, modelCls, doc, strictLoad = False, lazyLoad = False, fields = None, **ctx):
+        """Load the model from the mongodb document
+        Parameters:
+            strictLoad                      Validate the loaded model, by default the documents are trusted since they're validated when written
+            lazyLoad                        Decode the fields when they're accessed the first time
+            fields                          The document is a projection of the fields (See datahub.projection)
+        Returns:
+            Model object
+        """
+        if fields:
+            model = modelCls.loadPartial(doc, trusted = not strictLoad, lazy = lazyLoad)
+            if strictLoad:
+                model.validate(required = False)
+            return model
+        elif strictLoad:
+            model = modelCls(doc)
+            model.validate()
+            return model
+        elif lazyLoad:
+            return modelCls.loadLazy(doc)
+        else:
+            return modelCls.loadTrusted(doc)
+
+    @classmethod
+    def find(cls, collection, modelCls, query, start = 0, size = 0, sorts = None, **ctx):
+        """Find the models
+        Parameters:
+            after                           The continuation token (See datahub.paging), the keyset pagination is used
+                                            instead of skipping start if this ctx is set (To None for the first page)
+            batchSize                       The count of the documents fetched from mongodb in one round trip, the
+                                            models are loaded lazily so the memory is bounded by it
+            fields                          The fields to select (See datahub.projection), all fields by default
+        Returns:
+            Yield of models
+        """
+        fields = ctx['fields'] = loadFields(ctx.get('fields'), modelCls)
+        if 'after' in ctx:
+            # Keyset pagination
+            query, sorts = getKeysetFind(query, sorts, ctx['after'])
+            if query is None:
+                return
+            start = 0
+            if fields:
+                # The sort keys are required by the continuation token
+                fields = loadFields(fields + tuple(x.key for x in sorts))
+        for doc in collection.find(query,
+            projection = getMongoProjection(fields),
+            sort = [ (x.key, ASCENDING if x.ascending else DESCENDING) for x in sorts ] if sorts else None,
+            skip = start,
+            limit = size,
+            batch_size = ctx.get('batchSize') or 0
+            ):
+            yield cls.loadModel(modelCls, doc, **ctx)
+
     @classmethod
     def exist(cls, collection, modelCls, id, **ctx):
         """Check if a model with id exists
@@ -189,11 +153,10 @@ class MongodbDataStorage(object):
         Returns:
             Model object or None
         """
-        doc = collection.find_one(id)
+        fields = ctx['fields'] = loadFields(ctx.get('fields'), modelCls)
+        doc = collection.find_one(id, projection = getMongoProjection(fields))
         if doc:
-            model = modelCls(doc)
-            model.validate()
-            return model
+            return cls.loadModel(modelCls, doc, **ctx)
 
     @classmethod
     def gets(cls, collection, modelCls, ids = None, start = 0, size = 0, sorts = None, **ctx):
@@ -212,10 +175,7 @@ class MongodbDataStorage(object):
             # Get a single id
             query = { "_id": ids }
         # Get models
-        for doc in collection.find(query, sort = [ (x.key, ASCENDING if x.ascending else DESCENDING) for x in sorts ] if sorts else None, skip = start, limit = size):
-            model = modelCls(doc)
-            model.validate()
-            yield model
+        return cls.find(collection, modelCls, query, start, size, sorts, **ctx)
 
     @classmethod
     def getByQuery(cls, collection, modelCls, query, start = 0, size = 0, sorts = None, **ctx):
@@ -224,14 +184,10 @@ class MongodbDataStorage(object):
             A list of model objects or empty list or None
             NOTE: Yield of models is also allowed
         """
-        for doc in collection.find(cls.getQueryByCondition(query),
-            sort = [ (x.key, ASCENDING if x.ascending else DESCENDING) for x in sorts ] if sorts else None,
-            skip = start,
-            limit = size
-            ):
-            model = modelCls(doc)
-            model.validate()
-            yield model
+        mongoQuery = cls.getQueryByCondition(query, modelCls)
+        if mongoQuery is None:
+            return []
+        return cls.find(collection, modelCls, mongoQuery, start, size, sorts, **ctx)
 
     @classmethod
     def create(cls, collection, model, overwrite = False, **ctx):
@@ -253,6 +209,24 @@ class MongodbDataStorage(object):
         # Done
         return model.id
 
+    @classmethod
+    def createMany(cls, collection, models, ordered = False, overwrite = False, batchSize = None, **ctx):
+        """Create models by batches
+        Parameters:
+            batchSize                       The max count of the models written in one round trip (See datahub.mongobulk)
+        Returns:
+            The CreateManyResult object
+        """
+        return mongobulk.createMany(collection, models, ordered, batchSize, overwrite)
+
+    @classmethod
+    def bulkWrite(cls, collection, operations, ordered = False, **ctx):
+        """Write operations (See datahub.bulk) by a single bulk write
+        Returns:
+            The BulkWriteResult object
+        """
+        return mongobulk.bulkWrite(collection, operations, ordered, cls.getUpdatesByUpdates)
+
     @classmethod
     def replace(cls, collection, model, autoCreate = False, **ctx):
         """Replace a model
@@ -269,6 +243,24 @@ class MongodbDataStorage(object):
         # Done
         return model.id
 
+    @classmethod
+    def save(cls, collection, model, **ctx):
+        """Save the changes of a model (See DataModel.changes)
+        Returns:
+            The model id
+        """
+        # Validate model & get the changes
+        model.validate()
+        updates = model.changes(DumpContext(datetime2str = False))
+        # Update mongodb
+        if updates:
+            rtn = collection.update_one({ "_id": model.id }, cls.getUpdatesByUpdates(updates))
+            if rtn.matched_count == 0:
+                raise ModelNotFoundError
+        # Done
+        model.resetChanges()
+        return model.id
+
     @classmethod
     def updateOne(cls, collection, id, updates, **ctx):
         """Update a model
@@ -304,8 +296,13 @@ class MongodbDataStorage(object):
         if not query:
             # Instead of delete all datas, we raise an exception in order to avoid potential misoperation risk
             raise InvalidParameterError(reason = "Require query")
+        mongoQuery = cls.getQueryByCondition(query)
+        if mongoQuery is None:
+            return 0
+        elif not mongoQuery:
+            raise InvalidParameterError(reason = "Require query")
         # Update by query
-        return collection.update_many(cls.getQueryByCondition(query), cls.getUpdatesByUpdates(updates)).modified_count
+        return collection.update_many(mongoQuery, cls.getUpdatesByUpdates(updates)).modified_count
 
     @classmethod
     def deleteOne(cls, collection, id, **ctx):
@@ -341,8 +338,13 @@ class MongodbDataStorage(object):
         if not query:
             # Instead of delete all datas, we raise an exception in order to avoid potential misoperation risk
             raise InvalidParameterError(reason = "Require query")
+        mongoQuery = cls.getQueryByCondition(query)
+        if mongoQuery is None:
+            return 0
+        elif not mongoQuery:
+            raise InvalidParameterError(reason = "Require query")
         # Delete by query
-        return collection.delete_many(cls.getQueryByCondition(query)).deleted_count
+        return collection.delete_many(mongoQuery).deleted_count
 
     @classmethod
     def counts(cls, collection, ids, **ctx):
@@ -365,7 +367,10 @@ class MongodbDataStorage(object):
         Returns:
             The number of found models
         """
-        return collection.count(cls.getQueryByCondition(query))
+        mongoQuery = cls.getQueryByCondition(query)
+        if mongoQuery is None:
+            return 0
+        return collection.count(mongoQuery)
 
 class StaticMongodbCollectionContext(object):
     """The static mongodb context
@@ -401,11 +406,18 @@ class StaticMongodbCollectionContext(object):
 class MongodbDataService(DataServiceInterface):
     """The mongodb data service
     """
-    def __init__(self, modelCls, mongodbContext):
+    FEATURES = [
+        FEATURE_KEYSET_PAGING,
+        ]
+
+    def __init__(self, modelCls, mongodbContext, strictLoad = False):
         """Create a new MongodbDataService
+        Parameters:
+            strictLoad                      Validate the models loaded from mongodb, could be overwritten by the [strictLoad] ctx
         """
         self.modelCls = modelCls
         self.mongodbContext = mongodbContext
+        self.strictLoad = strictLoad
 
     def exist(self, id, **ctx):
         """Check if a model with id exists
@@ -420,6 +432,7 @@ class MongodbDataService(DataServiceInterface):
         Returns:
             Model object or None
         """
+        ctx.setdefault('strictLoad', self.strictLoad)
         with self.mongodbContext.collection(ctx) as collection:
             return MongodbDataStorage.getOne(collection, self.modelCls, id, **ctx)
 
@@ -429,6 +442,7 @@ class MongodbDataService(DataServiceInterface):
             A list of model objects or empty list or None
             NOTE: Yield of models is also allowed
         """
+        ctx.setdefault('strictLoad', self.strictLoad)
         with self.mongodbContext.collection(ctx) as collection:
             return MongodbDataStorage.gets(collection, self.modelCls, ids, start, size, sorts, **ctx)
 
@@ -438,6 +452,7 @@ class MongodbDataService(DataServiceInterface):
             A list of model objects or empty list or None
             NOTE: Yield of models is also allowed
         """
+        ctx.setdefault('strictLoad', self.strictLoad)
         with self.mongodbContext.collection(ctx) as collection:
             return MongodbDataStorage.getByQuery(collection, self.modelCls, query, start, size, sorts, **ctx)
 
@@ -449,6 +464,22 @@ class MongodbDataService(DataServiceInterface):
         with self.mongodbContext.collection(ctx) as collection:
             return MongodbDataStorage.create(collection, model, overwrite, **ctx)
 
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        Returns:
+            The CreateManyResult object
+        """
+        with self.mongodbContext.collection(ctx) as collection:
+            return MongodbDataStorage.createMany(collection, models, ordered, overwrite, **ctx)
+
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        Returns:
+            The BulkWriteResult object
+        """
+        with self.mongodbContext.collection(ctx) as collection:
+            return MongodbDataStorage.bulkWrite(collection, operations, ordered, **ctx)
+
     def replace(self, model, autoCreate = False, **ctx):
         """Replace a model
         Returns:
@@ -457,6 +488,14 @@ class MongodbDataService(DataServiceInterface):
         with self.mongodbContext.collection(ctx) as collection:
             return MongodbDataStorage.replace(collection, model, autoCreate, **ctx)
 
+    def save(self, model, **ctx):
+        """Save the changes of a model (See DataModel.changes)
+        Returns:
+            The model id
+        """
+        with self.mongodbContext.collection(ctx) as collection:
+            return MongodbDataStorage.save(collection, model, **ctx)
+
     def updateOne(self, id, updates, **ctx):
         """Update a model
         Returns:
@@ -520,3 +559,20 @@ class MongodbDataService(DataServiceInterface):
         """
         with self.mongodbContext.collection(ctx) as collection:
             return MongodbDataStorage.countByQuery(collection, query, **ctx)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return name in self.FEATURES
+
+class AsyncMongodbDataService(AsyncDataService):
+    """The asynchronous mongodb data service, the pymongo calls are run by a bounded executor
+    """
+    def __init__(self, modelCls, mongodbContext, strictLoad = False, executor = None):
+        """Create a new AsyncMongodbDataService
+        Parameters:
+            strictLoad                      Validate the models loaded from mongodb, could be overwritten by the [strictLoad] ctx
+            executor                        The Executor object (See datahub.futures), the pymongo client should have
+                                            enough connections (maxPoolSize) for the workers of it
+        """
+        super(AsyncMongodbDataService, self).__init__(MongodbDataService(modelCls, mongodbContext, strictLoad), executor)
@@ -15,31 +15,75 @@ from urllib import quote_plus
 
 import requests
 
+from requests.adapters import HTTPAdapter
+
 from datahub.utils import json
+from datahub.bulk import CreateManyResult, BulkWriteResult
+from datahub.paging import Page
+from datahub.projection import loadFields, dumpFields
+from datahub.streaming import FORMAT_JSON, FORMAT_NDJSON, STREAM_PATHS, iterStreamLines
 from datahub.errors import ModelNotFoundError
+from datahub.futures import DEFAULT_WORKERS, Executor
 from datahub.dataservice.interface import DataServiceInterface
+from datahub.dataservice.asyncinterface import AsyncCursor, AsyncDataService
+
+# The default count of the pooled keep-alive connections of a host
+DEFAULT_POOL_SIZE = 10
+
+def createSession(poolSize = DEFAULT_POOL_SIZE):
+    """Create a requests session which keeps at most poolSize alive connections to each host
+    Returns:
+        The requests.Session object
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections = poolSize, pool_maxsize = poolSize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 class RestfulWebClient(DataServiceInterface):
     """The restful web client
     """
-    def __init__(self, uri, modelCls, session = None):
+    def __init__(self, uri, modelCls, session = None, timeout = None):
         """Create a new RestfulWebClient
+        Parameters:
+            timeout                         The default seconds to wait for the server, could be overwritten by the
+                                            [timeout] ctx, None to wait forever
+        NOTE: The timeout is the one of requests, which limits each socket operation (To connect, and each read of the
+        response), not the whole call. A call which is answered slowly, or a stream, may take longer than it
         """
         self.uri = uri if not uri.endswith("/") else uri[: -1]
         self.modelCls = modelCls
         self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def getTimeout(self, ctx):
+        """Get the timeout of each socket operation of a call (See __init__)
+        """
+        return ctx.get("timeout", self.timeout)
 
     def handleErrorResponse(self, rsp):
         """Handle error response
         """
         rsp.raise_for_status()
 
+    def loadModel(self, raw, fields = None):
+        """Load the model
+        Parameters:
+            fields                          The selected fields, the model is partially loaded if specified
+        Returns:
+            Model object
+        """
+        if fields:
+            return self.modelCls.loadPartial(raw)
+        return self.modelCls.load(raw)
+
     def exist(self, id, **ctx):
         """Check if a model with id exists
         Returns:
             True / False
         """
-        rsp = self.session.head(self.uri + "/%s" % quote_plus(id))
+        rsp = self.session.head(self.uri + "/%s" % quote_plus(id), timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return True
         elif rsp.status_code == 404:
@@ -52,9 +96,10 @@ class RestfulWebClient(DataServiceInterface):
         Returns:
             Model object or None
         """
-        rsp = self.session.get(self.uri + "/%s" % quote_plus(id))
+        fields = loadFields(ctx.get("fields"))
+        rsp = self.session.get(self.uri + "/%s" % quote_plus(id), params = { "fields": dumpFields(fields) } if fields else None, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
-            return self.modelCls.load(json.loads(rsp.content)["value"])
+            return self.loadModel(json.loads(rsp.content)["value"], fields)
         elif rsp.status_code == 404:
             return None
         else:
@@ -74,10 +119,13 @@ class RestfulWebClient(DataServiceInterface):
             data["size"] = size
         if sorts:
             data["sorts"] = [ x.dump() for x in sorts ]
+        fields = loadFields(ctx.get("fields"))
+        if fields:
+            data["fields"] = fields
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri + "/_gets", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri + "/_gets", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
-            return [ self.modelCls.load(x) for x in json.loads(rsp.content)["value"] ]
+            return [ self.loadModel(x, fields) for x in json.loads(rsp.content)["value"] ]
         else:
             self.handleErrorResponse(rsp)
 
@@ -96,10 +144,100 @@ class RestfulWebClient(DataServiceInterface):
             data["size"] = size
         if sorts:
             data["sorts"] = [ x.dump() for x in sorts ]
+        fields = loadFields(ctx.get("fields"))
+        if fields:
+            data["fields"] = fields
+        body = json.dumps(data, ensure_ascii = False).encode("utf8")
+        rsp = self.session.post(self.uri + "/_getbyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
+        if rsp.status_code == 200:
+            return [ self.loadModel(x, fields) for x in json.loads(rsp.content)["value"] ]
+        else:
+            self.handleErrorResponse(rsp)
+
+    def stream(self, ids = None, query = None, start = 0, size = 0, sorts = None, batchSize = 0, format = FORMAT_JSON, **ctx):
+        """Stream models by ids or query (Or all models without both), the response is decoded line by line
+        Parameters:
+            format                          The stream format (See datahub.streaming)
+        Returns:
+            Yield of model objects
+        """
+        if not format in STREAM_PATHS:
+            raise ValueError("Unknown stream format [%s]" % format)
+        data = {}
+        if not ids is None:
+            data["ids"] = ids
+        if query:
+            data["query"] = query.dump()
+        if start:
+            data["start"] = start
+        if size:
+            data["size"] = size
+        if sorts:
+            data["sorts"] = [ x.dump() for x in sorts ]
+        if batchSize:
+            data["batchSize"] = batchSize
+        fields = loadFields(ctx.get("fields"))
+        if fields:
+            data["fields"] = fields
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri + "/_getbyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri + STREAM_PATHS[format], headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, stream = True, timeout = self.getTimeout(ctx))
+        if rsp.status_code != 200:
+            self.handleErrorResponse(rsp)
+        try:
+            for value in iterStreamLines(rsp.iter_lines(), format):
+                yield self.loadModel(value, fields)
+        finally:
+            rsp.close()
+
+    def loadPage(self, value, fields = None):
+        """Load the page of the keyset pagination
+        Returns:
+            The Page object
+        """
+        return Page([ self.loadModel(x, fields) for x in value["models"] ], value.get("next"))
+
+    def listPage(self, size = 0, sorts = None, after = None, **ctx):
+        """List a page of models by the keyset pagination
+        Parameters:
+            after                           The continuation token of the previous page, None for the first page
+        Returns:
+            The Page object
+        """
+        params = { "after": after or "" }
+        if size:
+            params["size"] = size
+        if sorts:
+            params["sorts"] = ",".join([ "%s:%s" % (x.key, "ascending" if x.ascending else "descending") for x in sorts ])
+        fields = loadFields(ctx.get("fields"))
+        if fields:
+            params["fields"] = dumpFields(fields)
+        rsp = self.session.get(self.uri or "/", params = params, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
-            return [ self.modelCls.load(x) for x in json.loads(rsp.content)["value"] ]
+            return self.loadPage(json.loads(rsp.content)["value"], fields)
+        else:
+            self.handleErrorResponse(rsp)
+
+    def getPageByQuery(self, query, size = 0, sorts = None, after = None, **ctx):
+        """Get a page of models by query by the keyset pagination
+        Parameters:
+            after                           The continuation token of the previous page, None for the first page
+        Returns:
+            The Page object
+        """
+        data = { "after": after }
+        if query:
+            data["query"] = query.dump()
+        if size:
+            data["size"] = size
+        if sorts:
+            data["sorts"] = [ x.dump() for x in sorts ]
+        fields = loadFields(ctx.get("fields"))
+        if fields:
+            data["fields"] = fields
+        body = json.dumps(data, ensure_ascii = False).encode("utf8")
+        rsp = self.session.post(self.uri + "/_getbyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
+        if rsp.status_code == 200:
+            return self.loadPage(json.loads(rsp.content)["value"], fields)
         else:
             self.handleErrorResponse(rsp)
 
@@ -114,12 +252,30 @@ class RestfulWebClient(DataServiceInterface):
         if overwrite:
             params = { "overwrite": overwrite }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri or "/", params = params, headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri or "/", params = params, headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
             self.handleErrorResponse(rsp)
 
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        Returns:
+            The CreateManyResult object
+        """
+        for model in models:
+            model.validate()
+        data = { "models": [ x.dump() for x in models ], "ordered": ordered }
+        params = None
+        if overwrite:
+            params = { "overwrite": overwrite }
+        body = json.dumps(data, ensure_ascii = False).encode("utf8")
+        rsp = self.session.post(self.uri + "/_creates", params = params, headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
+        if rsp.status_code == 200:
+            return CreateManyResult.load(json.loads(rsp.content)["value"])
+        else:
+            self.handleErrorResponse(rsp)
+
     def replace(self, model, autoCreate = False, **ctx):
         """Replace a model
         Returns:
@@ -131,7 +287,7 @@ class RestfulWebClient(DataServiceInterface):
         if autoCreate:
             params = { "autoCreate": autoCreate }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.put(self.uri or "/", params = params, headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.put(self.uri or "/", params = params, headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         elif rsp.status_code == 404:
@@ -139,6 +295,31 @@ class RestfulWebClient(DataServiceInterface):
         else:
             self.handleErrorResponse(rsp)
 
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        Returns:
+            The BulkWriteResult object
+        """
+        data = { "operations": [ x.dump() for x in operations ], "ordered": ordered }
+        body = json.dumps(data, ensure_ascii = False).encode("utf8")
+        rsp = self.session.post(self.uri + "/_bulk", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
+        if rsp.status_code == 200:
+            return BulkWriteResult.load(json.loads(rsp.content)["value"])
+        else:
+            self.handleErrorResponse(rsp)
+
+    def save(self, model, **ctx):
+        """Save the changes of a model (See DataModel.changes) by updateOne
+        Returns:
+            The model id
+        """
+        model.validate()
+        updates = model.changes()
+        if updates and not self.updateOne(model.id, updates, **ctx):
+            raise ModelNotFoundError
+        model.resetChanges()
+        return model.id
+
     def updateOne(self, id, updates, **ctx):
         """Update a model
         Returns:
@@ -149,7 +330,7 @@ class RestfulWebClient(DataServiceInterface):
         updates = [ x.dump() for x in updates ]
         data = { "updates": updates }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.patch(self.uri + "/%s" % quote_plus(id), headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.patch(self.uri + "/%s" % quote_plus(id), headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         elif rsp.status_code == 404:
@@ -169,7 +350,7 @@ class RestfulWebClient(DataServiceInterface):
         updates = [ x.dump() for x in updates ]
         data = { "ids": ids, "updates": updates }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.patch(self.uri + "/_updates", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.patch(self.uri + "/_updates", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
@@ -187,7 +368,7 @@ class RestfulWebClient(DataServiceInterface):
         updates = [ x.dump() for x in updates ]
         data = { "query": query.dump(), "updates": updates }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.patch(self.uri + "/_updatebyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.patch(self.uri + "/_updatebyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
@@ -198,7 +379,7 @@ class RestfulWebClient(DataServiceInterface):
         Returns:
             True / False
         """
-        rsp = self.session.delete(self.uri + "/%s" % quote_plus(id))
+        rsp = self.session.delete(self.uri + "/%s" % quote_plus(id), timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         elif rsp.status_code == 404:
@@ -215,7 +396,7 @@ class RestfulWebClient(DataServiceInterface):
             raise ValueError("Require ids")
         data = { "ids": ids }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri + "/_deletes", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri + "/_deletes", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
@@ -230,7 +411,7 @@ class RestfulWebClient(DataServiceInterface):
             raise ValueError("Require query")
         data = { "query": query.dump() }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri + "/_deletebyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri + "/_deletebyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
@@ -246,7 +427,7 @@ class RestfulWebClient(DataServiceInterface):
         else:
             data = {}
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri + "/_counts", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri + "/_counts", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
@@ -261,8 +442,69 @@ class RestfulWebClient(DataServiceInterface):
             raise ValueError("Require query")
         data = { "query": query.dump() }
         body = json.dumps(data, ensure_ascii = False).encode("utf8")
-        rsp = self.session.post(self.uri + "/_countbyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body)
+        rsp = self.session.post(self.uri + "/_countbyquery", headers = { "Content-Type": "application/json", "Content-Length": str(len(body)) }, data = body, timeout = self.getTimeout(ctx))
         if rsp.status_code == 200:
             return json.loads(rsp.content)["value"]
         else:
             self.handleErrorResponse(rsp)
+
+class AsyncRestfulWebClient(AsyncDataService):
+    """The asynchronous restful web client, the calls of a RestfulWebClient are run by a bounded executor on the
+    pooled keep-alive connections, so the calls to the services could be fanned out and gathered (See datahub.futures):
+
+        owners, orders = gather([ userClient.getOne(userID), orderClient.getByQuery(query) ]).result(0.5)
+
+    NOTE:
+        The [timeout] ctx is the seconds to wait for each socket operation of a call (See RestfulWebClient), not a
+        deadline of the call. The deadline is enforced by the seconds to wait for the result (Future.result), which
+        raises FutureTimeoutError when it's passed, the call is left running on its worker until it's answered or the
+        socket operation times out, so set both to not hold the workers by the slow servers
+    """
+    def __init__(self, uri, modelCls, timeout = None, workers = DEFAULT_WORKERS, session = None, executor = None):
+        """Create a new AsyncRestfulWebClient
+        Parameters:
+            timeout                         The default seconds to wait for each socket operation, None to wait forever
+            workers                         The count of the worker threads (And the pooled connections)
+            session                         The requests session object, a new pooled one by default
+            executor                        The Executor object, a new one of the workers by default
+        """
+        executor = executor or Executor(workers)
+        super(AsyncRestfulWebClient, self).__init__(
+            RestfulWebClient(uri, modelCls, session or createSession(executor.workers), timeout),
+            executor
+            )
+
+    def iterGets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models lazily by the NDJSON stream
+        Returns:
+            The AsyncCursor object
+        """
+        return self.stream(ids, None, start, size, sorts, format = FORMAT_NDJSON, **ctx)
+
+    def iterByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query lazily by the NDJSON stream
+        Returns:
+            The AsyncCursor object
+        """
+        return self.stream(None, query, start, size, sorts, format = FORMAT_NDJSON, **ctx)
+
+    def stream(self, ids = None, query = None, start = 0, size = 0, sorts = None, batchSize = 0, format = FORMAT_JSON, **ctx):
+        """Stream models by ids or query lazily
+        Returns:
+            The AsyncCursor object
+        """
+        return AsyncCursor(self.executor, lambda: self.underlying.stream(ids, query, start, size, sorts, batchSize, format, **ctx))
+
+    def listPage(self, size = 0, sorts = None, after = None, **ctx):
+        """List a page of models by the keyset pagination
+        Returns:
+            The Future object of the Page object
+        """
+        return self.executor.submit(self.underlying.listPage, size, sorts, after, **ctx)
+
+    def getPageByQuery(self, query, size = 0, sorts = None, after = None, **ctx):
+        """Get a page of models by query by the keyset pagination
+        Returns:
+            The Future object of the Page object
+        """
+        return self.executor.submit(self.underlying.getPageByQuery, query, size, sorts, after, **ctx)
@@ -16,11 +16,16 @@ from unifiedrpc.errors import BadRequestError, NotFoundError
 from unifiedrpc.helpers import paramtype, requiredata, container, mimetype
 from unifiedrpc.paramtypes import boolean
 from unifiedrpc.adapters.web import head, get, post, put, patch, delete
+from unifiedrpc.content.container import PlainContentContainer
 
+from datahub.spec import FEATURE_KEYSET_PAGING
+from datahub.bulk import WriteOperation, CreateOperation, ReplaceOperation
 from datahub.sorts import SortRule
-from datahub.errors import DuplicatedKeyError, ModelNotFoundError
-from datahub.updates import UpdateAction
-from datahub.conditions import Condition
+from datahub.paging import PageTracker
+from datahub.projection import loadFields
+from datahub.streaming import FORMAT_JSON, FORMAT_NDJSON, MIMETYPES, STREAM_PATHS, iterModels, iterStream
+from datahub.errors import DuplicatedKeyError, ModelNotFoundError, InvalidParameterError
+from datahub.parsing import loadCondition, loadUpdateActions
 
 class RestfulWebService(Service):
     """The restful web service
@@ -39,8 +44,12 @@ class RestfulWebService(Service):
         endpoints["__list"] = self.factory.create("list", self.list)
         endpoints["__gets"] = self.factory.create("gets", self.gets)
         endpoints["__getByQuery"] = self.factory.create("getByQuery", self.getByQuery)
+        endpoints["__stream"] = self.factory.create("stream", self.stream)
+        endpoints["__streamNDJSON"] = self.factory.create("streamNDJSON", self.streamNDJSON)
         endpoints["__create"] = self.factory.create("create", self.create)
+        endpoints["__createMany"] = self.factory.create("createMany", self.createMany)
         endpoints["__replace"] = self.factory.create("replace", self.replace)
+        endpoints["__bulkWrite"] = self.factory.create("bulkWrite", self.bulkWrite)
         endpoints["__updateOne"] = self.factory.create("updateOne", self.updateOne)
         endpoints["__updates"] = self.factory.create("updates", self.updates)
         endpoints["__updateByQuery"] = self.factory.create("updateByQuery", self.updateByQuery)
@@ -73,6 +82,53 @@ class RestfulWebService(Service):
         """
         return model
 
+    def iterDumpedModels(self, models, **ctx):
+        """Map and dump the models after get lazily
+        Returns:
+            Yield of dumped models
+        """
+        for model in iterModels(models, lambda x: self.mapModelAfterGet(x, **ctx)):
+            yield model.dump()
+
+    def dumpModels(self, models, **ctx):
+        """Map and dump the models after get
+        Returns:
+            A list of dumped models
+        """
+        return list(self.iterDumpedModels(models, **ctx))
+
+    def getPage(self, method, args, sorts, size, after, **ctx):
+        """Get a page of models by the keyset pagination (See datahub.paging)
+        Parameters:
+            method                          The underlying get method
+            args                            The positional arguments of the method before start
+            after                           The continuation token, empty for the first page
+        Returns:
+            A dict: { "models": A list of dumped models, "next": The continuation token of the next page or None }
+        NOTE: The underlying must support the keyset pagination (Honour the [after] ctx), the skip paging with a token
+        would repeat the models across the pages
+        """
+        if not self.underlying.support(FEATURE_KEYSET_PAGING):
+            raise BadRequestError(reason = "Unsupported feature [%s]" % FEATURE_KEYSET_PAGING)
+        try:
+            tracker = PageTracker(method(*(args + [ 0, size, sorts ]), after = after or None, **ctx), sorts, size)
+            models = self.dumpModels(tracker, **ctx)
+        except InvalidParameterError as error:
+            raise BadRequestError(reason = "Invalid parameter after, error: %s" % error)
+        return { "models": models, "next": tracker.getNextToken() }
+
+    def setFields(self, fields, ctx):
+        """Set the fields to select (See datahub.projection) to the ctx
+        Parameters:
+            fields                          A comma separated string or a list of fields or None
+        """
+        try:
+            fields = loadFields(fields, self.modelCls)
+        except InvalidParameterError as error:
+            raise BadRequestError(reason = "Invalid parameter fields, error: %s" % error)
+        if fields:
+            ctx["fields"] = fields
+
     def exist(self, id, **ctx):
         """Check if a model with id exists
         Returns:
@@ -81,11 +137,14 @@ class RestfulWebService(Service):
         if not self.underlying.exist(id, **ctx):
             raise NotFoundError
 
-    def getOne(self, id, **ctx):
+    def getOne(self, id, fields = None, **ctx):
         """Get one model
+        Parameters:
+            fields                          The comma separated fields to select (See datahub.projection)
         Returns:
             Model object or None
         """
+        self.setFields(fields, ctx)
         model = self.underlying.getOne(id, **ctx)
         if not model:
             raise NotFoundError
@@ -95,8 +154,10 @@ class RestfulWebService(Service):
         # Done
         return model.dump()
 
-    def list(self, start = 0, size = 0, sorts = None, **ctx):
-        """List models
+    def loadSortRules(self, sorts):
+        """Load the sort rules from the list parameter: key[:ascending|descending],...
+        Returns:
+            A list of SortRule or None
         """
         sortRules = None
         if sorts:
@@ -109,21 +170,27 @@ class RestfulWebService(Service):
                         sortRules.append(SortRule(key = s))
                     else:
                         sortRules.append(SortRule(key = s[: index], ascending = s[index + 1: ].lower() == "ascending"))
+        return sortRules
+
+    def list(self, start = 0, size = 0, sorts = None, after = None, fields = None, **ctx):
+        """List models
+        Parameters:
+            after                           The continuation token of the keyset pagination, set it (To empty for the
+                                            first page) to get a page (See getPage) instead of skipping start
+            fields                          The comma separated fields to select (See datahub.projection)
+        """
+        sortRules = self.loadSortRules(sorts)
+        self.setFields(fields, ctx)
         # Gets
-        models = self.underlying.gets(None, start, size, sorts, **ctx)
-        if models is None:
-            return []
-        else:
-            return [ x.dump() for x in filter(lambda x: x, map(lambda x: self.mapModelAfterGet(x, **ctx), models)) ]
+        if not after is None:
+            return self.getPage(self.underlying.gets, [ None ], sortRules, size, after, **ctx)
+        return self.dumpModels(self.underlying.gets(None, start, size, sortRules, **ctx), **ctx)
 
-    def gets(self, **ctx):
-        """Get models
+    def loadGetsBody(self, body):
+        """Load the gets parameters from the body
         Returns:
-            A list of model objects or empty list or None
-            NOTE: Yield of models is also allowed
+            A tuple of (ids, start, size, sorts)
         """
-        body = context.request.content.data
-        # Get parameters
         ids, start, size, sorts = body.get("ids"), body.get("start", 0), body.get("size", 0), body.get("sorts")
         # Decode
         try:
@@ -141,25 +208,32 @@ class RestfulWebService(Service):
                     s.validate()
         except Exception as error:
             raise BadRequestError(reason = "Invalid parameter sorts, error: %s" % error)
-        # Gets
-        models = self.underlying.gets(ids, start, size, sorts, **ctx)
-        if models is None:
-            return []
-        else:
-            return [ x.dump() for x in filter(lambda x: x, map(lambda x: self.mapModelAfterGet(x, **ctx), models)) ]
+        return ids, start, size, sorts
 
-    def getByQuery(self, **ctx):
-        """Get by query
+    def gets(self, fields = None, **ctx):
+        """Get models
+        Parameters:
+            fields                          The comma separated fields to select (See datahub.projection), or a list of
+                                            fields in the body
         Returns:
             A list of model objects or empty list or None
             NOTE: Yield of models is also allowed
         """
         body = context.request.content.data
-        # Get parameters
+        ids, start, size, sorts = self.loadGetsBody(body)
+        self.setFields(fields or body.get("fields"), ctx)
+        # Gets
+        return self.dumpModels(self.underlying.gets(ids, start, size, sorts, **ctx), **ctx)
+
+    def loadGetByQueryBody(self, body):
+        """Load the getByQuery parameters from the body
+        Returns:
+            A tuple of (query, start, size, sorts)
+        """
         query, start, size, sorts = body.get("query"), body.get("start", 0), body.get("size", 0), body.get("sorts")
         # Decode
         try:
-            query = Condition.load(query)
+            query = loadCondition(query)
         except Exception as error:
             raise BadRequestError(reason = "Invalid parameter query, error: %s" % error)
         try:
@@ -170,6 +244,71 @@ class RestfulWebService(Service):
             size = int(size)
         except Exception as error:
             raise BadRequestError(reason = "Invalid parameter size, error: %s" % error)
+        try:
+            if sorts:
+                sorts = [ SortRule(x) for x in sorts ]
+                for s in sorts:
+                    s.validate()
+        except Exception as error:
+            raise BadRequestError(reason = "Invalid parameter sorts, error: %s" % error)
+        return query, start, size, sorts
+
+    def getByQuery(self, fields = None, **ctx):
+        """Get by query
+        Parameters:
+            fields                          The comma separated fields to select (See datahub.projection), or a list of
+                                            fields in the body
+        Returns:
+            A list of model objects or empty list or None
+            NOTE: Yield of models is also allowed
+            NOTE: A page (See getPage) is returned if [after] is in the body (None for the first page)
+        """
+        body = context.request.content.data
+        query, start, size, sorts = self.loadGetByQueryBody(body)
+        self.setFields(fields or body.get("fields"), ctx)
+        # Gets
+        if "after" in body:
+            return self.getPage(self.underlying.getByQuery, [ query ], sorts, size, body.get("after"), **ctx)
+        return self.dumpModels(self.underlying.getByQuery(query, start, size, sorts, **ctx), **ctx)
+
+    def stream(self, fields = None, **ctx):
+        """Stream models by ids or query (Or all models without both) as a json array (See datahub.streaming)
+        """
+        return self.streamByFormat(FORMAT_JSON, fields, **ctx)
+
+    def streamNDJSON(self, fields = None, **ctx):
+        """Stream models by ids or query (Or all models without both) as NDJSON (See datahub.streaming)
+        """
+        return self.streamByFormat(FORMAT_NDJSON, fields, **ctx)
+
+    def streamByFormat(self, format, fields = None, **ctx):
+        """Stream models by ids or query (Or all models without both)
+        Parameters:
+            format                          The stream format (See datahub.streaming)
+        Returns:
+            Yield of the chunks of the dumped models in the format (See datahub.streaming)
+            NOTE: The models are read, mapped and dumped lazily, set [batchSize] in the body to control the count of
+            the models fetched from the underlying in one round trip
+        """
+        body = context.request.content.data or {}
+        # Get parameters
+        ids, query, start, size, sorts, batchSize = body.get("ids"), body.get("query"), body.get("start", 0), body.get("size", 0), \
+            body.get("sorts"), body.get("batchSize")
+        # Decode
+        if ids and query:
+            raise BadRequestError(reason = "Cannot both specify ids and query")
+        try:
+            if query:
+                query = loadCondition(query)
+        except Exception as error:
+            raise BadRequestError(reason = "Invalid parameter query, error: %s" % error)
+        try:
+            start, size = int(start), int(size)
+            if batchSize:
+                ctx["batchSize"] = int(batchSize)
+        except Exception as error:
+            raise BadRequestError(reason = "Invalid parameter start, size or batchSize, error: %s" % error)
+        self.setFields(fields or body.get("fields"), ctx)
         try:
             if sorts:
                 sorts = [ SortRule(x) for x in sorts ]
@@ -178,11 +317,11 @@ class RestfulWebService(Service):
         except Exception as error:
             raise BadRequestError(reason = "Invalid parameter sorts, error: %s" % error)
         # Gets
-        models = self.underlying.getByQuery(query, start, size, sorts, **ctx)
-        if models is None:
-            return []
+        if query:
+            models = self.underlying.getByQuery(query, start, size, sorts, **ctx)
         else:
-            return [ x.dump() for x in filter(lambda x: x, map(lambda x: self.mapModelAfterGet(x, **ctx), models)) ]
+            models = self.underlying.gets(ids, start, size, sorts, **ctx)
+        return iterStream(self.iterDumpedModels(models, **ctx), format)
 
     def create(self, overwrite = False, **ctx):
         """Create a model
@@ -201,6 +340,29 @@ class RestfulWebService(Service):
         # Create
         return self.underlying.create(model, overwrite, **ctx)
 
+    def createMany(self, overwrite = False, **ctx):
+        """Create models
+        Returns:
+            The dumped CreateManyResult
+        """
+        body = context.request.content.data
+        # Decode the models
+        models = body.get("models")
+        if not isinstance(models, list):
+            raise BadRequestError(reason = "Invalid post models")
+        loadedModels = []
+        for index, model in enumerate(models):
+            try:
+                model = self.modelCls.load(model)
+            except Exception as error:
+                raise BadRequestError(reason = "Invalid post model at [%d], error: %s" % (index, error))
+            model = self.mapModelBeforeCreate(model, **ctx)
+            if not model:
+                raise BadRequestError(reason = "Create of the model at [%d] is denied by model mapping" % index)
+            loadedModels.append(model)
+        # Create
+        return self.underlying.createMany(loadedModels, bool(body.get("ordered")), overwrite, **ctx).dump()
+
     def replace(self, autoCreate = False, **ctx):
         """Replace a model
         Returns:
@@ -222,6 +384,35 @@ class RestfulWebService(Service):
         except ModelNotFoundError:
             raise NotFoundError
 
+    def bulkWrite(self, **ctx):
+        """Write operations
+        Returns:
+            The dumped BulkWriteResult
+        """
+        body = context.request.content.data
+        # Decode the operations
+        operations = body.get("operations")
+        if not isinstance(operations, list):
+            raise BadRequestError(reason = "Invalid post operations")
+        loadedOperations = []
+        for index, operation in enumerate(operations):
+            try:
+                operation = WriteOperation.load(operation, self.modelCls)
+            except Exception as error:
+                raise BadRequestError(reason = "Invalid post operation at [%d], error: %s" % (index, error))
+            # Map the models
+            if isinstance(operation, CreateOperation):
+                operation.model = self.mapModelBeforeCreate(operation.model, **ctx)
+                if not operation.model:
+                    raise BadRequestError(reason = "Create of the operation at [%d] is denied by model mapping" % index)
+            elif isinstance(operation, ReplaceOperation):
+                operation.model = self.mapModelBeforeReplace(operation.model, **ctx)
+                if not operation.model:
+                    raise BadRequestError(reason = "Replace of the operation at [%d] is denied by model mapping" % index)
+            loadedOperations.append(operation)
+        # Write
+        return self.underlying.bulkWrite(loadedOperations, bool(body.get("ordered")), **ctx).dump()
+
     def updateOne(self, id, **ctx):
         """Update a model
         Returns:
@@ -234,7 +425,7 @@ class RestfulWebService(Service):
             if not updates:
                 updates = []
             else:
-                updates = [ UpdateAction.load(x) for x in updates ]
+                updates = loadUpdateActions(updates)
         except Exception as error:
             raise BadRequestError(reason = "Invalid post data, error: %s" % error)
         # Create
@@ -255,7 +446,7 @@ class RestfulWebService(Service):
             if not updates:
                 updates = []
             else:
-                updates = [ UpdateAction.load(x) for x in updates ]
+                updates = loadUpdateActions(updates)
         except Exception as error:
             raise BadRequestError(reason = "Invalid post data, error: %s" % error)
         # Create
@@ -271,12 +462,12 @@ class RestfulWebService(Service):
         try:
             query = body.get("query")
             if query:
-                query = Condition.load(query)
+                query = loadCondition(query)
             updates = body.get("updates")
             if not updates:
                 updates = []
             else:
-                updates = [ UpdateAction.load(x) for x in updates ]
+                updates = loadUpdateActions(updates)
         except Exception as error:
             raise BadRequestError(reason = "Invalid post data, error: %s" % error)
         # Create
@@ -312,7 +503,7 @@ class RestfulWebService(Service):
         try:
             query = body.get("query")
             if query:
-                query = Condition.load(query)
+                query = loadCondition(query)
         except Exception as error:
             raise BadRequestError(reason = "Invalid post data, error: %s" % error)
         # Deletes
@@ -339,7 +530,7 @@ class RestfulWebService(Service):
         try:
             query = body.get("query")
             if query:
-                query = Condition.load(query)
+                query = loadCondition(query)
         except Exception as error:
             raise BadRequestError(reason = "Invalid post data, error: %s" % error)
         # Deletes
@@ -377,18 +568,36 @@ class RestfulEndpointFactory(object):
             ep = post(path = self.prefix + "/_getbyquery")(endpoint()(handler))
             requiredata()(ep)
             return ep
+        elif name == "stream" or name == "streamNDJSON":
+            # Create a stream endpoint of the format
+            format = FORMAT_NDJSON if name == "streamNDJSON" else FORMAT_JSON
+            ep = post(path = self.prefix + STREAM_PATHS[format])(endpoint()(handler))
+            container(PlainContentContainer)(ep)
+            mimetype(MIMETYPES[format])(ep)
+            return ep
         elif name == "create":
             # Create a create endpoint
             ep = post(path = self.prefix or "/")(endpoint()(handler))
             paramtype(overwrite = boolean)(ep)
             requiredata()(ep)
             return ep
+        elif name == "createMany":
+            # Create a createMany endpoint
+            ep = post(path = self.prefix + "/_creates")(endpoint()(handler))
+            paramtype(overwrite = boolean)(ep)
+            requiredata()(ep)
+            return ep
         elif name == "replace":
             # Create a replace endpoint
             ep = put(path = self.prefix or "/")(endpoint()(handler))
             paramtype(autoCreate = boolean)(ep)
             requiredata()(ep)
             return ep
+        elif name == "bulkWrite":
+            # Create a bulk write endpoint
+            ep = post(path = self.prefix + "/_bulk")(endpoint()(handler))
+            requiredata()(ep)
+            return ep
         elif name == "updateOne":
             # Create update one endpoint
             ep = patch(path = self.prefix + "/<id>")(endpoint()(handler))
@@ -0,0 +1,130 @@
+# encoding=utf8
+
+""" The model diff
+    Author: lipixun
+    Created Time : 六 10/17 15:02:37 2026
+
+    File Name: diff.py
+    Description:
+
+        Compare two models of the same class and generate the update actions which turn the old model into the new one.
+        The values are compared by the equals / isEmpty method of the data types, the models, lists and dicts are compared
+        recursively, the values are neither cloned nor dumped unless they're changed.
+
+"""
+
+from datahub.model import DataModel, DumpContext, ListType, DictType
+from datahub.model.spec import FILEDS_NAME
+from datahub.errors import FieldNotDumpError
+from datahub.updates import SetAction, ClearAction, PushsAction
+
+def diff(old, new, context = None, prefix = None):
+    """Get the update actions from the old model to the new model
+    Parameters:
+        old                                 The old model
+        new                                 The new model
+        context                             The DumpContext object to dump the changed values
+        prefix                              The prefix of the update keys
+    Returns:
+        A list of UpdateAction (SetAction, ClearAction and PushsAction)
+    """
+    if type(old) is not type(new):
+        raise TypeError('Cannot diff models of different classes [%s] and [%s]' % (type(old).__name__, type(new).__name__))
+    updates = []
+    diffModel(old, new, context or DumpContext.getDefault(), prefix, updates)
+    return updates
+
+def diffModel(old, new, context, prefix, updates):
+    """Diff two models of the same class and add the update actions to updates
+    """
+    for name, field in getattr(type(new), FILEDS_NAME).iteritems():
+        key = prefix + name if prefix else name
+        oldValue = old.__getvalue__(name) if old.__existvalue__(name) else None
+        newValue = new.__getvalue__(name) if new.__existvalue__(name) else None
+        diffValue(field, key, oldValue, newValue, new, context, updates)
+
+def diffValue(t, key, oldValue, newValue, model, context, updates):
+    """Diff two values of the data type and add the update actions to updates
+    Parameters:
+        t                                   The data type
+        key                                 The update key of the value
+        oldValue                            The old value
+        newValue                            The new value
+        model                               The model of the new value
+        context                             The DumpContext object
+        updates                             The list of UpdateAction
+    """
+    if oldValue is newValue:
+        return
+    # Check empty
+    oldEmpty, newEmpty = t.isEmpty(oldValue), t.isEmpty(newValue)
+    if newEmpty:
+        if not oldEmpty:
+            updates.append(ClearAction(key = key))
+        return
+    if not oldEmpty:
+        # Compare recursively
+        if isinstance(oldValue, DataModel) and type(oldValue) is type(newValue):
+            diffModel(oldValue, newValue, context, key + '.', updates)
+            return
+        elif isinstance(t, ListType) and isinstance(oldValue, list) and isinstance(newValue, list):
+            if diffList(t, key, oldValue, newValue, model, context, updates):
+                return
+        elif isinstance(t, DictType) and isinstance(oldValue, dict) and isinstance(newValue, dict):
+            if diffDict(t, key, oldValue, newValue, model, context, updates):
+                return
+        elif t.equals(oldValue, newValue):
+            return
+    # Set the new value
+    setValue(t, key, newValue, model, context, updates)
+
+def diffList(t, key, oldValue, newValue, model, context, updates):
+    """Diff two lists
+    Returns:
+        True if the update actions are generated, False if the list should be set as a whole
+    """
+    itemType = t.itemType
+    if len(newValue) > len(oldValue):
+        # Check if the new items are appended to the old items
+        for oldItem, newItem in zip(oldValue, newValue):
+            if not oldItem is newItem and not itemType.equals(oldItem, newItem):
+                return False
+        try:
+            values = [ itemType.dump(x, model, {}, context) for x in newValue[len(oldValue): ] ]
+        except FieldNotDumpError:
+            return False
+        updates.append(PushsAction(key = key, values = values))
+        return True
+    elif len(newValue) == len(oldValue):
+        # Diff the items one by one
+        for index, (oldItem, newItem) in enumerate(zip(oldValue, newValue)):
+            if not oldItem is newItem:
+                diffValue(itemType, '%s.%d' % (key, index), oldItem, newItem, model, context, updates)
+        return True
+    # Some items are removed
+    return False
+
+def diffDict(t, key, oldValue, newValue, model, context, updates):
+    """Diff two dicts
+    Returns:
+        True if the update actions are generated, False if the dict should be set as a whole
+    """
+    # NOTE: The keys which cannot be used in an update key path are not supported
+    for values in (oldValue, newValue):
+        for k in values:
+            if not isinstance(k, basestring) or not k or '.' in k or k.startswith('$'):
+                return False
+    for k, oldItem in oldValue.iteritems():
+        if not k in newValue:
+            updates.append(ClearAction(key = '%s.%s' % (key, k)))
+    for k, newItem in newValue.iteritems():
+        diffValue(t.itemType, '%s.%s' % (key, k), oldValue.get(k), newItem, model, context, updates)
+    return True
+
+def setValue(t, key, value, model, context, updates):
+    """Add the update action which sets the value
+    """
+    try:
+        updates.append(SetAction(key = key, value = t.dump(value, model, {}, context)))
+    except FieldNotDumpError:
+        updates.append(ClearAction(key = key))
@@ -101,6 +101,10 @@ class WatchResetError(DataHubError):
     """The watch is reset (Some untracable changes happened)
     """
 
+class FutureTimeoutError(DataHubError):
+    """The result of the future is not ready in time
+    """
+
 class QueryNotMatchError(DataHubError):
     """The query is not matched
     """
@@ -125,6 +129,10 @@ class DataModelError(DataHubError):
     """
     pass
 
+class FrozenModelError(DataModelError):
+    """The data model is frozen and cannot be changed
+    """
+
 class CompoundDataModelError(DataModelError):
     """The compound data model error
     """
@@ -0,0 +1,221 @@
+# encoding=utf8
+
+""" The futures and the bounded executor
+    Author: lipixun
+    Created Time : 日 10/18 05:47:02 2026
+
+    File Name: futures.py
+    Description:
+
+        The Future is the result of an asynchronous call, which is waited by the result method or observed by the
+        callbacks (Called in the thread which completes the future). The Executor runs the calls in a fixed count of
+        worker threads with a bounded queue, so the count of the threads doesn't grow with the in-flight requests, and
+        the submit blocks when the queue is full.
+
+"""
+
+import sys
+import threading
+
+from Queue import Queue
+
+from datahub.errors import FutureTimeoutError
+
+# The default count of the worker threads
+DEFAULT_WORKERS = 16
+# The default max count of the pending calls
+DEFAULT_MAX_PENDING = 1024
+
+class Future(object):
+    """The result of an asynchronous call
+    """
+    def __init__(self):
+        """Create a new Future
+        """
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def resolved(cls, result):
+        """Create a completed future of the result
+        """
+        future = cls()
+        future.setResult(result)
+        return future
+
+    def done(self):
+        """Check if the future is completed
+        """
+        return self._done.is_set()
+
+    def result(self, timeout = None):
+        """Wait for the result
+        Parameters:
+            timeout                         The seconds to wait, None to wait forever
+        Returns:
+            The result, or raise the error of the call
+        """
+        if not self._done.wait(timeout):
+            raise FutureTimeoutError
+        if self._error:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+    def exception(self, timeout = None):
+        """Wait for the error
+        Returns:
+            The error of the call or None
+        """
+        if not self._done.wait(timeout):
+            raise FutureTimeoutError
+        if self._error:
+            return self._error[1]
+
+    def addCallback(self, callback):
+        """Add a callback, which is called with this future when completed (At once if completed)
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def then(self, method):
+        """Get a future of the method applied to the result, the error is passed through
+        """
+        future = Future()
+        def onDone(done):
+            """Called when done
+            """
+            if done._error:
+                future.setError(done._error)
+            else:
+                try:
+                    future.setResult(method(done._result))
+                except:
+                    future.setError(sys.exc_info())
+        self.addCallback(onDone)
+        return future
+
+    def setResult(self, result):
+        """Complete with the result
+        """
+        self._result = result
+        self._complete()
+
+    def setError(self, excInfo = None):
+        """Complete with the error
+        Parameters:
+            excInfo                         The exc_info of the error, the current one by default
+        """
+        self._error = excInfo or sys.exc_info()
+        self._complete()
+
+    def _complete(self):
+        """Complete and call the callbacks
+        """
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+def gather(futures):
+    """Gather the results of the futures
+    Returns:
+        The Future object of the list of the results in order, or the first error of the futures
+    """
+    futures = list(futures)
+    gathered = Future()
+    results = [ None ] * len(futures)
+    state = { 'left': len(futures), 'failed': False }
+    lock = threading.Lock()
+    def onDone(index, future):
+        """Called when a future is done
+        """
+        with lock:
+            if state['failed']:
+                return
+            if future._error:
+                state['failed'] = True
+            else:
+                results[index] = future._result
+                state['left'] -= 1
+            done = state['failed'] or not state['left']
+        if done:
+            if future._error:
+                gathered.setError(future._error)
+            else:
+                gathered.setResult(results)
+    if not futures:
+        gathered.setResult(results)
+    for index, future in enumerate(futures):
+        future.addCallback(lambda x, index = index: onDone(index, x))
+    return gathered
+
+class Executor(object):
+    """The executor with a fixed count of worker threads and a bounded queue
+    Attributes:
+        workers                             The count of the worker threads
+        maxPending                          The max count of the pending calls
+    """
+    def __init__(self, workers = DEFAULT_WORKERS, maxPending = DEFAULT_MAX_PENDING):
+        """Create a new Executor
+        """
+        self.workers = workers
+        self.maxPending = maxPending
+        self.queue = Queue(maxPending)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, method, *args, **kwargs):
+        """Submit a call, blocked if the queue is full
+        Returns:
+            The Future object
+        """
+        with self.lock:
+            if len(self.threads) < self.workers:
+                # Start the workers lazily
+                thread = threading.Thread(target = self.run)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        future = Future()
+        self.queue.put((future, method, args, kwargs))
+        return future
+
+    def run(self):
+        """Run the calls
+        """
+        while True:
+            call = self.queue.get()
+            if call is None:
+                break
+            future, method, args, kwargs = call
+            try:
+                result = method(*args, **kwargs)
+            except:
+                future.setError(sys.exc_info())
+            else:
+                future.setResult(result)
+
+    def shutdown(self, wait = True):
+        """Stop the workers after the pending calls
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for _ in threads:
+            self.queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return { 'workers': len(self.threads), 'pending': self.queue.qsize() }
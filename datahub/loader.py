@@ -0,0 +1,194 @@
+# encoding=utf8
+
+""" The batching model loader
+    Author: lipixun
+    Created Time : 日 10/18 04:31:50 2026
+
+    File Name: loader.py
+    Description:
+
+        Reading the related models one by one in a loop costs a round trip for each model (The N+1 problem). The
+        ModelLoader collects the loads by id and reads them by ids in one call (One $in query of the mongodb data
+        storage), then fans the results out to the callers:
+
+            loader = ModelLoader.forDataService(service)
+            with loader.batch():
+                handles = [ loader.load(x.ownerID) for x in orders ]
+            owners = [ x.get() for x in handles ]
+
+        The pending loads are read when the outermost batch context exits, or when the value of a pending load is
+        required (So the loader could be used without the batch context, the loads before the first get are batched).
+        The ids are deduplicated and the loaded models are kept by the loader, so a loader is expected to be used in
+        the scope of a request, and the same model object is returned for the same id.
+
+"""
+
+import threading
+
+from contextlib import contextmanager
+
+# The default max count of the ids read in one call
+DEFAULT_MAX_BATCH_SIZE = 1000
+
+class LoadHandle(object):
+    """The handle of a load
+    Attributes:
+        loader                              The ModelLoader object
+        id                                  The model id
+        exist                               The value is the existence of the model instead of the model
+    """
+    __slots__ = ('loader', 'id', 'exist')
+
+    def __init__(self, loader, id, exist = False):
+        """Create a new LoadHandle
+        """
+        self.loader = loader
+        self.id = id
+        self.exist = exist
+
+    def get(self):
+        """Get the value, the pending loads are read if this one is not read yet
+        Returns:
+            The model object or None if not found (True / False for the exist loads)
+        """
+        model = self.loader.resolve(self.id)
+        return model is not None if self.exist else model
+
+class ModelLoader(object):
+    """The batching model loader
+    Attributes:
+        getMany                             The method: (ids) returns the iterable of the found models
+        maxBatchSize                        The max count of the ids read in one call
+        models                              The read models (None if not found) by id
+        pending                             The ids to read in order
+        batches                             The count of the calls of getMany
+    """
+    def __init__(self, getMany, maxBatchSize = DEFAULT_MAX_BATCH_SIZE):
+        """Create a new ModelLoader
+        """
+        self.getMany = getMany
+        self.maxBatchSize = maxBatchSize or DEFAULT_MAX_BATCH_SIZE
+        self.models = {}
+        self.pending = []
+        self.pendingIDs = set()
+        self.batches = 0
+        self.depth = 0
+        self.lock = threading.RLock()
+
+    @classmethod
+    def forRepository(cls, repository, configs = None, maxBatchSize = DEFAULT_MAX_BATCH_SIZE):
+        """Create a ModelLoader which reads by Repository.get
+        """
+        return cls(lambda ids: repository.get(ids, configs = configs), maxBatchSize)
+
+    @classmethod
+    def forDataService(cls, service, maxBatchSize = DEFAULT_MAX_BATCH_SIZE, **ctx):
+        """Create a ModelLoader which reads by DataServiceInterface.gets
+        """
+        return cls(lambda ids: service.gets(ids, **ctx), maxBatchSize)
+
+    @contextmanager
+    def batch(self):
+        """The batch context, the loads in the context are read when the outermost context exits
+        """
+        with self.lock:
+            self.depth += 1
+        try:
+            yield self
+        except:
+            with self.lock:
+                self.depth -= 1
+            raise
+        with self.lock:
+            self.depth -= 1
+            if not self.depth:
+                self.flush()
+
+    def load(self, id):
+        """Load a model by id
+        Returns:
+            The LoadHandle object
+        """
+        with self.lock:
+            if not id in self.models and not id in self.pendingIDs:
+                self.pending.append(id)
+                self.pendingIDs.add(id)
+        return LoadHandle(self, id)
+
+    def loadExist(self, id):
+        """Load the existence of a model by id (The model is read with the other loads)
+        Returns:
+            The LoadHandle object
+        """
+        handle = self.load(id)
+        handle.exist = True
+        return handle
+
+    def loadMany(self, ids):
+        """Load the models by ids
+        Returns:
+            A list of LoadHandle objects
+        """
+        return [ self.load(x) for x in ids ]
+
+    def getOne(self, id):
+        """Get a model by id, the pending loads are read with it
+        Returns:
+            The model object or None
+        """
+        return self.load(id).get()
+
+    def exist(self, id):
+        """Check if a model exists, the pending loads are read with it
+        Returns:
+            True / False
+        """
+        return self.loadExist(id).get()
+
+    def gets(self, ids):
+        """Get the models by ids, the pending loads are read with them
+        Returns:
+            A list of the model objects (None if not found) in the order of the ids
+        """
+        return [ x.get() for x in self.loadMany(ids) ]
+
+    def resolve(self, id):
+        """Get the read model of id, the pending loads are read if the id is not read yet
+        Returns:
+            The model object or None
+        """
+        with self.lock:
+            if not id in self.models:
+                if not id in self.pendingIDs:
+                    self.pending.append(id)
+                    self.pendingIDs.add(id)
+                self.flush()
+            return self.models[id]
+
+    def flush(self):
+        """Read the pending loads
+        """
+        with self.lock:
+            while self.pending:
+                ids, self.pending = self.pending[: self.maxBatchSize], self.pending[self.maxBatchSize: ]
+                self.batches += 1
+                try:
+                    models = list(self.getMany(ids) or [])
+                except:
+                    # The failed loads are not kept, they could be loaded again
+                    self.pending, self.pendingIDs = [], set()
+                    raise
+                for model in models:
+                    self.models[model.id] = model
+                for id in ids:
+                    self.models.setdefault(id, None)
+                    self.pendingIDs.discard(id)
+
+    def clear(self, id = None):
+        """Clear the read model of id or all read models
+        """
+        with self.lock:
+            if id is None:
+                self.models.clear()
+            else:
+                self.models.pop(id, None)
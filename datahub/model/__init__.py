@@ -9,7 +9,7 @@
 
 """
 
-from spec import nullValue, ModelMetadata, DumpContext, IndexAttr, ExpireAttr
+from spec import nullValue, ModelMetadata, DumpContext, LoadContext, IndexAttr, ExpireAttr
 from models import randomID, DataModel, IDDataModel
 from _types import DataType, StringType, IntegerType, FloatType, BooleanType, DatetimeType, DateType, TimeType, TimeDeltaType, \
     ListType, SetType, DictType, ModelType, DynamicModelType, AnyType
@@ -38,7 +38,7 @@ def metaattr(attr):
     return decorator
 
 __all__ = [
-    'nullValue', 'ModelMetadata', 'DumpContext', 'IndexAttr', 'ExpireAttr',
+    'nullValue', 'ModelMetadata', 'DumpContext', 'LoadContext', 'IndexAttr', 'ExpireAttr',
     'DataModel', 'IDDataModel',
     'DataType', 'StringType', 'IntegerType', 'FloatType', 'BooleanType', 'DatetimeType', 'DateType', 'TimeType', 'TimeDeltaType',
     'ListType', 'SetType', 'DictType', 'ModelType', 'DynamicModelType', 'AnyType',
@@ -0,0 +1,97 @@
+# encoding=utf8
+
+""" The canonical form
+    Author: lipixun
+    Created Time : 六 10/17 19:40:12 2026
+
+    File Name: _canonical.py
+    Description:
+
+        The canonical form of a value is a hashable object which is equal for the equal values, it could be used as the
+        key of a dict (For example, the key of a cache). The rules are:
+
+            - A str is decoded to unicode (If it's utf8), so 'a' and u'a' have the same canonical form
+            - A bool / float / long is tagged, so True, 1, 1.0 and 1L have different canonical forms (They're stored
+              as the different bson types)
+            - A dict / list / set is converted to a tagged tuple, the items of a dict / set are sorted
+            - A data model is converted to its own canonical form (See DataModel.canonical)
+
+        The fingerprint is the sha1 hex digest of the repr of the canonical form, which is stable across processes.
+
+"""
+
+import hashlib
+
+from sets import Set
+
+from spec import *
+
+# The tags of the canonical forms
+BOOL_TAG    = '?'
+FLOAT_TAG   = '.'
+LONG_TAG    = 'L'
+DICT_TAG    = '{'
+LIST_TAG    = '['
+SET_TAG     = '<'
+OBJECT_TAG  = '*'
+
+# The types of which the canonical form is the value itself
+PLAIN_TYPES = (unicode, int, type(None))
+
+def canonicalValue(value):
+    """Get the canonical form of the value
+    """
+    t = type(value)
+    # Check the most common types of the payloads first
+    if t is dict:
+        return (DICT_TAG, tuple(sorted([ (canonicalValue(k), canonicalValue(v)) for k, v in value.iteritems() ])))
+    elif t is list:
+        return (LIST_TAG, tuple([ canonicalValue(x) for x in value ]))
+    elif t in PLAIN_TYPES:
+        return value
+    elif t is str:
+        try:
+            return value.decode('utf8')
+        except UnicodeDecodeError:
+            return value
+    elif t is bool:
+        return (BOOL_TAG, value)
+    elif t is float:
+        return (FLOAT_TAG, value)
+    elif t is long:
+        return (LONG_TAG, value)
+    elif hasattr(t, FILEDS_NAME):
+        return value.canonical()
+    elif isinstance(value, dict):
+        return (DICT_TAG, tuple(sorted((canonicalValue(k), canonicalValue(v)) for k, v in value.iteritems())))
+    elif isinstance(value, (list, tuple)):
+        return (LIST_TAG, tuple(canonicalValue(x) for x in value))
+    elif isinstance(value, (set, frozenset, Set)):
+        return (SET_TAG, tuple(sorted(canonicalValue(x) for x in value)))
+    try:
+        hash(value)
+    except TypeError:
+        # An unhashable object
+        return (OBJECT_TAG, t.__name__, repr(value))
+    return value
+
+def canonicalModel(model, names = None):
+    """Get the canonical form of the model
+    Parameters:
+        model                               The data model object
+        names                               The field names to include, all fields by default
+    Returns:
+        A tuple: (class name, ((field name, canonical value), ...)) sorted by the field names
+    """
+    values = []
+    for name in sorted(names or getattr(type(model), FILEDS_NAME)):
+        if model.__existvalue__(name):
+            values.append((name, canonicalValue(model.__getvalue__(name))))
+    return (type(model).__name__, tuple(values))
+
+def fingerprint(canonical):
+    """Get the fingerprint of the canonical form
+    Returns:
+        The sha1 hex digest string
+    """
+    return hashlib.sha1(repr(canonical)).hexdigest()
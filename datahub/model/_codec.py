@@ -0,0 +1,256 @@
+# encoding=utf8
+
+""" The compiled model codec
+    Author: lipixun
+    Created Time : 六 10/17 10:12:35 2026
+
+    File Name: _codec.py
+    Description:
+
+        The codec generates a specialized load and dump function for each data model class. The field order, the
+        loader / dumper choice, the default values and the dumpWhenEmpty flags are resolved once at compile time
+        instead of being looked up field by field on every call.
+
+"""
+
+from datetime import datetime, date, time, timedelta
+
+from datahub.errors import FieldNotDumpError, CompoundDataModelError, UnknownFieldError, MissingRequiredFieldError, \
+    ChoiceValidationError, TypeValidationError
+
+from spec import *
+from _store import MISSING
+from _types import DataType, StringType, IntegerType, FloatType, BooleanType, DatetimeType, DateType, TimeType, TimeDeltaType
+
+# The value types checked by the validation method of the builtin scalar data types, the check is inlined into the generated code
+SCALAR_VALUE_TYPES = {
+    StringType:     basestring,
+    IntegerType:    (int, long),
+    FloatType:      float,
+    BooleanType:    bool,
+    DatetimeType:   datetime,
+    DateType:       date,
+    TimeType:       time,
+    TimeDeltaType:  timedelta,
+}
+
+def isDefaultMethod(t, name):
+    """Check if the method of the data type is the one defined by DataType
+    """
+    return getattr(type(t), name).im_func is getattr(DataType, name).im_func
+
+class ModelCodec(object):
+    """The compiled load / dump functions of a data model class
+    Attributes:
+        cls                                 The data model class
+        metadata                            The metadata which the codec is compiled with
+        strict                              The strict flag of the metadata which the codec is compiled with
+        compact                             Whether the codec works on the compact store (See _store.py)
+        generation                          The DataType generation which the codec is compiled with
+        source                              The generated source code
+        load                                The method: (model, store, container, continueOnError)
+        loadTrusted                         The method: (model, store, container, continueOnError) which skips the validation
+        dump                                The method: (model, store, context)
+    """
+    def __init__(self, cls, metadata):
+        """Create a new ModelCodec
+        """
+        self.cls = cls
+        self.metadata = metadata
+        self.strict = metadata.strict
+        self.compact = metadata.compact
+        self.generation = DataType.generation
+        # Generate the source
+        fields = getattr(cls, FILEDS_NAME)
+        self.indexes = cls.getStoreClass().INDEXES if self.compact else None
+        namespace = {
+            'FIELDS': fields,
+            'MISSING': MISSING,
+            'GET': list.__getitem__,
+            'SET': list.__setitem__,
+            'FieldNotDumpError': FieldNotDumpError,
+            'CompoundDataModelError': CompoundDataModelError,
+            'UnknownFieldError': UnknownFieldError,
+            'MissingRequiredFieldError': MissingRequiredFieldError,
+            'ChoiceValidationError': ChoiceValidationError,
+            'TypeValidationError': TypeValidationError,
+            }
+        lines = []
+        items = fields.items()
+        self.__generateload__('load', items, namespace, lines, False)
+        self.__generateload__('loadTrusted', items, namespace, lines, True)
+        self.__generatedump__(items, namespace, lines)
+        self.source = '\n'.join(lines) + '\n'
+        # Compile
+        exec compile(self.source, '<datahub codec of %s>' % cls.__name__, 'exec') in namespace
+        self.load = namespace['load']
+        self.loadTrusted = namespace['loadTrusted']
+        self.dump = namespace['dump']
+
+    def __generateloadvalue__(self, index, t, source, namespace, lines, indent, trusted):
+        """Generate the code which loads the value from source and assigns it to the variable [value]
+        """
+        if not isDefaultMethod(t, 'load'):
+            # The load method is overwritten, call it directly
+            lines.append('%svalue = t%d.load(%s, model, container)' % (indent, index, source))
+            return
+        # Load
+        if t._loader:
+            namespace['l%d' % index] = t._loader
+            lines.append('%svalue = l%d(t%d, %s, model, container)' % (indent, index, index, source))
+        elif not isDefaultMethod(t, '__loadvalue__'):
+            namespace['l%d' % index] = t.__loadvalue__
+            lines.append('%svalue = l%d(%s, model, container)' % (indent, index, source))
+        else:
+            lines.append('%svalue = %s' % (indent, source))
+        # Validate
+        if trusted:
+            return
+        if not isDefaultMethod(t, 'validate'):
+            lines.append('%st%d.validate(value, required = False)' % (indent, index))
+            return
+        if t.choices:
+            namespace['c%d' % index] = t.choices
+            lines.append('%sif not %s and not value in c%d:' % (indent, self.__isempty__(index, t, 'value', namespace), index))
+            lines.append('%s    raise ChoiceValidationError(value, c%d)' % (indent, index))
+        if t._validator:
+            namespace['x%d' % index] = t._validator
+            lines.append('%sx%d(t%d, value, False, False)' % (indent, index, index))
+        elif type(t) in SCALAR_VALUE_TYPES:
+            namespace['v%d' % index] = SCALAR_VALUE_TYPES[type(t)]
+            lines.append('%sif not %s and not isinstance(value, v%d):' % (indent, self.__isempty__(index, t, 'value', namespace), index))
+            lines.append('%s    raise TypeValidationError(v%d, type(value), value)' % (indent, index))
+        elif not isDefaultMethod(t, '__validatevalue__'):
+            namespace['x%d' % index] = t.__validatevalue__
+            lines.append('%sx%d(value, False, False)' % (indent, index))
+
+    def __exists__(self, key):
+        """Get the expression which tells if the value of key exists in the store
+        """
+        if self.compact:
+            return 'GET(store, %d) is not MISSING' % self.indexes[key]
+        return '%r in store' % key
+
+    def __getstore__(self, key):
+        """Get the expression which gets the value of key from the store
+        """
+        if self.compact:
+            return 'GET(store, %d)' % self.indexes[key]
+        return 'store[%r]' % key
+
+    def __setstore__(self, key, value):
+        """Get the statement which sets the value of key to the store
+        """
+        if self.compact:
+            return 'SET(store, %d, %s)' % (self.indexes[key], value)
+        return 'store[%r] = %s' % (key, value)
+
+    def __isempty__(self, index, t, name, namespace):
+        """Get the expression which tells if the value is empty
+        """
+        if isDefaultMethod(t, 'isEmpty'):
+            return '%s is None' % name
+        elif type(t) is StringType:
+            return "(%s is None or %s == '')" % (name, name)
+        namespace['e%d' % index] = t.isEmpty
+        return 'e%d(%s)' % (index, name)
+
+    def __generateload__(self, name, items, namespace, lines, trusted):
+        """Generate the load method
+        Parameters:
+            name                            The method name
+            trusted                         Generate the method which loads from a trusted source (No validation)
+        """
+        lines.append('def %s(model, store, container, continueOnError):' % name)
+        lines.append('    errors = []')
+        lines.append('    matched = 0')
+        # Load the values
+        for index, (key, t) in enumerate(items):
+            namespace['t%d' % index] = t
+            lines.append('    if %r in container:' % key)
+            lines.append('        matched += 1')
+            lines.append('        try:')
+            self.__generateloadvalue__(index, t, 'container[%r]' % key, namespace, lines, ' ' * 12, trusted)
+            lines.append('            %s' % self.__setstore__(key, 'value'))
+            lines.append('        except Exception as error:')
+            lines.append('            if not continueOnError:')
+            lines.append('                raise')
+            lines.append('            errors.append(error)')
+        # Check the unknown fields
+        lines.append('    if matched != len(container):')
+        lines.append('        for key in container:')
+        lines.append('            if not key in FIELDS:')
+        lines.append('                if not continueOnError:')
+        lines.append('                    raise UnknownFieldError(key)')
+        lines.append('                errors.append(UnknownFieldError(key))')
+        # Set the defaults
+        for index, (key, t) in enumerate(items):
+            if not t.hasDefault():
+                continue
+            namespace['d%d' % index] = t.default
+            lines.append('    if not (%s):' % self.__exists__(key))
+            lines.append('        try:')
+            self.__generateloadvalue__(index, t, 'd%d()' % index if callable(t.default) else 'd%d' % index, namespace, lines, ' ' * 12, trusted)
+            lines.append('            %s' % self.__setstore__(key, 'value'))
+            lines.append('        except Exception as error:')
+            lines.append('            if not continueOnError:')
+            lines.append('                raise')
+            lines.append('            errors.append(error)')
+        # Check the required fields
+        if self.strict and not trusted:
+            requiredItems = [ (index, key, t) for index, (key, t) in enumerate(items) if t.required ]
+            if requiredItems:
+                lines.append('    try:')
+                for index, key, t in requiredItems:
+                    lines.append('        if not (%s) or %s:' % (self.__exists__(key), self.__isempty__(index, t, self.__getstore__(key), namespace)))
+                    lines.append('            raise MissingRequiredFieldError(%r)' % key)
+                lines.append('    except Exception as error:')
+                lines.append('        if not continueOnError:')
+                lines.append('            raise')
+                lines.append('        errors.append(error)')
+        # Check errors
+        lines.append('    if errors:')
+        lines.append('        if len(errors) == 1:')
+        lines.append('            raise errors[0]')
+        lines.append('        raise CompoundDataModelError(errors, %r)' % ('Failed to initialize model (%s)' % self.cls.__name__))
+        lines.append('')
+
+    def __generatedump__(self, items, namespace, lines):
+        """Generate the dump method
+        """
+        lines.append('def dump(model, store, context):')
+        lines.append('    container = {}')
+        for index, (key, t) in enumerate(items):
+            if self.compact:
+                lines.append('    value = %s' % self.__getstore__(key))
+                lines.append('    if not value is MISSING:')
+            else:
+                lines.append('    if %r in store:' % key)
+                lines.append('        value = store[%r]' % key)
+            indent = ' ' * 8
+            if not isDefaultMethod(t, 'dump'):
+                # The dump method is overwritten, call it directly
+                lines.append('        try:')
+                lines.append('            container[%r] = t%d.dump(value, model, container, context)' % (key, index))
+                lines.append('        except FieldNotDumpError:')
+                lines.append('            pass')
+                continue
+            if not t.dumpWhenEmpty:
+                lines.append('        if not %s:' % self.__isempty__(index, t, 'value', namespace))
+                indent = ' ' * 12
+            if t._dumper:
+                namespace['p%d' % index] = t._dumper
+                call = 'p%d(t%d, value, model, container, context)' % (index, index)
+            elif not isDefaultMethod(t, '__dumpvalue__'):
+                namespace['p%d' % index] = t.__dumpvalue__
+                call = 'p%d(value, model, container, context)' % index
+            else:
+                # The value is dumped as it is
+                lines.append('%scontainer[%r] = value' % (indent, key))
+                continue
+            lines.append('%stry:' % indent)
+            lines.append('%s    container[%r] = %s' % (indent, key, call))
+            lines.append('%sexcept FieldNotDumpError:' % indent)
+            lines.append('%s    pass' % indent)
+        lines.append('    return container')
+        lines.append('')
@@ -0,0 +1,85 @@
+# encoding=utf8
+
+""" The frozen values
+    Author: lipixun
+    Created Time : 六 10/17 20:52:30 2026
+
+    File Name: _frozen.py
+    Description:
+
+        A frozen data model (See DataModel.freeze) cannot be changed, so it could be shared between requests and threads,
+        for example, the parsed conditions in the parse cache. The lists and dicts in the frozen model are replaced by
+        FrozenList and FrozenDict which raise FrozenModelError when changed. The copies of them (By copy / deepcopy or
+        the clone method of the data types) are normal lists and dicts.
+
+"""
+
+from copy import deepcopy
+
+from datahub.errors import FrozenModelError
+
+from spec import *
+
+def frozen(*args, **kwargs):
+    """The method which changes a frozen value
+    """
+    raise FrozenModelError
+
+class FrozenList(list):
+    """The frozen list
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = frozen
+    append = extend = insert = pop = remove = reverse = sort = frozen
+
+    def __copy__(self):
+        """Copy as a normal list
+        """
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        """Deep copy as a normal list
+        """
+        return [ deepcopy(x, memo) for x in self ]
+
+    def __reduce__(self):
+        """Pickle as a normal list
+        """
+        return (list, (list(self), ))
+
+class FrozenDict(dict):
+    """The frozen dict
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = frozen
+    clear = pop = popitem = setdefault = update = frozen
+
+    def __copy__(self):
+        """Copy as a normal dict
+        """
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        """Deep copy as a normal dict
+        """
+        return dict((deepcopy(k, memo), deepcopy(v, memo)) for k, v in self.iteritems())
+
+    def __reduce__(self):
+        """Pickle as a normal dict
+        """
+        return (dict, (dict(self), ))
+
+def freezeValue(value):
+    """Freeze the value
+    Returns:
+        The frozen value
+    """
+    if hasattr(type(value), FILEDS_NAME):
+        return value.freeze()
+    elif isinstance(value, list) and not isinstance(value, FrozenList):
+        return FrozenList(freezeValue(x) for x in value)
+    elif isinstance(value, dict) and not isinstance(value, FrozenDict):
+        return FrozenDict((k, freezeValue(v)) for k, v in value.iteritems())
+    return value
@@ -0,0 +1,198 @@
+# encoding=utf8
+
+""" The lazy model store
+    Author: lipixun
+    Created Time : 六 10/17 13:20:46 2026
+
+    File Name: _lazy.py
+    Description:
+
+        The lazy store keeps the raw values of a model and decodes a field only when it is accessed the first time.
+        The raw values which are not decoded yet are dumped as they are if the field type is a passthrough type
+        (See isPassthrough), so the raw values are expected to be in the dumped form, for example, the documents
+        written by the repository.
+
+"""
+
+from spec import *
+from _types import DataType, StringType, IntegerType, FloatType, BooleanType, AnyType, ListType, SetType, DictType, ModelType
+
+# The scalar data types of which the dumped value is the raw value itself
+PASSTHROUGH_SCALAR_TYPES = (StringType, IntegerType, FloatType, BooleanType, AnyType)
+# The container data types of which the dumped value is the raw value itself when the item type is a passthrough type
+PASSTHROUGH_CONTAINER_TYPES = (ListType, SetType, DictType)
+
+# The cached passthrough flags, key is the id of the data type, value is (DataType generation, data type, flag)
+PASSTHROUGH_FLAGS = {}
+
+def isPassthrough(t, visiting = None):
+    """Tell if the dumped value of the data type is always the raw value which it's loaded from
+    Parameters:
+        t                                   The data type
+        visiting                            The model classes being checked (To break the recursive model definitions)
+    Returns:
+        True / False
+    """
+    cached = PASSTHROUGH_FLAGS.get(id(t))
+    if cached and cached[0] == DataType.generation and cached[1] is t:
+        return cached[2]
+    # Check
+    if t._loader or t._dumper or t.dumpWhenEmpty:
+        flag = False
+    elif type(t) in PASSTHROUGH_SCALAR_TYPES:
+        flag = True
+    elif type(t) in PASSTHROUGH_CONTAINER_TYPES:
+        flag = isPassthrough(t.itemType, visiting)
+    elif type(t) is ModelType:
+        visiting = visiting or set()
+        if t.cls in visiting:
+            # Recursive model definition, check it by the other fields
+            return True
+        visiting.add(t.cls)
+        # NOTE: The defaults are applied when the model is loaded which cannot be passed through
+        flag = all(isPassthrough(field, visiting) and not field.hasDefault() for field in getattr(t.cls, FILEDS_NAME).itervalues())
+        visiting.remove(t.cls)
+        if visiting:
+            # The flag depends on the checking result of the outer models, do not cache it
+            return flag
+    else:
+        flag = False
+    # Cache and return
+    PASSTHROUGH_FLAGS[id(t)] = (DataType.generation, t, flag)
+    return flag
+
+class LazyStore(dict):
+    """The lazy store
+    Attributes:
+        model                               The model object
+        container                           The raw values of the model
+        pending                             The raw values which are not decoded yet
+        context                             The LoadContext which is entered when decoding the values
+    """
+    __slots__ = ('model', 'container', 'pending', 'context')
+
+    def __init__(self, model, container, pending, context):
+        """Create a new LazyStore
+        """
+        dict.__init__(self)
+        self.model = model
+        self.container = container
+        self.pending = pending
+        self.context = context
+
+    def decode(self, key):
+        """Decode the pending raw value of key
+        """
+        field = getattr(type(self.model), FILEDS_NAME)[key]
+        with self.context:
+            value = field.load(self.pending.pop(key), self.model, self.container)
+        dict.__setitem__(self, key, value)
+        # Add the decoded value to the snapshot of the model if tracking is enabled
+        origin = self.model.__dict__.get(ORIGIN_NAME)
+        if origin is not None:
+            origin[key] = field.clone(value)
+
+    def decodeAll(self):
+        """Decode all the pending raw values
+        """
+        for key in self.pending.keys():
+            self.decode(key)
+
+    def splitForDump(self):
+        """Decode the pending raw values which cannot be passed through when dumping
+        Returns:
+            (The dict of the decoded values, The dict of the raw values which are passed through)
+        """
+        fields = getattr(type(self.model), FILEDS_NAME)
+        passthrough = {}
+        for key, value in self.pending.items():
+            field = fields[key]
+            if not isPassthrough(field):
+                self.decode(key)
+            elif not field.isEmpty(value):
+                passthrough[key] = value
+        # NOTE: dict.copy returns the values which are decoded only
+        return dict.copy(self), passthrough
+
+    def __contains__(self, key):
+        """Check if the value of key exists
+        """
+        return dict.__contains__(self, key) or key in self.pending
+
+    def __getitem__(self, key):
+        """Get the value of key
+        """
+        if key in self.pending:
+            self.decode(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        """Set the value of key
+        """
+        self.pending.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        """Delete the value of key
+        """
+        if self.pending.pop(key, nullValue) is nullValue:
+            dict.__delitem__(self, key)
+
+    def __iter__(self):
+        """Iterate the keys
+        """
+        self.decodeAll()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        """Get the count of the values
+        """
+        return dict.__len__(self) + len(self.pending)
+
+    def get(self, key, default = None):
+        """Get the value of key, return default if not exists
+        """
+        return self[key] if key in self else default
+
+    def pop(self, key, *args):
+        """Pop the value of key
+        """
+        if key in self.pending:
+            self.decode(key)
+        return dict.pop(self, key, *args)
+
+    def keys(self):
+        """Get the keys
+        """
+        self.decodeAll()
+        return dict.keys(self)
+
+    def values(self):
+        """Get the values
+        """
+        self.decodeAll()
+        return dict.values(self)
+
+    def items(self):
+        """Get the (key, value) of the values
+        """
+        self.decodeAll()
+        return dict.items(self)
+
+    def iterkeys(self):
+        """Iterate the keys
+        """
+        self.decodeAll()
+        return dict.iterkeys(self)
+
+    def itervalues(self):
+        """Iterate the values
+        """
+        self.decodeAll()
+        return dict.itervalues(self)
+
+    def iteritems(self):
+        """Iterate the (key, value) of the values
+        """
+        self.decodeAll()
+        return dict.iteritems(self)
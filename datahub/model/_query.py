@@ -0,0 +1,160 @@
+# encoding=utf8
+
+""" The compiled query path
+    Author: lipixun
+    Created Time : 六 10/17 15:48:21 2026
+
+    File Name: _query.py
+    Description:
+
+        A query path (A dotted key, for example: listType.stringType) is compiled against the field types of a data model
+        class into a chain of getters once, and cached in the class. The getters return a list of the matched values
+        instead of a chain of generators.
+
+"""
+
+from datahub.errors import UnqueryableValueError
+
+from spec import *
+from _types import DataType, ListType, SetType, DictType, ModelType, DynamicModelType, AnyType
+
+# The max count of the cached query paths of a data model class
+MAX_CACHED_QUERY_PATHS = 1024
+
+def noValues(value):
+    """The getter which matches nothing
+    """
+    return []
+
+def isDefaultQuery(t):
+    """Check if the query method of the data type is the one defined by DataType (Which matches nothing)
+    """
+    return type(t).query.im_func is DataType.query.im_func
+
+class QueryPath(object):
+    """The compiled query path
+    Attributes:
+        cls                                 The data model class
+        path                                The query path
+        getter                              The method: (model) returns the list of the matched values
+    """
+    def __init__(self, cls, path):
+        """Create a new QueryPath
+        """
+        self.cls = cls
+        self.path = path
+        self.getter = self.compileModel(cls, path.split('.'))
+
+    def query(self, model):
+        """Query the model
+        Returns:
+            A list of values
+        """
+        return self.getter(model)
+
+    @classmethod
+    def get(cls, modelCls, path):
+        """Get the compiled query path of the data model class (Compiled and cached if not found)
+        """
+        paths = modelCls.__dict__.get(QUERY_PATHS_NAME)
+        if paths is None:
+            paths = {}
+            setattr(modelCls, QUERY_PATHS_NAME, paths)
+        queryPath = paths.get(path)
+        if queryPath is None:
+            if len(paths) >= MAX_CACHED_QUERY_PATHS:
+                paths.clear()
+            queryPath = cls(modelCls, path)
+            paths[path] = queryPath
+        return queryPath
+
+    def compileModel(self, modelCls, parts):
+        """Compile the getter of the model
+        """
+        fields = getattr(modelCls, FILEDS_NAME)
+        name = parts[0]
+        if not name in fields:
+            return noValues
+        t = fields[name]
+        if len(parts) == 1:
+            def getter(model):
+                """Get the value of the field
+                """
+                store = getattr(model, STORE_NAME)
+                return [ store[name] ] if name in store else []
+        else:
+            nextGetter = self.compileType(t, parts[1: ])
+            def getter(model):
+                """Get the value of the field and query the value
+                """
+                store = getattr(model, STORE_NAME)
+                return nextGetter(store[name]) if name in store else []
+        return getter
+
+    def compileType(self, t, parts):
+        """Compile the getter of the value of the data type
+        """
+        if type(t) in (ListType, SetType):
+            itemGetter = self.compileType(t.itemType, parts)
+            def getter(value):
+                """Query the items
+                """
+                values = []
+                if value:
+                    for item in value:
+                        values.extend(itemGetter(item))
+                return values
+        elif type(t) is DictType:
+            name = parts[0]
+            if len(parts) == 1:
+                def getter(value):
+                    """Get the item
+                    """
+                    return [ value[name] ] if value and name in value else []
+            else:
+                nextGetter = self.compileType(t.itemType, parts[1: ])
+                def getter(value):
+                    """Get the item and query the item
+                    """
+                    return nextGetter(value[name]) if value and name in value else []
+        elif type(t) in (ModelType, DynamicModelType):
+            path = '.'.join(parts)
+            def getter(value):
+                """Query the model
+                """
+                return value.query(path) if value else []
+        elif type(t) is AnyType:
+            getter = self.compileAny(parts)
+        elif isDefaultQuery(t):
+            getter = noValues
+        else:
+            # Unknown data type, query by the data type itself
+            path = '.'.join(parts)
+            def getter(value):
+                """Query by the data type
+                """
+                return list(t.query(value, path))
+        return getter
+
+    def compileAny(self, parts):
+        """Compile the getter of any type of value
+        """
+        name = parts[0]
+        nextGetter = self.compileAny(parts[1: ]) if len(parts) > 1 else None
+        def getter(value):
+            """Query the value
+            """
+            if value is None:
+                return []
+            elif isinstance(value, list):
+                values = []
+                for item in value:
+                    values.extend(getter(item))
+                return values
+            elif isinstance(value, dict):
+                if not name in value:
+                    return []
+                return nextGetter(value[name]) if nextGetter else [ value[name] ]
+            else:
+                raise UnqueryableValueError
+        return getter
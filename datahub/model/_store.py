@@ -0,0 +1,165 @@
+# encoding=utf8
+
+""" The compact model store
+    Author: lipixun
+    Created Time : 六 10/17 11:05:12 2026
+
+    File Name: _store.py
+    Description:
+
+        The compact store keeps the values of a model in a list indexed by the field position instead of a dict,
+        a missing value is represented by the MISSING object. The store class is generated for each data model
+        class (See DataModelMetaClass.newStore) and has no instance dict.
+
+"""
+
+class Missing(object):
+    """The missing value of the compact store
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        """Repr
+        """
+        return '<missing>'
+
+MISSING = Missing()
+
+class CompactStore(list):
+    """The compact store
+    Attributes:
+        INDEXES                             The field name to position dict
+        KEYS                                The field names in position order
+        EMPTY                               The initial values (All missing)
+    """
+    __slots__ = ()
+
+    INDEXES = {}
+    KEYS = ()
+    EMPTY = ()
+
+    def __init__(self):
+        """Create a new CompactStore
+        """
+        list.__init__(self, self.EMPTY)
+
+    def __contains__(self, key):
+        """Check if the value of key exists
+        """
+        index = self.INDEXES.get(key)
+        return index is not None and list.__getitem__(self, index) is not MISSING
+
+    def __getitem__(self, key):
+        """Get the value of key
+        """
+        value = list.__getitem__(self, self.INDEXES[key])
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        """Set the value of key
+        """
+        index = self.INDEXES.get(key)
+        if index is None:
+            raise KeyError(key)
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, key):
+        """Delete the value of key
+        """
+        if self.pop(key, MISSING) is MISSING:
+            raise KeyError(key)
+
+    def __iter__(self):
+        """Iterate the keys of the existing values
+        """
+        return self.iterkeys()
+
+    def __len__(self):
+        """Get the count of the existing values
+        """
+        return sum(1 for value in list.__iter__(self) if not value is MISSING)
+
+    def __eq__(self, that):
+        """Equals
+        """
+        return dict(self.iteritems()) == (dict(that.iteritems()) if isinstance(that, CompactStore) else that)
+
+    def __ne__(self, that):
+        """Not equals
+        """
+        return not self.__eq__(that)
+
+    def __repr__(self):
+        """Repr
+        """
+        return repr(dict(self.iteritems()))
+
+    def get(self, key, default = None):
+        """Get the value of key, return default if not exists
+        """
+        index = self.INDEXES.get(key)
+        if index is None:
+            return default
+        value = list.__getitem__(self, index)
+        return default if value is MISSING else value
+
+    def pop(self, key, *args):
+        """Pop the value of key
+        """
+        index = self.INDEXES.get(key)
+        value = MISSING if index is None else list.__getitem__(self, index)
+        if value is MISSING:
+            if args:
+                return args[0]
+            raise KeyError(key)
+        list.__setitem__(self, index, MISSING)
+        return value
+
+    def iteritems(self):
+        """Iterate the (key, value) of the existing values
+        """
+        for key, value in zip(self.KEYS, list.__iter__(self)):
+            if not value is MISSING:
+                yield key, value
+
+    def itervalues(self):
+        """Iterate the existing values
+        """
+        for _, value in self.iteritems():
+            yield value
+
+    def iterkeys(self):
+        """Iterate the keys of the existing values
+        """
+        for key, _ in self.iteritems():
+            yield key
+
+    def keys(self):
+        """Get the keys of the existing values
+        """
+        return list(self.iterkeys())
+
+    def items(self):
+        """Get the (key, value) of the existing values
+        """
+        return list(self.iteritems())
+
+    @classmethod
+    def create(cls, name, keys):
+        """Create a compact store class
+        Parameters:
+            name                            The class name
+            keys                            The field names in position order, a position could have multiple names
+                                            (The field key and the field name), in this case a tuple of names is used
+        Returns:
+            The CompactStore class
+        """
+        indexes, primaryKeys = {}, []
+        for index, names in enumerate(keys):
+            names = names if isinstance(names, tuple) else (names, )
+            for key in names:
+                indexes[key] = index
+            primaryKeys.append(names[0])
+        return type(name, (cls, ), { '__slots__': (), 'INDEXES': indexes, 'KEYS': tuple(primaryKeys), 'EMPTY': (MISSING, ) * len(keys) })
@@ -9,6 +9,9 @@
 
 """
 
+# NOTE: Import _strptime before datetime.strptime is called in threads (It's imported lazily and not thread-safe)
+import _strptime
+
 from sets import Set
 from copy import deepcopy
 from datetime import datetime, date, time, timedelta
@@ -16,13 +19,19 @@ from datetime import datetime, date, time, timedelta
 import arrow
 
 from datahub.errors import FieldNotDumpError, DataModelError, CompoundDataModelError, NestedDataModelError, \
-    MissingRequiredFieldError, TypeValidationError, ValueConversionError, ChoiceValidationError, UnqueryableValueError, QueryNotMatchError
+    MissingRequiredFieldError, TypeValidationError, ValueConversionError, ChoiceValidationError, UnqueryableValueError, QueryNotMatchError, \
+    FrozenModelError
 
 from spec import *
 
 class DataType(object):
     """The base data type
+    Attributes:
+        generation                  Increased when the loader / dumper / validator method of any data type is changed,
+                                    the compiled model codecs are regenerated when it changes
     """
+    generation = 0
+
     def __init__(self,
         name = None,
         required = False,
@@ -102,6 +111,8 @@ class DataType(object):
     def __set__(self, instance, value):
         """Set the value of this data type
         """
+        if FROZEN_NAME in instance.__dict__:
+            raise FrozenModelError
         metadata = instance.getMetadata() or DEFAULT_MODEL_METADATA
         # Load the value
         value = self.load(value, instance, None)
@@ -110,15 +121,19 @@ class DataType(object):
             self.validate(value)
         # Good, set the value
         getattr(instance, STORE_NAME)[self.name] = value
+        instance.__setchanged__(self.name)
 
     def __delete__(self, instance):
         """Delete the value of this type
         """
+        if FROZEN_NAME in instance.__dict__:
+            raise FrozenModelError
         metadata = instance.getMetadata() or DEFAULT_MODEL_METADATA
         if metadata.strict and self.required:
             raise MissingRequiredFieldError(self.name)
         # Pop the value
         getattr(instance, STORE_NAME).pop(self.name, None)
+        instance.__setchanged__(self.name)
 
     def exists(self, model):
         """Check if the value is exists
@@ -150,8 +165,10 @@ class DataType(object):
             value = self._loader(self, value, model, container)
         else:
             value = self.__loadvalue__(value, model, container)
-        # Validate the loaded value
-        self.validate(value, required = False)
+        # Validate the loaded value (Skipped when the value comes from a trusted source)
+        context = LOAD_STATE.context
+        if context is None or not context.trusted:
+            self.validate(value, required = False)
         # Done
         return value
 
@@ -218,16 +235,22 @@ class DataType(object):
         """Set the loader method
         """
         self._loader = method
+        # Invalidate the compiled codecs
+        DataType.generation += 1
 
     def dumper(self, method):
         """Set the dump method
         """
         self._dumper = method
+        # Invalidate the compiled codecs
+        DataType.generation += 1
 
     def validator(self, method):
         """Set the validation method
         """
         self._validator = method
+        # Invalidate the compiled codecs
+        DataType.generation += 1
 
 class StringType(DataType):
     """The string type
@@ -775,7 +798,7 @@ class DictType(DataType):
             nextPath = path[index + 1: ]
         # Get the value
         if not name in value:
-            return QueryNotMatchError(name, nextPath)
+            raise QueryNotMatchError(name, nextPath)
         # Done
         return name, value[name], nextPath
 
@@ -15,10 +15,16 @@ from uuid import uuid4
 from binascii import b2a_hex
 
 from datahub.errors import DataModelError, CompoundDataModelError, NestedDataModelError, UnknownFieldError, \
-    MissingRequiredFieldError, FieldNotDumpError, QueryNotMatchError
+    ValueConversionError, MissingRequiredFieldError, FieldNotDumpError, QueryNotMatchError
 
 from spec import *
 from _types import DataType, StringType, FloatType, DatetimeType, DictType, ModelType
+from _store import CompactStore
+from _lazy import LazyStore
+from _query import QueryPath
+from _codec import ModelCodec
+from _canonical import canonicalModel, fingerprint
+from _frozen import freezeValue
 
 class DataModelMetaClass(type):
     """The data model meta class
@@ -26,6 +32,13 @@ class DataModelMetaClass(type):
         _datahub_datamodel_fields           The field definitions
         _datahub_datamodel_metadata         The metadata definition
         _datahub_datamodel_store            The stored values
+        _datahub_datamodel_codec            The compiled codec (Compiled the first time the class is used)
+        _datahub_datamodel_storeclass       The compact store class (Created the first time the class is used in compact mode)
+        _datahub_datamodel_querypaths       The compiled query paths (See _query.py)
+    And the following attributes of data model object:
+        _datahub_datamodel_changed          The names of the fields assigned or deleted since loaded
+        _datahub_datamodel_origin           The snapshot of the loaded values (When tracking is enabled by the metadata)
+        _datahub_datamodel_frozen           The model is frozen (See freeze)
     """
     def __new__(cls, name, bases, attrs):
         """Create a new DataModel object
@@ -45,6 +58,47 @@ class DataModelMetaClass(type):
         # Super
         return type.__new__(cls, name, bases, attrs)
 
+    def getCodec(cls, metadata = None):
+        """Get the compiled codec of this model class
+        Parameters:
+            metadata                        The metadata of the model class, will get it from the class if not specified
+        Returns:
+            ModelCodec object or None if the compiled codec is disabled by the metadata
+        """
+        metadata = metadata or getattr(cls, METADATA_NAME, None) or ModelMetadata.getDefault()
+        if not metadata.compiled:
+            return None
+        # Compile the codec when it is not compiled (for this class) or out of date
+        codec = cls.__dict__.get(CODEC_NAME)
+        if codec is None or codec.metadata is not metadata or codec.generation != DataType.generation or \
+            codec.strict != metadata.strict or codec.compact != metadata.compact:
+            codec = ModelCodec(cls, metadata)
+            setattr(cls, CODEC_NAME, codec)
+        # Done
+        return codec
+
+    def getStoreClass(cls):
+        """Get the compact store class of this model class
+        """
+        storeCls = cls.__dict__.get(STORE_CLASS_NAME)
+        if storeCls is None:
+            keys = [ key if key == field.name else (key, field.name) for key, field in getattr(cls, FILEDS_NAME).iteritems() ]
+            storeCls = CompactStore.create('%sStore' % cls.__name__, keys)
+            setattr(cls, STORE_CLASS_NAME, storeCls)
+        return storeCls
+
+    def newStore(cls, metadata = None):
+        """Create a new store for the model of this class
+        Parameters:
+            metadata                        The metadata of the model class, will get it from the class if not specified
+        Returns:
+            A dict or a CompactStore object if the compact mode is enabled by the metadata
+        """
+        metadata = metadata or getattr(cls, METADATA_NAME, None) or ModelMetadata.getDefault()
+        if metadata.compact:
+            return cls.getStoreClass()()
+        return {}
+
 class DataModel(object):
     """The data model base class
     """
@@ -55,12 +109,28 @@ class DataModel(object):
         """
         container = __raw__ or {}
         container.update(kwargs)
+        # Get metadata
+        metadata = getattr(type(self), METADATA_NAME) if hasattr(type(self), METADATA_NAME) else ModelMetadata.getDefault()
+        # Check if the raw values come from a trusted source or should be decoded lazily
+        context = LOAD_STATE.context
+        trusted = context is not None and context.trusted
+        lazy = context is not None and context.lazy
+        partial = context is not None and context.partial
         # Initialize the stores
-        setattr(self, STORE_NAME, {})
+        store = LazyStore(self, container, {}, context) if lazy else type(self).newStore(metadata)
+        setattr(self, STORE_NAME, store)
+        # Load by the compiled codec
+        codec = type(self).getCodec(metadata)
+        if codec and not lazy and not partial:
+            if trusted:
+                codec.loadTrusted(self, store, container, __continueOnError__)
+            else:
+                codec.load(self, store, container, __continueOnError__)
+            if metadata.tracking:
+                self.__snapshot__(store = store)
+            return
         # Get all fields
         fields = getattr(type(self), FILEDS_NAME)
-        # Get metadata
-        metadata = getattr(type(self), METADATA_NAME) if hasattr(type(self), METADATA_NAME) else ModelMetadata.getDefault()
         # All errors
         errors = []
         # Load values
@@ -72,6 +142,9 @@ class DataModel(object):
                     raise error
                 # Add error
                 errors.append(error)
+            elif lazy:
+                # Decode the value when it's accessed the first time
+                store.pending[key] = value
             else:
                 # Load the value
                 try:
@@ -84,7 +157,7 @@ class DataModel(object):
                     errors.append(error)
         # Set default
         for name, field in fields.iteritems():
-            if not self.__existvalue__(name) and field.hasDefault():
+            if not partial and not self.__existvalue__(name) and field.hasDefault():
                 try:
                     self.__setvalue__(name, field.load(field.getDefault(), self, None))
                 except Exception as error:
@@ -94,7 +167,7 @@ class DataModel(object):
                     # Add error
                     errors.append(error)
         # Check required
-        if metadata.strict:
+        if metadata.strict and not trusted and not partial:
             try:
                 self._validateRequiredFields(fields, metadata)
             except Exception as error:
@@ -109,6 +182,9 @@ class DataModel(object):
                 raise errors[0]
             else:
                 raise CompoundDataModelError(errors, 'Failed to initialize model (%s)' % type(self).__name__)
+        # Take the snapshot
+        if metadata.tracking:
+            self.__snapshot__(fields, store)
 
     def __existvalue__(self, key):
         """Get if exist a raw value
@@ -125,6 +201,26 @@ class DataModel(object):
         """
         getattr(self, STORE_NAME)[key] = value
 
+    def __setchanged__(self, key):
+        """Mark the field as changed
+        """
+        changed = self.__dict__.get(CHANGED_NAME)
+        if changed is None:
+            changed = set()
+            setattr(self, CHANGED_NAME, changed)
+        changed.add(key)
+
+    def __snapshot__(self, fields = None, store = None):
+        """Take the snapshot of the current values
+        NOTE: The values which are not decoded yet (of the lazy store) are not included, they're added when decoded
+        """
+        fields = fields or getattr(type(self), FILEDS_NAME)
+        store = store if store is not None else getattr(self, STORE_NAME)
+        origin = {}
+        for name, value in (dict.iteritems(store) if isinstance(store, LazyStore) else store.iteritems()):
+            origin[name] = fields[name].clone(value)
+        setattr(self, ORIGIN_NAME, origin)
+
     def __getitem__(self, key):
         """Get item
         """
@@ -266,17 +362,9 @@ class DataModel(object):
         Parameters:
             path                    A string path
         Returns:
-            value
+            A list of values
         """
-        try:
-            t, name, value, nextPath = self.queryMySelf(path)
-            if not nextPath:
-                yield value
-            else:
-                for v in t.query(value, nextPath):
-                    yield v
-        except QueryNotMatchError:
-            pass
+        return QueryPath.get(type(self), path).query(self)
 
     def match(self, query):
         """Check if this model match the query
@@ -287,24 +375,129 @@ class DataModel(object):
         """
         return query.check(self)
 
+    def update(self, updates):
+        """Apply the update actions to this model in place
+        Parameters:
+            updates                 A list of update actions (See datahub.updates)
+        Returns:
+            This data model
+        NOTE:
+            The values are loaded by the data types of the fields (The missing nested models or dicts are created),
+            the model is not validated, call validate after updating.
+        """
+        for update in updates:
+            names = update.key.split('.')
+            holder = self
+            for index, name in enumerate(names[: -1]):
+                holder = getUpdateHolder(holder, name, '.'.join(names[: index + 1]))
+            applyUpdate(holder, names[-1], update)
+        # Done
+        return self
+
     def dump(self, context = None):
         """Dump this model
         """
         context = context or DEFAULT_DUMP_CONTEXT
+        # Dump by the compiled codec
+        store = getattr(self, STORE_NAME)
+        # Get the raw values which are passed through (For the lazy store)
+        passthrough = None
+        if isinstance(store, LazyStore) and store.pending:
+            store, passthrough = store.splitForDump()
+        # Dump by the compiled codec
+        codec = type(self).getCodec()
+        if codec and codec.compact == isinstance(store, CompactStore):
+            container = codec.dump(self, store, context)
+        else:
+            # Get all fields
+            fields = getattr(type(self), FILEDS_NAME)
+            # Validate the required fields and validate the field
+            container = {}
+            for name, field in fields.iteritems():
+                if name in store:
+                    try:
+                        value = field.dump(store[name], self, container, context)
+                    except FieldNotDumpError:
+                        continue
+                    # Set value
+                    container[name] = value
+        # Pass through
+        if passthrough:
+            container.update(passthrough)
+        # Done
+        return container
+
+    def changes(self, context = None, prefix = None):
+        """Get the changes since the model is loaded (or since resetChanges is called)
+        The assigned / deleted fields and the changes of the nested models are always returned, the in-place changes
+        (For example, appending to a list) are returned when tracking is enabled by the metadata
+        Parameters:
+            context                         The DumpContext object to dump the changed values
+            prefix                          The prefix of the update keys (For the nested models)
+        Returns:
+            A list of UpdateAction (SetAction, ClearAction and PushsAction)
+        """
+        from datahub.diff import diffValue, setValue
+        from datahub.updates import ClearAction
+        context = context or DEFAULT_DUMP_CONTEXT
         # Get all fields
         fields = getattr(type(self), FILEDS_NAME)
-        # Validate the required fields and validate the field
-        container = {}
+        store = getattr(self, STORE_NAME)
+        pending = store.pending if isinstance(store, LazyStore) else {}
+        changed = self.__dict__.get(CHANGED_NAME) or ()
+        origin = self.__dict__.get(ORIGIN_NAME)
+        # Check the fields
+        updates = []
         for name, field in fields.iteritems():
-            if self.__existvalue__(name):
-                try:
-                    value = field.dump(self.__getvalue__(name), self, container, context)
-                except FieldNotDumpError:
+            if name in pending:
+                # Not decoded, not changed
+                continue
+            key = prefix + name if prefix else name
+            exists = name in store
+            value = store[name] if exists else None
+            if not name in changed:
+                if not exists:
+                    continue
+                if isinstance(value, DataModel):
+                    # Get the changes of the nested model
+                    updates.extend(value.changes(context, key + '.'))
                     continue
-                # Set value
-                container[name] = value
+                if origin is None or not name in origin:
+                    continue
+                # Compare with the snapshot
+                diffValue(field, key, origin[name], value, self, context, updates)
+                continue
+            # The value is assigned or deleted
+            if exists and not field.isEmpty(value):
+                setValue(field, key, value, self, context, updates)
+            else:
+                updates.append(ClearAction(key = key))
         # Done
-        return container
+        return updates
+
+    def resetChanges(self):
+        """Reset the changes (Including the nested models), call this method after the changes are saved
+        """
+        self.__dict__.pop(CHANGED_NAME, None)
+        store = getattr(self, STORE_NAME)
+        # Reset the nested models
+        for value in (dict.itervalues(store) if isinstance(store, LazyStore) else store.itervalues()):
+            if isinstance(value, DataModel):
+                value.resetChanges()
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    if isinstance(item, DataModel):
+                        item.resetChanges()
+            elif isinstance(value, dict):
+                for item in value.itervalues():
+                    if isinstance(item, DataModel):
+                        item.resetChanges()
+        # Take the snapshot
+        metadata = getattr(type(self), METADATA_NAME, None) or ModelMetadata.getDefault()
+        if metadata.tracking:
+            self.__snapshot__(store = store)
+        else:
+            self.__dict__.pop(ORIGIN_NAME, None)
 
     def clone(self):
         """Clone this data model
@@ -318,6 +511,39 @@ class DataModel(object):
         # Create new one
         return type(self)(clonedFields)
 
+    def freeze(self):
+        """Freeze this data model, the frozen model (Including the nested models, lists and dicts) cannot be changed
+        Use clone to get a changeable copy (See _frozen.py)
+        Returns:
+            This data model
+        """
+        if not FROZEN_NAME in self.__dict__:
+            store = getattr(self, STORE_NAME)
+            for name in getattr(type(self), FILEDS_NAME):
+                if name in store:
+                    store[name] = freezeValue(store[name])
+            self.__dict__[FROZEN_NAME] = True
+        return self
+
+    def isFrozen(self):
+        """Tell if this data model is frozen
+        """
+        return FROZEN_NAME in self.__dict__
+
+    def canonical(self):
+        """Get the canonical form of this data model (See _canonical.py)
+        Returns:
+            A hashable tuple
+        """
+        return canonicalModel(self)
+
+    def fingerprint(self):
+        """Get the fingerprint of this data model
+        Returns:
+            The sha1 hex digest string of the canonical form
+        """
+        return fingerprint(self.canonical())
+
     @classmethod
     def getMetadata(cls):
         """Get meta
@@ -337,6 +563,129 @@ class DataModel(object):
         """
         return cls(raw, continueOnError)
 
+    @classmethod
+    def loadTrusted(cls, raw):
+        """Load from raw object which comes from a trusted source (For example, a document written by the repository)
+        NOTE: The validation and the required field check are skipped (Including the nested models)
+        """
+        with LoadContext(trusted = True):
+            return cls(raw)
+
+    @classmethod
+    def loadLazy(cls, raw, trusted = True):
+        """Load from raw object lazily, the fields are decoded when they're accessed the first time
+        The raw values which are not decoded are dumped as they are if possible, so the raw object is expected to be
+        in the dumped form (For example, a document written by the repository)
+        Parameters:
+            raw                             The raw object
+            trusted                         The raw object comes from a trusted source, see loadTrusted
+        """
+        with LoadContext(trusted = trusted, lazy = True):
+            return cls(raw)
+
+    @classmethod
+    def loadPartial(cls, raw, trusted = False, lazy = False):
+        """Load from raw object which is a projection of the model (Only some of the fields are selected)
+        The missing fields are left unset instead of set by the defaults, and the required field check is skipped, so
+        validate the partial model with required = False
+        Parameters:
+            raw                             The raw object
+            trusted                         The raw object comes from a trusted source, see loadTrusted
+            lazy                            Decode the fields lazily, see loadLazy
+        """
+        with LoadContext(trusted = trusted, lazy = lazy, partial = True):
+            return cls(raw)
+
+def getUpdateHolder(holder, name, path):
+    """Get (Or create) the model or dict which holds the next part of an update path
+    Parameters:
+        holder                      The current model, dict or list
+        name                        The name (Or the index of a list) of the value in the holder
+        path                        The path of the value (For error reporting)
+    Returns:
+        The model, dict or list
+    """
+    if isinstance(holder, DataModel):
+        fields = getattr(type(holder), FILEDS_NAME)
+        if not name in fields:
+            raise UnknownFieldError(path)
+        if not holder.__existvalue__(name):
+            if not isinstance(fields[name], (ModelType, DictType)):
+                raise NestedDataModelError(path, None, 'Cannot update the value under a non-model field')
+            setattr(holder, name, {})
+        value = holder.__getvalue__(name)
+    elif isinstance(holder, list):
+        value = holder[getListIndex(holder, name, path)]
+    else:
+        value = holder.setdefault(name, {})
+    if not isinstance(value, (DataModel, dict, list)):
+        raise NestedDataModelError(path, ValueConversionError(type(value), (DataModel, dict), value), 'Cannot update the value under a non-model value')
+    # Done
+    return value
+
+def getListIndex(holder, name, path):
+    """Get the index of a list by the name of an update path
+    """
+    try:
+        index = int(name)
+        holder[index]
+    except (ValueError, IndexError):
+        raise NestedDataModelError(path, None, 'Invalid list index')
+    return index
+
+def applyUpdate(holder, name, update):
+    """Apply an update action to a value of a model, dict or list
+    Parameters:
+        holder                      The model, dict or list
+        name                        The name (Or the index of a list) of the value in the holder
+        update                      The update action
+    """
+    isModel = isinstance(holder, DataModel)
+    if isModel and not name in getattr(type(holder), FILEDS_NAME):
+        raise UnknownFieldError(update.key)
+    if isinstance(holder, list):
+        name = getListIndex(holder, name, update.key)
+    # Get the current value
+    if isModel:
+        exists = holder.__existvalue__(name)
+        value = holder.__getvalue__(name) if exists else None
+    elif isinstance(holder, list):
+        exists, value = True, holder[name]
+    else:
+        exists = name in holder
+        value = holder.get(name)
+    # Apply
+    if update.NAME == 'set':
+        value = update.value
+    elif update.NAME == 'clear':
+        if exists:
+            if isModel:
+                delattr(holder, name)
+            elif isinstance(holder, list):
+                holder[name] = None
+            else:
+                del holder[name]
+        return
+    elif update.NAME in ('push', 'pushs', 'pop'):
+        if exists and not isinstance(value, list):
+            raise NestedDataModelError(update.key, ValueConversionError(type(value), list, value), 'Cannot push or pop a non-list value')
+        value = list(value or [])
+        if update.NAME == 'pop':
+            if not value:
+                return
+            value.pop(0 if update.head else -1)
+        else:
+            values = [ update.value ] if update.NAME == 'push' else update.values
+            position = len(value) if update.position is None else update.position
+            value[position: position] = values
+    else:
+        raise DataModelError('Unknown update action [%s]' % update.NAME)
+    # Set the value
+    if isModel:
+        setattr(holder, name, value)
+    else:
+        holder[name] = value
+
 def randomID(length = 32):
     """Get a random id
     """
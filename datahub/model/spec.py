@@ -9,12 +9,20 @@
 
 """
 
+import threading
+
 from sets import Set
 from collections import namedtuple
 
 FILEDS_NAME         = '_datahub_datamodel_fields'
 METADATA_NAME       = '_datahub_datamodel_metadata'
 STORE_NAME          = '_datahub_datamodel_store'
+CODEC_NAME          = '_datahub_datamodel_codec'
+STORE_CLASS_NAME    = '_datahub_datamodel_storeclass'
+CHANGED_NAME        = '_datahub_datamodel_changed'
+ORIGIN_NAME         = '_datahub_datamodel_origin'
+QUERY_PATHS_NAME    = '_datahub_datamodel_querypaths'
+FROZEN_NAME         = '_datahub_datamodel_frozen'
 
 UNKNOWN_FIELD_IGNORE    = 'ignore'
 UNKNOWN_FIELD_ERROR     = 'error'
@@ -41,11 +49,18 @@ class ModelMetadata(object):
         strict                              Whether the model is strict
         attrs                               The metadata attributes
         none                                Return None if the field is not assigned
+        compiled                            Load / dump the model by the compiled codec, set to False to fall back to the interpretive path
+        compact                             Store the values in a list indexed by field position instead of a dict (Less memory, slower random access)
+        tracking                            Keep a snapshot of the loaded values to detect the in-place changes (For example, appending to a list)
+                                            by DataModel.changes, the assigned fields are always tracked
     """
-    def __init__(self, namespace = None, strict = False, attrs = None, none = True):
+    def __init__(self, namespace = None, strict = False, attrs = None, none = True, compiled = True, compact = False, tracking = False):
         """Create a new ModelMetadata
         """
         self.none = none
+        self.compiled = compiled
+        self.compact = compact
+        self.tracking = tracking
         self.attrs = attrs or []
         self.strict = strict
         self.namespace = namespace
@@ -102,6 +117,67 @@ class DumpContext(object):
 
 DEFAULT_DUMP_CONTEXT = DumpContext()
 
+class LoadState(threading.local):
+    """The load state of current thread
+    Attributes:
+        context                             The LoadContext object currently entered or None
+        contexts                            The LoadContext objects entered before the current one
+    """
+    context = None
+
+    def __init__(self):
+        """Create a new LoadState
+        """
+        self.contexts = []
+
+LOAD_STATE = LoadState()
+
+class LoadContext(object):
+    """The load context
+    Enter the context to apply it to all the models (including the nested ones) loaded in current thread, for example:
+
+        with LoadContext(trusted = True):
+            model = ModelClass(raw)
+
+    Attributes:
+        trusted                             The raw values come from a trusted source (Which are already validated when written),
+                                            the validation and the required field check are skipped
+        lazy                                Keep the raw values in the model and decode them when they're accessed the first time
+        partial                             The raw values are a projection of the model (See datahub.projection), the
+                                            missing fields are left unset (No defaults) and the required field check is skipped
+    """
+    def __init__(self, trusted = False, lazy = False, partial = False):
+        """Create a new LoadContext
+        """
+        self.trusted = trusted
+        self.lazy = lazy
+        self.partial = partial
+
+    def __enter__(self):
+        """Enter the context
+        """
+        LOAD_STATE.contexts.append(LOAD_STATE.context)
+        LOAD_STATE.context = self
+        return self
+
+    def __exit__(self, exctype, excval, exctb):
+        """Exit the context
+        """
+        LOAD_STATE.context = LOAD_STATE.contexts.pop()
+
+    @staticmethod
+    def getCurrent():
+        """Get the current load context, return None if no context is entered
+        """
+        return LOAD_STATE.context
+
+    @staticmethod
+    def isTrusted():
+        """Tell if the current load context is trusted
+        """
+        context = LOAD_STATE.context
+        return context is not None and context.trusted
+
 # The metadata attributes
 
 class IndexAttr(object):
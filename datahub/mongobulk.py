@@ -0,0 +1,199 @@
+# encoding=utf8
+
+""" The mongodb bulk writes
+    Author: lipixun
+    Created Time : 六 10/17 23:10:42 2026
+
+    File Name: mongobulk.py
+    Description:
+
+        The bulk writes are shared by the mongodb repository and the mongodb data storage. The models are validated,
+        dumped and written in batches (One round trip for each batch), the write errors of a batch are reported by
+        mongodb with the index in the batch which is mapped back to the index in the request.
+
+        The operations of bulkWrite are translated into the pymongo requests and written by a single bulk_write call
+        (Which is split into batches by pymongo itself).
+
+"""
+
+from pymongo import InsertOne, ReplaceOne, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+
+from datahub.spec import *
+from datahub.bulk import WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_SKIPPED, WriteResult, CreateManyResult, BulkWriteResult, \
+    CreateOperation, ReplaceOperation, UpdateOperation, DeleteOperation
+from datahub.model import DumpContext
+from datahub.errors import DataModelError
+
+# The default count of the documents written in one round trip
+DEFAULT_BATCH_SIZE = 1000
+
+# The mongodb duplicated key error codes
+MONGODB_DUPLICATED_KEY_CODES = (11000, 11001)
+
+def setWriteError(result, code, reason):
+    """Set the write result to error
+    """
+    result.status = WRITE_STATUS_ERROR
+    if code in MONGODB_DUPLICATED_KEY_CODES:
+        result.code = ERROR_DUPLICATED_KEY
+    result.reason = reason
+
+def writeBatch(collection, batch, ordered, overwrite):
+    """Write a batch of documents
+    Parameters:
+        collection                          The mongodb collection
+        batch                               A list of (WriteResult, doc)
+        ordered                             Stop at the first failed write
+        overwrite                           Overwrite (Upsert) the documents if exist
+    Returns:
+        The count of the written documents
+    """
+    if not batch:
+        return 0
+    docs = [ doc for _, doc in batch ]
+    try:
+        if overwrite:
+            collection.bulk_write([ ReplaceOne({ '_id': doc['_id'] }, doc, upsert = True) for doc in docs ], ordered = ordered)
+        else:
+            collection.insert_many(docs, ordered = ordered)
+    except BulkWriteError as error:
+        writeErrors = error.details.get('writeErrors') or []
+        for writeError in writeErrors:
+            setWriteError(batch[writeError['index']][0], writeError.get('code'), writeError.get('errmsg'))
+        if ordered and writeErrors:
+            # The documents after the failed one are not written
+            for result, _ in batch[writeErrors[0]['index'] + 1: ]:
+                result.status = WRITE_STATUS_SKIPPED
+        return sum(1 for result, _ in batch if result.status == WRITE_STATUS_OK)
+    # All written
+    return len(batch)
+
+def createMany(collection, models, ordered = False, batchSize = DEFAULT_BATCH_SIZE, overwrite = False):
+    """Create models
+    Parameters:
+        collection                          The mongodb collection
+        models                              The models to create
+        ordered                             Stop at the first failed model, the remaining models are skipped
+        batchSize                           The max count of the documents written in one round trip
+        overwrite                           Overwrite the models if exist
+    Returns:
+        The CreateManyResult object
+    """
+    result, batch, failed = CreateManyResult(), [], False
+    batchSize = batchSize or DEFAULT_BATCH_SIZE
+    for index, model in enumerate(models):
+        writeResult = WriteResult(index = index, id = model.id)
+        result.results.append(writeResult)
+        if failed:
+            writeResult.status = WRITE_STATUS_SKIPPED
+            continue
+        # Validate model & dump
+        try:
+            model.validate()
+            doc = model.dump(DumpContext(datetime2str = False))
+        except DataModelError as error:
+            if ordered:
+                # Write the models before this one first, this one is skipped if any of them failed
+                result.created += writeBatch(collection, batch, ordered, overwrite)
+                failed = result.created != index
+                batch = []
+                if failed:
+                    writeResult.status = WRITE_STATUS_SKIPPED
+                    continue
+            writeResult.status = WRITE_STATUS_ERROR
+            writeResult.reason = str(error)
+            failed = ordered
+            continue
+        batch.append((writeResult, doc))
+        if len(batch) >= batchSize:
+            result.created += writeBatch(collection, batch, ordered, overwrite)
+            failed = ordered and result.created != index + 1
+            batch = []
+    # Write the remaining
+    if not failed:
+        result.created += writeBatch(collection, batch, ordered, overwrite)
+    # Done
+    return result
+
+def getRequest(operation, getUpdates):
+    """Get the pymongo request of the write operation
+    Parameters:
+        operation                           The WriteOperation object
+        getUpdates                          The method: (updates) returns the mongodb updates
+    Returns:
+        The pymongo request object
+    """
+    if isinstance(operation, (CreateOperation, ReplaceOperation)):
+        # Validate model & dump
+        operation.model.validate()
+        doc = operation.model.dump(DumpContext(datetime2str = False))
+        if isinstance(operation, ReplaceOperation):
+            return ReplaceOne({ '_id': operation.model.id }, doc, upsert = operation.autoCreate)
+        elif operation.overwrite:
+            return ReplaceOne({ '_id': operation.model.id }, doc, upsert = True)
+        else:
+            return InsertOne(doc)
+    elif isinstance(operation, UpdateOperation):
+        return UpdateOne({ '_id': operation.id }, getUpdates(operation.updates))
+    elif isinstance(operation, DeleteOperation):
+        return DeleteOne({ '_id': operation.id })
+    else:
+        raise TypeError('Unknown write operation type [%s]' % type(operation).__name__)
+
+def bulkWrite(collection, operations, ordered, getUpdates):
+    """Write the operations by a single bulk_write call
+    Parameters:
+        collection                          The mongodb collection
+        operations                          The WriteOperation objects
+        ordered                             Stop at the first failed operation, the remaining operations are skipped
+        getUpdates                          The method: (updates) returns the mongodb updates
+    Returns:
+        The BulkWriteResult object
+    """
+    result, requests, writeResults, invalid = BulkWriteResult(), [], [], None
+    for index, operation in enumerate(operations):
+        writeResult = WriteResult(index = index, id = operation.getID())
+        result.results.append(writeResult)
+        if not invalid is None:
+            writeResult.status = WRITE_STATUS_SKIPPED
+            continue
+        try:
+            requests.append(getRequest(operation, getUpdates))
+        except DataModelError as error:
+            writeResult.status = WRITE_STATUS_ERROR
+            writeResult.reason = str(error)
+            if ordered:
+                # The remaining operations are skipped
+                invalid = writeResult
+            continue
+        writeResults.append(writeResult)
+    if not requests:
+        return result
+    # Write
+    try:
+        rtn = collection.bulk_write(requests, ordered = ordered)
+    except BulkWriteError as error:
+        details = error.details
+        result.inserted = details.get('nInserted', 0)
+        result.matched = details.get('nMatched', 0)
+        result.modified = details.get('nModified', 0)
+        result.upserted = details.get('nUpserted', 0)
+        result.deleted = details.get('nRemoved', 0)
+        writeErrors = details.get('writeErrors') or []
+        for writeError in writeErrors:
+            setWriteError(writeResults[writeError['index']], writeError.get('code'), writeError.get('errmsg'))
+        if ordered and writeErrors:
+            # The operations after the failed one are not written (Including the invalid one)
+            for writeResult in writeResults[writeErrors[0]['index'] + 1: ]:
+                writeResult.status = WRITE_STATUS_SKIPPED
+            if invalid:
+                invalid.status, invalid.reason = WRITE_STATUS_SKIPPED, None
+        return result
+    # All written
+    result.inserted = rtn.inserted_count
+    result.matched = rtn.matched_count
+    result.modified = rtn.modified_count
+    result.upserted = rtn.upserted_count
+    result.deleted = rtn.deleted_count
+    return result
@@ -0,0 +1,285 @@
+# encoding=utf8
+
+""" The condition to mongodb query compiler
+    Author: lipixun
+    Created Time : 六 10/17 22:05:18 2026
+
+    File Name: mongoquery.py
+    Description:
+
+        The compiler is shared by the mongodb repository and the mongodb data storage. A condition is compiled in
+        the following steps:
+
+            1. Normalize the condition (See normalize.py)
+            2. Split the normalized condition into the shape (The condition types, keys and flags) and the parameters
+               (The values in the order they're found)
+            3. Translate and optimize the shape into a query template of which the values are Parameter objects
+            4. Fill the parameters into the template
+
+        The compiled queries are cached by the canonical form of the condition (With the data model class), and the
+        templates are cached by the shape, so the conditions which differ only in the values share a template.
+
+        NOTE: The compiled queries are shared, please do not change them.
+
+        The keyset queries (See paging.py) are built here as well, a mongodb null value is sorted before all other
+        values, so a model is after a null value if the value of the model is not null (In ascending order).
+
+"""
+
+from copy import deepcopy
+
+from datahub.utils import LRUCache
+from datahub.paging import getKeysetSorts, loadToken
+from datahub.conditions import AndCondition, OrCondition, NotCondition, KeyValueCondition, KeyValuesCondition, ExistCondition, \
+    NonExistCondition, GreaterCondition, LesserCondition
+
+# The default max count of the cached queries and templates
+DEFAULT_QUERY_CACHE_SIZE = 1024
+DEFAULT_TEMPLATE_CACHE_SIZE = 256
+
+class Parameter(object):
+    """The parameter of a query template
+    Attributes:
+        index                               The index of the parameter
+    """
+    __slots__ = ('index', )
+
+    def __init__(self, index):
+        """Create a new Parameter
+        """
+        self.index = index
+
+    def __repr__(self):
+        """Repr
+        """
+        return '<parameter %d>' % self.index
+
+class AlwaysFalse(object):
+    """The compiled query of the always false conditions (Which is cached as a value but returned as None)
+    """
+
+ALWAYS_FALSE = AlwaysFalse()
+
+def getShape(condition, params):
+    """Get the shape of the condition and add the values to params
+    Returns:
+        The hashable shape
+    """
+    if isinstance(condition, (AndCondition, OrCondition)):
+        return (condition.NAME, tuple(getShape(x, params) for x in condition.conditions))
+    elif isinstance(condition, NotCondition):
+        return (condition.NAME, getShape(condition.condition, params))
+    elif isinstance(condition, KeyValueCondition):
+        params.append(condition.value)
+        return (condition.NAME, condition.key, condition.equals)
+    elif isinstance(condition, KeyValuesCondition):
+        params.append(condition.values)
+        return (condition.NAME, condition.key, condition.includes)
+    elif isinstance(condition, (ExistCondition, NonExistCondition)):
+        return (condition.NAME, condition.key)
+    elif isinstance(condition, (GreaterCondition, LesserCondition)):
+        params.append(condition.value)
+        return (condition.NAME, condition.key, condition.equals)
+    else:
+        raise TypeError('Unknown condition type [%s]' % type(condition).__name__)
+
+def translate(shape, params):
+    """Translate the shape into the query template
+    Parameters:
+        shape                               The shape
+        params                              The list of parameters (Parameter objects are appended in order)
+    Returns:
+        The query template
+    """
+    name = shape[0]
+    if name == AndCondition.NAME:
+        return { '$and': [ translate(x, params) for x in shape[1] ] }
+    elif name == OrCondition.NAME:
+        return { '$or': [ translate(x, params) for x in shape[1] ] }
+    elif name == NotCondition.NAME:
+        return { '$nor': [ translate(shape[1], params) ] }
+    elif name == ExistCondition.NAME:
+        return { shape[1]: { '$exists': True } }
+    elif name == NonExistCondition.NAME:
+        return { shape[1]: { '$exists': False } }
+    # The conditions with value
+    param = Parameter(len(params))
+    params.append(param)
+    key, flag = shape[1], shape[2]
+    if name == KeyValueCondition.NAME:
+        return { key: param } if flag else { key: { '$ne': param } }
+    elif name == KeyValuesCondition.NAME:
+        return { key: { '$in' if flag else '$nin': param } }
+    elif name == GreaterCondition.NAME:
+        return { key: { '$gte' if flag else '$gt': param } }
+    elif name == LesserCondition.NAME:
+        return { key: { '$lte' if flag else '$lt': param } }
+    else:
+        raise TypeError('Unknown condition [%s]' % name)
+
+def optimize(query):
+    """Optimize the query
+    """
+    if len(query) == 1:
+        # Check if a logic query
+        key, value = query.keys()[0], query.values()[0]
+        if key in ('$and', '$or'):
+            # Optimize children
+            value = [ optimize(x) for x in value ]
+            # Merge the children of the same logic (The children of the other logic are kept as they are)
+            queries = []
+            for q in value:
+                if len(q) == 1 and q.keys()[0] == key:
+                    queries.extend(q.values()[0])
+                elif q or key == '$or':
+                    queries.append(q)
+            if key == '$and' and not queries:
+                # Match all
+                return {}
+            if len(queries) == 1:
+                return queries[0]
+            # Done
+            return { key: queries }
+        elif key == '$nor':
+            # Optimize children
+            value = [ optimize(x) for x in value ]
+            # nor(nor(a, b)) is or(a, b)
+            nors, others = [], []
+            for q in value:
+                if len(q) == 1 and q.keys()[0] == '$nor':
+                    nors.append(q.values()[0])
+                else:
+                    others.append(q)
+            if not nors:
+                return { '$nor': others }
+            queries = [ { '$nor': others } ] if others else []
+            for v in nors:
+                queries.append(v[0] if len(v) == 1 else { '$or': v })
+            if len(queries) == 1:
+                return queries[0]
+            return { '$and': queries }
+        # Done
+    return query
+
+def fill(template, params):
+    """Fill the parameters into the query template
+    Returns:
+        The query
+    """
+    if isinstance(template, dict):
+        return dict((k, fill(v, params)) for k, v in template.iteritems())
+    elif isinstance(template, list):
+        return [ fill(x, params) for x in template ]
+    elif isinstance(template, Parameter):
+        return params[template.index]
+    return template
+
+class MongodbQueryCompiler(object):
+    """The condition to mongodb query compiler
+    Attributes:
+        queries                             The LRUCache of the compiled queries
+        templates                           The LRUCache of the query templates
+    """
+    def __init__(self, size = DEFAULT_QUERY_CACHE_SIZE, templateSize = DEFAULT_TEMPLATE_CACHE_SIZE):
+        """Create a new MongodbQueryCompiler
+        """
+        self.queries = LRUCache(size)
+        self.templates = LRUCache(templateSize)
+
+    def compile(self, condition, modelCls = None):
+        """Compile the condition
+        Parameters:
+            condition                       The condition
+            modelCls                        The data model class which the condition is applied to, optional
+        Returns:
+            The mongodb query or None if the condition is always false
+        """
+        key = (modelCls, condition.canonical())
+        query = self.queries.get(key)
+        if query is None:
+            query = self.compileCondition(condition, modelCls)
+            self.queries.set(key, query)
+        return None if query is ALWAYS_FALSE else query
+
+    def compileCondition(self, condition, modelCls = None):
+        """Compile the condition without the query cache
+        Returns:
+            The mongodb query or ALWAYS_FALSE
+        """
+        condition = condition.normalize(modelCls)
+        if condition.isAlwaysFalse():
+            return ALWAYS_FALSE
+        # Get the template
+        params = []
+        shape = getShape(condition, params)
+        template = self.templates.get(shape)
+        if template is None:
+            template = optimize(translate(shape, []))
+            self.templates.set(shape, template)
+        # NOTE: Copy the values since the query is cached and the condition may be changed later
+        return fill(template, deepcopy(params))
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return { 'queries': self.queries.getStats(), 'templates': self.templates.getStats() }
+
+# The global compiler
+MONGODB_QUERY_COMPILER = MongodbQueryCompiler()
+
+def compileQuery(condition, modelCls = None):
+    """Compile the condition to the mongodb query by the global compiler
+    Returns:
+        The mongodb query or None if the condition is always false
+    """
+    return MONGODB_QUERY_COMPILER.compile(condition, modelCls)
+
+def getAfterQuery(key, value, ascending):
+    """Get the query of the values which are sorted after the value
+    Returns:
+        The mongodb query or None if no value is after it
+    """
+    if value is None:
+        return { key: { '$ne': None } } if ascending else None
+    elif ascending:
+        return { key: { '$gt': value } }
+    else:
+        return { '$or': [ { key: { '$lt': value } }, { key: None } ] }
+
+def getKeysetQuery(sorts, values):
+    """Get the query of the models which are sorted after the values
+    Parameters:
+        sorts                               The keyset sort rules
+        values                              The values of the sort keys (See paging.loadToken)
+    Returns:
+        The mongodb query or None if no model is after the values
+    """
+    queries = []
+    for index, sort in enumerate(sorts):
+        after = getAfterQuery(sort.key, values[index], sort.ascending)
+        if after is None:
+            continue
+        queries.append(optimize({ '$and': [ { sorts[i].key: values[i] } for i in range(index) ] + [ after ] }))
+    if not queries:
+        return
+    return queries[0] if len(queries) == 1 else { '$or': queries }
+
+def getKeysetFind(query, sorts, token):
+    """Get the find arguments of a page of the keyset pagination
+    Parameters:
+        query                               The mongodb query
+        sorts                               The sort rules
+        token                               The continuation token or None for the first page
+    Returns:
+        A tuple of (mongodb query or None if the page is empty, keyset sort rules)
+    """
+    sorts = getKeysetSorts(sorts)
+    if not token:
+        return query, sorts
+    keysetQuery = getKeysetQuery(sorts, loadToken(sorts, token))
+    if keysetQuery is None:
+        return None, sorts
+    # NOTE: Do not change the query since it may be shared
+    return ({ '$and': [ query, keysetQuery ] } if query else keysetQuery), sorts
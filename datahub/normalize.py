@@ -0,0 +1,368 @@
+# encoding=utf8
+
+""" The condition normalizer
+    Author: lipixun
+    Created Time : 六 10/17 18:26:05 2026
+
+    File Name: normalize.py
+    Description:
+
+        Normalize a condition tree into a smaller equivalent one, the rules are:
+
+            - The nested and / or conditions are flattened, the duplicated conditions are removed
+            - not(not x) is x, not(exist) is nonexist, not(nonexist) is exist
+            - The kv / kvs conditions of the same key in an or condition are merged into one kvs condition
+            - The greater / lesser conditions of the same key are merged into the strongest (and) or weakest (or) one
+            - The contradictory conditions (For example: exist and nonexist the same key) are folded into false
+
+        A value of a condition is matched if ANY of the queried values matches (The same as mongodb), so the rules
+        which treat the value of a key as a single value (For example: a = 1 and a = 2 is false) are only applied when
+        the data model class is given and the key is known to be single valued (See isSingleValued).
+
+        The always true condition is an empty and condition, the always false condition is an empty or condition.
+
+"""
+
+from datahub.model import DataModel, ListType, SetType, DictType, ModelType, AnyType
+from datahub.model.spec import FILEDS_NAME
+from datahub.conditions import Condition, AndCondition, OrCondition, NotCondition, KeyValueCondition, KeyValuesCondition, \
+    ExistCondition, NonExistCondition, GreaterCondition, LesserCondition, ValueSet
+
+# The conditions which have a key
+KEY_CONDITION_TYPES = (KeyValueCondition, KeyValuesCondition, ExistCondition, NonExistCondition, GreaterCondition, LesserCondition)
+
+# The number types which are comparable with each other
+NUMBER_TYPES = (int, long, float)
+
+def normalize(condition, modelCls = None):
+    """Normalize the condition
+    NOTE:
+        The condition is not changed, the returned condition may share the sub conditions with it
+    Parameters:
+        condition                           The condition
+        modelCls                            The data model class which the condition is applied to, optional
+    Returns:
+        The normalized Condition object
+    """
+    if isinstance(condition, AndCondition):
+        return normalizeAnd(condition, modelCls)
+    elif isinstance(condition, OrCondition):
+        return normalizeOr(condition, modelCls)
+    elif isinstance(condition, NotCondition):
+        return normalizeNot(condition, modelCls)
+    elif isinstance(condition, KeyValuesCondition):
+        return normalizeKeyValues(condition)
+    return condition
+
+def alwaysTrue():
+    """Get a new always true condition
+    """
+    return AndCondition(conditions = [])
+
+def alwaysFalse():
+    """Get a new always false condition
+    """
+    return OrCondition(conditions = [])
+
+def normalizeAnd(condition, modelCls):
+    """Normalize the and condition
+    """
+    conditions = []
+    for c in condition.conditions:
+        c = normalize(c, modelCls)
+        if c.isAlwaysFalse():
+            return alwaysFalse()
+        elif c.isAlwaysTrue():
+            continue
+        elif isinstance(c, AndCondition):
+            conditions.extend(c.conditions)
+        else:
+            conditions.append(c)
+    # Merge the conditions by key
+    conditions = mergeByKey(conditions, lambda key, group: mergeAndKey(key, group, isSingleValued(modelCls, key)))
+    if conditions is None:
+        return alwaysFalse()
+    conditions = unique(conditions)
+    # Check x and not(x)
+    if isContradictory(conditions):
+        return alwaysFalse()
+    # Done
+    if len(conditions) == 1:
+        return conditions[0]
+    return AndCondition(conditions = conditions)
+
+def normalizeOr(condition, modelCls):
+    """Normalize the or condition
+    """
+    conditions = []
+    for c in condition.conditions:
+        c = normalize(c, modelCls)
+        if c.isAlwaysTrue():
+            return alwaysTrue()
+        elif c.isAlwaysFalse():
+            continue
+        elif isinstance(c, OrCondition):
+            conditions.extend(c.conditions)
+        else:
+            conditions.append(c)
+    # Merge the conditions by key
+    conditions = mergeByKey(conditions, mergeOrKey)
+    if conditions is None:
+        return alwaysTrue()
+    conditions = unique(conditions)
+    # Check x or not(x)
+    if isContradictory(conditions):
+        return alwaysTrue()
+    # Done
+    if len(conditions) == 1:
+        return conditions[0]
+    return OrCondition(conditions = conditions)
+
+def normalizeNot(condition, modelCls):
+    """Normalize the not condition
+    """
+    c = normalize(condition.condition, modelCls)
+    if c.isAlwaysTrue():
+        return alwaysFalse()
+    elif c.isAlwaysFalse():
+        return alwaysTrue()
+    elif isinstance(c, NotCondition):
+        return c.condition
+    elif isinstance(c, ExistCondition):
+        return NonExistCondition(key = c.key)
+    elif isinstance(c, NonExistCondition):
+        return ExistCondition(key = c.key)
+    elif c is condition.condition:
+        return condition
+    return NotCondition(condition = c)
+
+def normalizeKeyValues(condition):
+    """Normalize the key values condition
+    """
+    if not condition.values:
+        return alwaysFalse() if condition.includes else alwaysTrue()
+    values = ValueSet.unique(condition.values)
+    if len(values) == 1:
+        return KeyValueCondition(key = condition.key, value = values[0], equals = condition.includes)
+    elif len(values) != len(condition.values):
+        return KeyValuesCondition(key = condition.key, values = values, includes = condition.includes)
+    return condition
+
+def isSingleValued(modelCls, key):
+    """Check if the key of the models of the class has at most one value
+    """
+    if modelCls is None:
+        return False
+    t, fields = None, getattr(modelCls, FILEDS_NAME)
+    for name in key.split('.'):
+        if fields is not None:
+            t = fields.get(name)
+        elif type(t) is DictType:
+            t = t.itemType
+        else:
+            return False
+        if t is None or type(t) in (ListType, SetType, AnyType):
+            return False
+        fields = getattr(t.cls, FILEDS_NAME) if type(t) is ModelType else None
+    return True
+
+def isComparable(a, b):
+    """Check if the two values are comparable
+    """
+    if isinstance(a, NUMBER_TYPES) and isinstance(b, NUMBER_TYPES):
+        return not isinstance(a, bool) and not isinstance(b, bool)
+    if isinstance(a, basestring) and isinstance(b, basestring):
+        return True
+    return type(a) is type(b) and not isinstance(a, (list, dict, DataModel))
+
+def isStronger(a, b):
+    """Check if the greater / lesser condition a is stronger than the condition b of the same type (a implies b)
+    """
+    if a.value == b.value:
+        return not a.equals or b.equals
+    return a.value > b.value if isinstance(a, GreaterCondition) else a.value < b.value
+
+def satisfies(value, condition):
+    """Check if the value satisfies the greater / lesser condition
+    """
+    if value == condition.value:
+        return condition.equals
+    return value > condition.value if isinstance(condition, GreaterCondition) else value < condition.value
+
+def unique(conditions):
+    """Remove the duplicated conditions (By the canonical form)
+    """
+    uniqueConditions, keys = [], set()
+    for condition in conditions:
+        key = condition.canonical()
+        if not key in keys:
+            keys.add(key)
+            uniqueConditions.append(condition)
+    return uniqueConditions
+
+def isContradictory(conditions):
+    """Check if the conditions contain both x and not(x)
+    """
+    keys = set(x.canonical() for x in conditions if not isinstance(x, NotCondition))
+    for condition in conditions:
+        if isinstance(condition, NotCondition) and condition.condition.canonical() in keys:
+            return True
+    return False
+
+def mergeByKey(conditions, merge):
+    """Merge the key conditions of the same key
+    Parameters:
+        conditions                          The list of conditions
+        merge                               The method: (key, group) returns the merged list of conditions of the key,
+                                            or None if the conditions of the key fold the parent condition
+    Returns:
+        The list of merged conditions or None if the parent condition is folded
+    """
+    groups, positions = {}, []
+    for condition in conditions:
+        if isinstance(condition, KEY_CONDITION_TYPES):
+            if not condition.key in groups:
+                groups[condition.key] = []
+                positions.append(condition.key)
+            groups[condition.key].append(condition)
+        else:
+            positions.append(condition)
+    # Merge the groups at the position of the first condition of the key
+    merged = []
+    for position in positions:
+        if isinstance(position, Condition):
+            merged.append(position)
+            continue
+        group = groups[position]
+        if len(group) == 1:
+            merged.extend(group)
+            continue
+        group = merge(position, group)
+        if group is None:
+            return None
+        merged.extend(group)
+    return merged
+
+def mergeBounds(bounds, condition, stronger):
+    """Merge the greater / lesser condition to the bounds
+    Parameters:
+        bounds                              The list of greater / lesser conditions (Of the same type)
+        condition                           The condition to merge
+        stronger                            Keep the stronger condition if True else the weaker one
+    """
+    for index, bound in enumerate(bounds):
+        if isComparable(bound.value, condition.value):
+            if isStronger(condition, bound) == stronger:
+                bounds[index] = condition
+            return
+    bounds.append(condition)
+
+def mergeAndKey(key, group, singleValued):
+    """Merge the conditions of the same key in an and condition
+    Returns:
+        The list of merged conditions or None if the conditions are contradictory
+    """
+    exists, nonexists, valued = False, False, False
+    allowed, excluded, greaters, lessers, others = None, [], [], [], []
+    for condition in group:
+        if isinstance(condition, ExistCondition):
+            exists = True
+        elif isinstance(condition, NonExistCondition):
+            nonexists = True
+        elif isinstance(condition, (GreaterCondition, LesserCondition)):
+            valued = True
+            mergeBounds(greaters if isinstance(condition, GreaterCondition) else lessers, condition, True)
+        elif isinstance(condition, KeyValueCondition) and condition.equals or isinstance(condition, KeyValuesCondition) and condition.includes:
+            valued = True
+            if singleValued:
+                values = [ condition.value ] if isinstance(condition, KeyValueCondition) else condition.values
+                if allowed is None:
+                    allowed = ValueSet.unique(values)
+                else:
+                    valueSet = ValueSet(values)
+                    allowed = [ x for x in allowed if x in valueSet ]
+            else:
+                others.append(condition)
+        elif singleValued:
+            # The not equals / not includes conditions
+            excluded.extend([ condition.value ] if isinstance(condition, KeyValueCondition) else condition.values)
+            others.append(condition)
+        else:
+            others.append(condition)
+    # Check exist
+    if nonexists and (exists or valued):
+        return None
+    if singleValued:
+        # Check the range
+        for greater in greaters:
+            for lesser in lessers:
+                if isComparable(greater.value, lesser.value) and (not satisfies(greater.value, lesser) or not satisfies(lesser.value, greater)):
+                    return None
+        if allowed is not None:
+            # Check the allowed values by the excluded values and the range
+            excludedSet = ValueSet(excluded)
+            allowed = [ x for x in allowed if not x in excludedSet ]
+            bounds = greaters + lessers
+            for bound in bounds:
+                allowed = [ x for x in allowed if not isComparable(x, bound.value) or satisfies(x, bound) ]
+            if not allowed:
+                return None
+            # The conditions are implied by the allowed values if all values are comparable
+            others = [ x for x in others if not isinstance(x, (KeyValueCondition, KeyValuesCondition)) ]
+            if all(isComparable(x, bound.value) for x in allowed for bound in bounds):
+                greaters, lessers = [], []
+    # Build the merged conditions
+    merged = []
+    if exists and not valued:
+        merged.append(ExistCondition(key = key))
+    if nonexists:
+        merged.append(NonExistCondition(key = key))
+    if allowed is not None:
+        if len(allowed) == 1:
+            merged.append(KeyValueCondition(key = key, value = allowed[0]))
+        else:
+            merged.append(KeyValuesCondition(key = key, values = allowed))
+    merged.extend(greaters)
+    merged.extend(lessers)
+    merged.extend(others)
+    return merged
+
+def mergeOrKey(key, group):
+    """Merge the conditions of the same key in an or condition
+    Returns:
+        The list of merged conditions or None if the conditions are always true
+    """
+    exists, nonexists = False, False
+    values, greaters, lessers, others = None, [], [], []
+    for condition in group:
+        if isinstance(condition, ExistCondition):
+            exists = True
+        elif isinstance(condition, NonExistCondition):
+            nonexists = True
+        elif isinstance(condition, (GreaterCondition, LesserCondition)):
+            mergeBounds(greaters if isinstance(condition, GreaterCondition) else lessers, condition, False)
+        elif isinstance(condition, KeyValueCondition) and condition.equals or isinstance(condition, KeyValuesCondition) and condition.includes:
+            values = (values or []) + ([ condition.value ] if isinstance(condition, KeyValueCondition) else condition.values)
+        else:
+            others.append(condition)
+    # Check exist
+    if exists and nonexists:
+        return None
+    # Build the merged conditions
+    merged = []
+    if exists:
+        # The valued conditions imply exist
+        merged.append(ExistCondition(key = key))
+    else:
+        if nonexists:
+            merged.append(NonExistCondition(key = key))
+        if values is not None:
+            values = ValueSet.unique(values)
+            if len(values) == 1:
+                merged.append(KeyValueCondition(key = key, value = values[0]))
+            else:
+                merged.append(KeyValuesCondition(key = key, values = values))
+        merged.extend(greaters)
+        merged.extend(lessers)
+    merged.extend(others)
+    return merged
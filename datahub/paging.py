@@ -0,0 +1,146 @@
+# encoding=utf8
+
+""" The keyset pagination
+    Author: lipixun
+    Created Time : 日 10/18 00:12:37 2026
+
+    File Name: paging.py
+    Description:
+
+        Skipping start models costs O(start) in the backend, so the deep pages are slow. The keyset pagination reads a
+        page after the last model of the previous page instead:
+
+            1. The models are sorted by the sort rules plus _id (As the tie-breaker, so the order is total)
+            2. The continuation token of a page is the values of the sort keys of the last model in the page
+            3. The next page is read by the query: the models which are sorted after the values in the token
+
+        The token is opaque to the callers (A url safe base64 string), pass None as the token to read the first page.
+
+"""
+
+import base64
+
+from datetime import datetime
+
+from datahub.utils import json
+from datahub.sorts import SortRule
+from datahub.model import DumpContext
+from datahub.errors import InvalidParameterError
+
+# The tie-breaker key of the keyset sorts
+KEYSET_TIE_BREAKER = '_id'
+
+# The datetime format of the values in the token
+TOKEN_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def getKeysetSorts(sorts):
+    """Get the sort rules of the keyset pagination
+    Returns:
+        A list of SortRule which ends with the tie-breaker
+    """
+    sorts = list(sorts or [])
+    if not any(x.key == KEYSET_TIE_BREAKER for x in sorts):
+        sorts.append(SortRule(key = KEYSET_TIE_BREAKER))
+    return sorts
+
+def getValue(doc, key):
+    """Get the value of the dotted key in the dumped model
+    """
+    value = doc
+    for name in key.split('.'):
+        if not isinstance(value, dict):
+            return
+        value = value.get(name)
+    return value
+
+def encodeValue(value):
+    """Encode the value to put into the token
+    """
+    if isinstance(value, datetime):
+        return { '$datetime': value.strftime(TOKEN_DATETIME_FORMAT) }
+    return value
+
+def decodeValue(value):
+    """Decode the value in the token
+    """
+    if isinstance(value, dict) and '$datetime' in value:
+        return datetime.strptime(value['$datetime'], TOKEN_DATETIME_FORMAT)
+    return value
+
+def dumpToken(sorts, model):
+    """Dump the continuation token
+    Parameters:
+        sorts                               The keyset sort rules (See getKeysetSorts)
+        model                               The last model of the page
+    Returns:
+        The token string
+    """
+    # NOTE: Dump the model as it's stored, the values in the token are compared with the stored ones
+    doc = model.dump(DumpContext(datetime2str = False))
+    token = {
+        's': [ [ x.key, x.ascending ] for x in sorts ],
+        'v': [ encodeValue(getValue(doc, x.key)) for x in sorts ],
+    }
+    return base64.urlsafe_b64encode(json.dumps(token, separators = (',', ':')))
+
+def loadToken(sorts, token):
+    """Load the continuation token
+    Parameters:
+        sorts                               The keyset sort rules (See getKeysetSorts)
+        token                               The token string
+    Returns:
+        A list of the values of the sort keys
+    """
+    try:
+        token = json.loads(base64.urlsafe_b64decode(str(token)))
+        keys, values = token['s'], [ decodeValue(x) for x in token['v'] ]
+    except Exception:
+        raise InvalidParameterError(reason = 'Invalid continuation token')
+    if keys != [ [ x.key, x.ascending ] for x in sorts ] or len(values) != len(sorts):
+        raise InvalidParameterError(reason = 'The continuation token does not match the sorts')
+    return values
+
+class PageTracker(object):
+    """Track the models of a page to get the continuation token of the next page
+    Attributes:
+        sorts                               The keyset sort rules
+        size                                The page size
+        count                               The count of the iterated models
+        last                                The last iterated model
+    """
+    def __init__(self, models, sorts, size):
+        """Create a new PageTracker
+        """
+        self.models = models or []
+        self.sorts = getKeysetSorts(sorts)
+        self.size = size
+        self.count = 0
+        self.last = None
+
+    def __iter__(self):
+        """Iterate the models
+        """
+        for model in self.models:
+            self.count += 1
+            self.last = model
+            yield model
+
+    def getNextToken(self):
+        """Get the continuation token of the next page
+        Returns:
+            The token string or None if no more pages
+        """
+        if self.size and self.count >= self.size and self.last:
+            return dumpToken(self.sorts, self.last)
+
+class Page(object):
+    """A page of models
+    Attributes:
+        models                              The list of models
+        next                                The continuation token of the next page, None if no more pages
+    """
+    def __init__(self, models, next = None):
+        """Create a new Page
+        """
+        self.models = models
+        self.next = next
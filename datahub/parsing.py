@@ -0,0 +1,65 @@
+# encoding=utf8
+
+""" The memoized parsing of conditions and update actions
+    Author: lipixun
+    Created Time : 六 10/17 21:10:44 2026
+
+    File Name: parsing.py
+    Description:
+
+        The same conditions and update actions are sent again and again by the clients, the parse cache keeps the
+        parsed objects of the recent payloads (Keyed by the canonical form of the payload, see _canonical.py) in a
+        bounded LRU cache. The cached objects are frozen (See DataModel.freeze) and shared, so please clone them
+        before changing.
+
+"""
+
+from datahub.utils import LRUCache
+from datahub.model._canonical import canonicalValue
+from datahub.updates import UpdateAction
+from datahub.conditions import Condition
+
+# The default max count of the cached objects
+DEFAULT_PARSE_CACHE_SIZE = 1024
+
+class ParseCache(LRUCache):
+    """The bounded LRU cache of the parsed objects
+    Attributes:
+        loader                              The method: (raw) returns the parsed data model object
+    """
+    def __init__(self, loader, size = DEFAULT_PARSE_CACHE_SIZE):
+        """Create a new ParseCache
+        """
+        self.loader = loader
+        super(ParseCache, self).__init__(size)
+
+    def load(self, raw):
+        """Load the raw payload
+        Returns:
+            The frozen data model object
+        """
+        key = canonicalValue(raw)
+        obj = self.get(key)
+        if obj is None:
+            # Parse the payload, the errors are not cached
+            obj = self.loader(raw).freeze()
+            self.set(key, obj)
+        return obj
+
+# The global parse caches
+CONDITION_PARSE_CACHE = ParseCache(Condition.load)
+UPDATE_ACTION_PARSE_CACHE = ParseCache(UpdateAction.load)
+
+def loadCondition(raw):
+    """Load the condition by the global parse cache
+    Returns:
+        The frozen Condition object
+    """
+    return CONDITION_PARSE_CACHE.load(raw)
+
+def loadUpdateActions(raws):
+    """Load the update actions by the global parse cache
+    Returns:
+        A list of frozen UpdateAction objects
+    """
+    return [ UPDATE_ACTION_PARSE_CACHE.load(x) for x in raws ]
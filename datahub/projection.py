@@ -0,0 +1,66 @@
+# encoding=utf8
+
+""" The field projection of the reads
+    Author: lipixun
+    Created Time : 日 10/18 02:14:08 2026
+
+    File Name: projection.py
+    Description:
+
+        A read could select the fields (The dotted paths, for example: a, b.c) to return instead of the whole model,
+        the fields are passed as the [fields] config (Or context) of the reads, and as a comma separated parameter of
+        the restful endpoints:
+
+            ?fields=a,b.c
+
+        The _id is always selected. The models of a projection are partially loaded (See DataModel.loadPartial), the
+        missing fields are left unset and the required field check is skipped.
+
+"""
+
+from datahub.errors import InvalidParameterError
+from datahub.model.spec import FILEDS_NAME
+
+def loadFields(fields, modelCls = None):
+    """Load the fields
+    Parameters:
+        fields                              A comma separated string or a list of dotted paths or None
+        modelCls                            The data model class, the top level fields are checked if specified
+    Returns:
+        A sorted tuple of the fields or None if all fields are selected
+    """
+    if not fields:
+        return
+    if isinstance(fields, basestring):
+        fields = fields.split(',')
+    elif not isinstance(fields, (list, tuple, set, frozenset)):
+        raise InvalidParameterError(reason = 'Invalid fields')
+    paths = set()
+    for field in fields:
+        if not isinstance(field, basestring):
+            raise InvalidParameterError(reason = 'Invalid field [%s]' % field)
+        field = field.strip()
+        if not field:
+            continue
+        if any(not x for x in field.split('.')):
+            raise InvalidParameterError(reason = 'Invalid field [%s]' % field)
+        if modelCls and not field.split('.')[0] in getattr(modelCls, FILEDS_NAME):
+            raise InvalidParameterError(reason = 'Unknown field [%s]' % field)
+        paths.add(field)
+    # Remove the fields which are selected by their parents (Mongodb rejects the collided paths)
+    return tuple(sorted(x for x in paths if not any(x.startswith(y + '.') for y in paths))) or None
+
+def dumpFields(fields):
+    """Dump the fields as the parameter value
+    Returns:
+        The comma separated string
+    """
+    return ','.join(fields)
+
+def getMongoProjection(fields):
+    """Get the mongodb projection of the fields
+    Returns:
+        The projection dict or None if all fields are selected
+    """
+    if fields:
+        return dict((x, True) for x in fields)
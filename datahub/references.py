@@ -0,0 +1,112 @@
+# encoding=utf8
+
+""" The bulk resolution of the references
+    Author: lipixun
+    Created Time : 日 10/18 05:10:26 2026
+
+    File Name: references.py
+    Description:
+
+        The models refer to the other models by the ids stored in the fields (A StringType field or a
+        ListType(StringType()) field, or a field of the nested models, like 'items.productID'). The resolveReferences
+        method resolves the references of a page of models in bulk: the ids of each reference are collected by the
+        ModelLoader (See datahub.loader) of the target, then each loader reads all the collected ids in one call (One
+        $in query for a mongodb target). So resolving a page costs one read for each target instead of one for each
+        model:
+
+            userLoader = ModelLoader.forDataService(userService)
+            orders = resolveReferences(orderService.getByQuery(query, size = 500), [
+                Reference('ownerID', userLoader, attach = 'owner'),
+                Reference('items.productID', ModelLoader.forDataService(productService), attach = 'product'),
+                ])
+
+        The references of the same target should share the loader to read the target in one call. The resolved models
+        are attached to the models (Or the nested models) which hold the ids, as the attribute named by attach: the
+        model (Or None) for a single id, and a list of the found models in order for a list of ids. An attribute which
+        is not a declared field is not dumped nor cloned, a ModelType field is dumped with the model.
+
+"""
+
+from sets import BaseSet
+
+from datahub.model import DataModel
+
+# The types of the lists of ids
+LIST_TYPES = (list, tuple, set, frozenset, BaseSet)
+
+class Reference(object):
+    """A reference
+    Attributes:
+        path                                The dotted path of the id field, for example: ownerID, items.productID
+        loader                              The ModelLoader object of the target
+        attach                              The attribute name to attach the resolved models, None to not attach
+    """
+    def __init__(self, path, loader, attach = None):
+        """Create a new Reference
+        """
+        self.path = path
+        self.loader = loader
+        self.attach = attach
+
+    def iterHolders(self, model):
+        """Iterate the models which hold the ids
+        Returns:
+            A yield of (holder, value)
+        """
+        holders = [ model ]
+        names = self.path.split('.')
+        for name in names[: -1]:
+            values = []
+            for holder in holders:
+                value = getattr(holder, name, None)
+                if isinstance(value, DataModel):
+                    values.append(value)
+                elif isinstance(value, (list, tuple)):
+                    values.extend(x for x in value if isinstance(x, DataModel))
+            holders = values
+        for holder in holders:
+            value = getattr(holder, names[-1], None)
+            if not value is None:
+                yield holder, value
+
+def getReferenceIDs(value):
+    """Get the ids of a referenced value
+    Returns:
+        A list of ids
+    """
+    if isinstance(value, LIST_TYPES):
+        return [ x for x in value if not x is None ]
+    return [ value ]
+
+def resolveReferences(models, references):
+    """Resolve the references of the models in bulk
+    Parameters:
+        models                              The models (A list or a yield)
+        references                          A list of Reference objects
+    Returns:
+        The list of the models
+    """
+    models = list(models)
+    # Collect the ids
+    holders = []
+    for reference in references:
+        for model in models:
+            for holder, value in reference.iterHolders(model):
+                reference.loader.loadMany(getReferenceIDs(value))
+                holders.append((reference, holder, value))
+    # Read by loaders, each one is read in one call
+    loaders = []
+    for reference in references:
+        if not any(reference.loader is x for x in loaders):
+            loaders.append(reference.loader)
+            reference.loader.flush()
+    # Attach
+    for reference, holder, value in holders:
+        if reference.attach:
+            if isinstance(value, LIST_TYPES):
+                resolved = [ reference.loader.resolve(x) for x in getReferenceIDs(value) ]
+                setattr(holder, reference.attach, [ x for x in resolved if not x is None ])
+            else:
+                setattr(holder, reference.attach, reference.loader.resolve(value))
+    # Done
+    return models
@@ -30,7 +30,8 @@
 
 from spec import *
 from model import DataModel, ModelType, IntegerType, ListType
-from errors import FeatureNotSupportedError
+from bulk import createOneByOne, writeOneByOne
+from errors import FeatureNotSupportedError, ModelNotFoundError
 
 class Repository(object):
     """The repository interface
@@ -65,6 +66,9 @@ class Repository(object):
 
     def getOne(self, id, configs = None):
         """Get one by id
+        Configs:
+            fields                          The fields to select (See datahub.projection), the model is partially
+                                            loaded if specified
         Returns:
             Model object
         """
@@ -74,6 +78,9 @@ class Repository(object):
         """Get
         Parameters:
             id                              The id or list / tuple of id
+        Configs:
+            fields                          The fields to select (See datahub.projection), the models are partially
+                                            loaded if specified
         Returns:
             Yield of model object
         """
@@ -83,6 +90,9 @@ class Repository(object):
         """Gets by query
         Parameters:
             query                           The condition
+        Configs:
+            fields                          The fields to select (See datahub.projection), the models are partially
+                                            loaded if specified
         Returns:
             Yield of model
         """
@@ -100,6 +110,19 @@ class Repository(object):
         """
         raise FeatureNotSupportedError(FEATURE_STORE_CREATE)
 
+    def createMany(self, models, ordered = False, configs = None):
+        """Create a couple of models, the models are created one by one by default
+        Parameters:
+            models                          A list of model objects
+            ordered                         Stop at the first failed model, the remaining models are skipped
+            configs                         A dict of configs
+        Returns:
+            The CreateManyResult object
+        Configs:
+            overwrite                       Overwrite the models if exist, false by default
+        """
+        return createOneByOne(lambda model: self.create(model, configs), models, ordered)
+
     def replace(self, model, configs = None):
         """Replace a model by id
         Parameters:
@@ -125,6 +148,39 @@ class Repository(object):
         """
         raise FeatureNotSupportedError(FEATURE_STORE_UPDATE)
 
+    def save(self, model, configs = None):
+        """Save the changes of the model (See DataModel.changes) by update
+        Parameters:
+            model                           The model object
+            configs                         A dict of configs
+        Returns:
+            The model id (As the save of the data services)
+        Errors:
+            - ModelNotFoundError will be raised if the model not found
+        """
+        updates = model.changes()
+        if updates and not self.update(model.id, updates, configs):
+            raise ModelNotFoundError
+        # Done
+        model.resetChanges()
+        return model.id
+
+    def bulkWrite(self, operations, ordered = False, configs = None):
+        """Write a couple of operations, the operations are written one by one by default
+        Parameters:
+            operations                      A list of WriteOperation (See datahub.bulk)
+            ordered                         Stop at the first failed operation, the remaining operations are skipped
+            configs                         A dict of configs
+        Returns:
+            The BulkWriteResult object
+        """
+        return writeOneByOne(operations, ordered,
+            lambda model, overwrite: self.create(model, dict(configs or {}, overwrite = overwrite)),
+            lambda model, autoCreate: self.replace(model, dict(configs or {}, autoCreate = autoCreate)),
+            lambda id, updates: self.update(id, updates, configs),
+            lambda id: self.delete(id, configs)
+            )
+
     def updatesByQuery(self, query, updates, configs = None):
         """Update a couple of models by query
         Parameters:
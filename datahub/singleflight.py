@@ -0,0 +1,382 @@
+# encoding=utf8
+
+""" The singleflight coalescing of the concurrent identical reads
+    Author: lipixun
+    Created Time : 日 10/18 03:42:19 2026
+
+    File Name: singleflight.py
+    Description:
+
+        When a popular model is expired from the caches, a lot of threads read it at the same time. The SingleFlight
+        coalesces the concurrent identical calls (The same method and the same canonical form of the arguments, see
+        datahub.model._canonical): the first call (The leader) calls the backend and the others wait for it and
+        receive its result, or its error.
+
+        The SingleFlightRepository (And the SingleFlightDataService) wraps a repository (Or a data service) and
+        coalesces the reads, the writes are passed through. The lazy results (The yields of models) are read into a
+        list by the leader. The leader returns its own result, a copy of it is shared with the followers if any (The
+        models are cloned, the lists, tuples and dicts are copied deeply). Like the caching (See datahub.caching), each
+        follower receives the clones of the shared models by default, or the frozen shared models in the frozen mode.
+
+"""
+
+import sys
+import threading
+
+from copy import deepcopy
+
+from datahub.model import DataModel
+from datahub.model._canonical import canonicalValue
+from datahub.repository import Repository
+from datahub.dataservice.interface import DataServiceInterface
+
+class Call(object):
+    """An in-flight call
+    Attributes:
+        done                                The event which is set when the call is done
+        result                              The result shared with the followers
+        error                               The exc_info of the error or None
+        followers                           The count of the coalesced calls
+    """
+    def __init__(self):
+        """Create a new Call
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight(object):
+    """Coalesce the concurrent calls of the same key
+    Attributes:
+        frozen                              Share the frozen copies of the result models with the followers
+        calls                               The in-flight calls by key
+        leads                               The count of the calls which are called
+        coalesced                           The count of the calls which are coalesced
+    """
+    def __init__(self, frozen = False):
+        """Create a new SingleFlight
+        """
+        self.frozen = frozen
+        self.calls = {}
+        self.leads = 0
+        self.coalesced = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, method, *args, **kwargs):
+        """Call the method or wait for the in-flight call of the same key
+        Parameters:
+            key                             The hashable key of the call
+            method                          The method to call
+        Returns:
+            The result (A list if the method yields)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call:
+                call.followers += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = Call()
+                self.leads += 1
+                leader = True
+        if leader:
+            result, error = None, None
+            try:
+                result = readResult(method(*args, **kwargs))
+            except:
+                error = call.error = sys.exc_info()
+            with self.lock:
+                del self.calls[key]
+                # No more followers after the call is removed
+                followers = call.followers
+            if followers and not error:
+                try:
+                    call.result = self.prepare(result)
+                except:
+                    call.error = sys.exc_info()
+            call.done.set()
+            if error:
+                raise error[0], error[1], error[2]
+            return result
+        # Wait for the leader
+        call.done.wait()
+        if call.error:
+            raise call.error[0], call.error[1], call.error[2]
+        return self.copy(call.result)
+
+    def prepare(self, result):
+        """Prepare the copy of the result to share, the result of the leader is not changed
+        """
+        if self.frozen:
+            return copyValue(result, lambda x: x.clone().freeze())
+        return copyValue(result, lambda x: x.clone())
+
+    def copy(self, result):
+        """Copy the shared result for a follower
+        """
+        if self.frozen:
+            return copyValue(result, lambda x: x)
+        return copyValue(result, lambda x: x.clone())
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return { 'inflight': len(self.calls), 'leads': self.leads, 'coalesced': self.coalesced }
+
+def readResult(result):
+    """Read the lazy result (A yield of models) into a list
+    """
+    if result is None or isinstance(result, (DataModel, list, tuple, dict, bool, int, long, float, basestring)):
+        return result
+    return list(result)
+
+def copyValue(value, copyModel):
+    """Copy the value deeply
+    Parameters:
+        copyModel                           The method: (model) returns the copy of the model
+    """
+    if isinstance(value, DataModel):
+        return copyModel(value)
+    elif isinstance(value, list):
+        return [ copyValue(x, copyModel) for x in value ]
+    elif isinstance(value, tuple):
+        return tuple(copyValue(x, copyModel) for x in value)
+    elif isinstance(value, dict):
+        return dict((k, copyValue(v, copyModel)) for k, v in value.iteritems())
+    return deepcopy(value)
+
+def getCallKey(name, *args):
+    """Get the key of a call
+    """
+    return (name, canonicalValue(list(args)))
+
+class SingleFlightRepository(Repository):
+    """The repository which coalesces the concurrent identical reads
+    Attributes:
+        repository                          The underlying repository
+        flight                              The SingleFlight object
+    """
+    def __init__(self, repository, frozen = False):
+        """Create a new SingleFlightRepository
+        Parameters:
+            repository                      The underlying Repository object
+            frozen                          Share the frozen result models instead of the clones
+        """
+        super(SingleFlightRepository, self).__init__(repository.cls, repository.sorts)
+        self.repository = repository
+        self.flight = SingleFlight(frozen)
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return self.flight.getStats()
+
+    def exist(self, id = None, configs = None):
+        """Exist
+        """
+        return self.flight.do(getCallKey('exist', id, configs), self.repository.exist, id, configs)
+
+    def existByQuery(self, query, configs = None):
+        """Exist by query
+        """
+        return self.flight.do(getCallKey('existByQuery', query, configs), self.repository.existByQuery, query, configs)
+
+    def getOne(self, id, configs = None):
+        """Get one by id
+        """
+        return self.flight.do(getCallKey('getOne', id, configs), self.repository.getOne, id, configs)
+
+    def get(self, id = None, start = 0, size = 0, sorts = None, configs = None):
+        """Get
+        """
+        return self.flight.do(getCallKey('get', id, start, size, sorts, configs), self.repository.get, id, start, size, sorts, configs)
+
+    def getByQuery(self, query, sorts = None, start = 0, size = 0, configs = None):
+        """Gets by query
+        """
+        return self.flight.do(getCallKey('getByQuery', query, sorts, start, size, configs),
+            self.repository.getByQuery, query, sorts, start, size, configs)
+
+    def count(self, id = None, configs = None):
+        """Count models
+        """
+        return self.flight.do(getCallKey('count', id, configs), self.repository.count, id, configs)
+
+    def countByQuery(self, query, configs = None):
+        """Count the model numbers by condition
+        """
+        return self.flight.do(getCallKey('countByQuery', query, configs), self.repository.countByQuery, query, configs)
+
+    def create(self, model, configs = None):
+        """Create a new model
+        """
+        return self.repository.create(model, configs)
+
+    def createMany(self, models, ordered = False, configs = None):
+        """Create a couple of models
+        """
+        return self.repository.createMany(models, ordered, configs)
+
+    def replace(self, model, configs = None):
+        """Replace a model by id
+        """
+        return self.repository.replace(model, configs)
+
+    def update(self, id, updates, configs = None):
+        """Update model
+        """
+        return self.repository.update(id, updates, configs)
+
+    def bulkWrite(self, operations, ordered = False, configs = None):
+        """Write a couple of operations
+        """
+        return self.repository.bulkWrite(operations, ordered, configs)
+
+    def updatesByQuery(self, query, updates, configs = None):
+        """Update a couple of models by query
+        """
+        return self.repository.updatesByQuery(query, updates, configs)
+
+    def updateByQuery(self, query, updates, configs = None):
+        """Update a couple of models by query (The name used by the mongodb repository)
+        """
+        return self.repository.updateByQuery(query, updates, configs)
+
+    def delete(self, id, configs = None):
+        """Delete model
+        """
+        return self.repository.delete(id, configs)
+
+    def deleteByQuery(self, query, configs = None):
+        """Delete a couple of models by query
+        """
+        return self.repository.deleteByQuery(query, configs)
+
+    def watch(self, query = None, configs = None):
+        """Watch the models
+        """
+        return self.repository.watch(query, configs)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return self.repository.support(name)
+
+class SingleFlightDataService(DataServiceInterface):
+    """The data service which coalesces the concurrent identical reads
+    Attributes:
+        underlying                          The underlying data service
+        flight                              The SingleFlight object
+    """
+    def __init__(self, underlying, frozen = False):
+        """Create a new SingleFlightDataService
+        Parameters:
+            underlying                      The underlying DataServiceInterface object
+            frozen                          Share the frozen result models instead of the clones
+        """
+        self.underlying = underlying
+        self.flight = SingleFlight(frozen)
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return self.flight.getStats()
+
+    def exist(self, id, **ctx):
+        """Check if a model with id exists
+        """
+        return self.flight.do(getCallKey('exist', id, ctx), self.underlying.exist, id, **ctx)
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        return self.flight.do(getCallKey('getOne', id, ctx), self.underlying.getOne, id, **ctx)
+
+    def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models
+        """
+        return self.flight.do(getCallKey('gets', ids, start, size, sorts, ctx), self.underlying.gets, ids, start, size, sorts, **ctx)
+
+    def getByQuery(self, query, start = 0, size = 0, sorts = None, **ctx):
+        """Get by query
+        """
+        return self.flight.do(getCallKey('getByQuery', query, start, size, sorts, ctx),
+            self.underlying.getByQuery, query, start, size, sorts, **ctx)
+
+    def counts(self, ids, **ctx):
+        """Count by ids
+        """
+        return self.flight.do(getCallKey('counts', ids, ctx), self.underlying.counts, ids, **ctx)
+
+    def countByQuery(self, query, **ctx):
+        """Count by query
+        """
+        return self.flight.do(getCallKey('countByQuery', query, ctx), self.underlying.countByQuery, query, **ctx)
+
+    def create(self, model, overwrite = False, **ctx):
+        """Create a model
+        """
+        return self.underlying.create(model, overwrite, **ctx)
+
+    def createMany(self, models, ordered = False, overwrite = False, **ctx):
+        """Create models
+        """
+        return self.underlying.createMany(models, ordered, overwrite, **ctx)
+
+    def replace(self, model, autoCreate = False, **ctx):
+        """Replace a model
+        """
+        return self.underlying.replace(model, autoCreate, **ctx)
+
+    def save(self, model, **ctx):
+        """Save a model
+        """
+        return self.underlying.save(model, **ctx)
+
+    def updateOne(self, id, updates, **ctx):
+        """Update a model
+        """
+        return self.underlying.updateOne(id, updates, **ctx)
+
+    def updates(self, ids, updates, **ctx):
+        """Update models
+        """
+        return self.underlying.updates(ids, updates, **ctx)
+
+    def updateByQuery(self, query, updates, **ctx):
+        """Update by query
+        """
+        return self.underlying.updateByQuery(query, updates, **ctx)
+
+    def bulkWrite(self, operations, ordered = False, **ctx):
+        """Write operations
+        """
+        return self.underlying.bulkWrite(operations, ordered, **ctx)
+
+    def deleteOne(self, id, **ctx):
+        """Delete a model
+        """
+        return self.underlying.deleteOne(id, **ctx)
+
+    def deletes(self, ids, **ctx):
+        """Delete models
+        """
+        return self.underlying.deletes(ids, **ctx)
+
+    def deleteByQuery(self, query, **ctx):
+        """Delete by query
+        """
+        return self.underlying.deleteByQuery(query, **ctx)
+
+    def support(self, name):
+        """Check if the feature is supported
+        """
+        return self.underlying.support(name)
@@ -18,3 +18,21 @@ class SortRule(DataModel):
     key = StringType(required = True)
     # The sort oriention
     ascending = BooleanType(required = True, default = True)
+
+def getSortValue(model, key):
+    """Get the value of the model to sort by the key
+    Returns:
+        The first value of the key path or None if not found
+    """
+    values = model.query(key)
+    return values[0] if values else None
+
+def sortModels(models, sorts):
+    """Sort the models in memory by the sort rules, the missing values are the lowest (Like mongodb)
+    Returns:
+        A list of models
+    """
+    models = list(models)
+    for sort in reversed(sorts or []):
+        models.sort(key = lambda x: getSortValue(x, sort.key), reverse = not sort.ascending)
+    return models
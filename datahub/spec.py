@@ -15,10 +15,12 @@
 FEATURE_STORE_EXIST                                 = 'store.exist'             # Check if exist by id
 FEATURE_STORE_GET                                   = 'store.get'               # Get value by id / ids
 FEATURE_STORE_CREATE                                = 'store.create'            # Create new value
+FEATURE_STORE_CREATE_MANY                           = 'store.createmany'        # Create new values in bulk
 FEATURE_STORE_REPLACE                               = 'store.replace'           # Replace value by model
 FEATURE_STORE_UPDATE                                = 'store.update'            # Update value by id
 FEATURE_STORE_DELETE                                = 'store.delete'            # Delete value by id
 FEATURE_STORE_COUNT                                 = 'store.count'             # Count the value
+FEATURE_STORE_BULK_WRITE                            = 'store.bulkwrite'         # Write values by a batch of operations
 
 # The query feature
 FEATURE_QUERY_EXIST                                 = 'query.exist'             # Check exists by query
@@ -29,6 +31,7 @@ FEATURE_QUERY_COUNT                                 = 'query.count'
 
 # The high level feature
 FEATURE_WATCH                                       = 'watch'                   # The watch feature
+FEATURE_KEYSET_PAGING                               = 'keysetpaging'            # Get values by the continuation token
 
 # -*- ---------- The data manager event specs ---------- -*-
 
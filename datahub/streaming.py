@@ -0,0 +1,150 @@
+# encoding=utf8
+
+""" The streaming of the models
+    Author: lipixun
+    Created Time : 日 10/18 01:02:15 2026
+
+    File Name: streaming.py
+    Description:
+
+        The streaming reads return the models as the backend cursor yields them, the memory is bounded by the cursor
+        batch size instead of the result size. A stream is encoded as a json array with one value per line:
+
+            [
+            {...}
+            ,{...}
+            ]
+
+        So the whole response is a valid json array, and it could be decoded line by line as well.
+
+        A stream could be encoded as NDJSON (Newline delimited json, http://ndjson.org) as well, one value per line
+        without the brackets and the commas. Since the mimetype is bound to the endpoint, each format is served by its
+        own stream endpoint (See STREAM_PATHS) with its own mimetype (See MIMETYPES).
+
+"""
+
+from itertools import imap, ifilter
+
+from datahub.utils import json
+
+# The default count of the values encoded in a chunk
+DEFAULT_CHUNK_SIZE = 64
+
+# The stream formats
+FORMAT_JSON = 'json'
+FORMAT_NDJSON = 'ndjson'
+FORMATS = (FORMAT_JSON, FORMAT_NDJSON)
+
+# The mimetypes of the stream formats
+MIMETYPES = {
+    FORMAT_JSON: 'application/json',
+    FORMAT_NDJSON: 'application/x-ndjson',
+    }
+
+# The paths (Under the path of the resource) of the stream endpoints of the stream formats
+STREAM_PATHS = {
+    FORMAT_JSON: '/_stream',
+    FORMAT_NDJSON: '/_stream/ndjson',
+    }
+
+def iterModels(models, mapper):
+    """Map and filter the models lazily
+    Parameters:
+        models                              The iterable of models
+        mapper                              The method: (model) returns the model object or None to drop the model
+    Returns:
+        Yield of model
+    """
+    return ifilter(None, imap(mapper, models or []))
+
+def dumpValue(value):
+    """Dump a value as a line
+    """
+    return json.dumps(value, ensure_ascii = False).encode('utf8')
+
+def iterJsonArray(values, chunkSize = DEFAULT_CHUNK_SIZE):
+    """Encode the values as a json array with one value per line
+    Parameters:
+        values                              The iterable of the json values
+        chunkSize                           The count of the values encoded in a chunk
+    Returns:
+        Yield of chunk strings
+    """
+    lines, first = [ '[' ], True
+    for value in values:
+        lines.append(('\n' if first else '\n,') + dumpValue(value))
+        first = False
+        if len(lines) >= chunkSize:
+            yield ''.join(lines)
+            lines = []
+    lines.append('\n]\n')
+    yield ''.join(lines)
+
+def iterJsonArrayLines(lines):
+    """Decode the json array with one value per line (See iterJsonArray)
+    Parameters:
+        lines                               The iterable of lines
+    Returns:
+        Yield of json values
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line in ('[', ']'):
+            continue
+        if line.startswith(','):
+            line = line[1: ]
+        yield json.loads(line)
+
+def iterNDJSON(values, chunkSize = DEFAULT_CHUNK_SIZE):
+    """Encode the values as NDJSON
+    Parameters:
+        values                              The iterable of the json values
+        chunkSize                           The count of the values encoded in a chunk
+    Returns:
+        Yield of chunk strings
+    """
+    lines = []
+    for value in values:
+        lines.append(dumpValue(value))
+        lines.append('\n')
+        if len(lines) >= chunkSize * 2:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+def iterNDJSONLines(lines):
+    """Decode the NDJSON
+    Parameters:
+        lines                               The iterable of lines
+    Returns:
+        Yield of json values
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iterStream(values, format = FORMAT_JSON, chunkSize = DEFAULT_CHUNK_SIZE):
+    """Encode the values in the format
+    Returns:
+        Yield of chunk strings
+    """
+    if format == FORMAT_NDJSON:
+        return iterNDJSON(values, chunkSize)
+    elif format == FORMAT_JSON:
+        return iterJsonArray(values, chunkSize)
+    else:
+        raise ValueError('Unknown stream format [%s]' % format)
+
+def iterStreamLines(lines, format = FORMAT_JSON):
+    """Decode the lines in the format
+    Returns:
+        Yield of json values
+    """
+    if format == FORMAT_NDJSON:
+        return iterNDJSONLines(lines)
+    elif format == FORMAT_JSON:
+        return iterJsonArrayLines(lines)
+    else:
+        raise ValueError('Unknown stream format [%s]' % format)
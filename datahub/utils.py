@@ -9,7 +9,106 @@
 
 """
 
+import time
+
+from threading import Lock
+from collections import OrderedDict
+
 try:
     import simplejson as json
 except ImportError:
     import json
+
+class LRUCache(object):
+    """The thread safe bounded LRU cache
+    Attributes:
+        size                                The max count of the cached values
+        ttl                                 The seconds a value is cached for, None means never expire
+        hits                                The count of the cache hits
+        misses                              The count of the cache misses
+        evictions                           The count of the values evicted since the cache is full
+        expirations                         The count of the expired values
+    """
+    def __init__(self, size, ttl = None, timer = time.time):
+        """Create a new LRUCache
+        Parameters:
+            timer                           The method returns the current time in seconds
+        """
+        self.size = size
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        """Get the count of the cached values
+        """
+        return len(self.items)
+
+    def get(self, key, default = None):
+        """Get the cached value of key
+        Returns:
+            The cached value or default if not found
+        """
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires = item
+            if not expires is None and expires <= self.timer():
+                self.expirations += 1
+                self.misses += 1
+                return default
+            # Move to the end (The most recently used)
+            self.items[key] = item
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Set the cached value of key, the least recently used values are evicted when the cache is full
+        """
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = (value, None if self.ttl is None else self.timer() + self.ttl)
+            while len(self.items) > self.size:
+                self.items.popitem(last = False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Delete the cached value of key
+        Returns:
+            True if the value is cached
+        """
+        with self.lock:
+            return not self.items.pop(key, None) is None
+
+    def clear(self):
+        """Clear the cached values, the counters are kept
+        """
+        with self.lock:
+            self.items.clear()
+
+    def resetStats(self):
+        """Reset the counters
+        """
+        with self.lock:
+            self.hits, self.misses, self.evictions, self.expirations = 0, 0, 0, 0
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            A dict
+        """
+        return {
+            'size': len(self.items),
+            'maxSize': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            }
@@ -0,0 +1,78 @@
+# encoding=utf8
+
+""" The model memory benchmark
+    Author: lipixun
+    Created Time : 六 10/17 11:42:08 2026
+
+    File Name: memory.py
+    Description:
+
+        Compare the memory used by the dict store and the compact store of ATestModel.
+        Run it in the test/buildtest directory:
+
+            python ../benchmark/memory.py [count]
+
+"""
+
+import sys
+import time
+
+from datahub.model import DataModel, ModelMetadata
+
+from model import ATestModel, ATestSubModel, createBigModel
+
+def sizeOfModel(model):
+    """Get the bytes used by the layout of the model (The instance, the instance dict and the store), the nested models are included
+    """
+    size = sys.getsizeof(model)
+    if hasattr(model, '__dict__'):
+        size += sys.getsizeof(model.__dict__)
+    store = model._datahub_datamodel_store
+    size += sys.getsizeof(store)
+    for _, value in store.iteritems():
+        size += sizeOfValue(value)
+    return size
+
+def sizeOfValue(value):
+    """Get the bytes used by the models in the value
+    """
+    if isinstance(value, DataModel):
+        return sizeOfModel(value)
+    elif isinstance(value, (list, tuple)):
+        return sum(sizeOfValue(v) for v in value)
+    elif isinstance(value, dict):
+        return sum(sizeOfValue(v) for v in value.itervalues())
+    return 0
+
+def benchmark(compact, raw, count):
+    """Run the benchmark
+    """
+    metadata, subMetadata = ATestModel.getMetadata(), ModelMetadata(compact = compact)
+    metadata.compact = compact
+    ATestSubModel.setMetadata(subMetadata)
+    try:
+        startTime = time.time()
+        models = [ ATestModel(raw) for _ in xrange(count) ]
+        loadTime = time.time() - startTime
+        startTime = time.time()
+        for model in models:
+            model.dump()
+        dumpTime = time.time() - startTime
+        return sizeOfModel(models[0]), loadTime, dumpTime
+    finally:
+        metadata.compact = False
+        del ATestSubModel._datahub_datamodel_metadata
+
+def main():
+    """The main entry
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    raw = createBigModel().dump()
+    print 'ATestModel x %d' % count
+    print '%-10s %16s %12s %12s' % ('Layout', 'Bytes / model', 'Load (s)', 'Dump (s)')
+    for name, compact in (('dict', False), ('compact', True)):
+        size, loadTime, dumpTime = benchmark(compact, raw, count)
+        print '%-10s %16d %12.3f %12.3f' % (name, size, loadTime, dumpTime)
+
+if __name__ == '__main__':
+    main()
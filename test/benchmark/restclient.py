@@ -0,0 +1,98 @@
+# encoding=utf8
+
+""" The restful web client benchmark
+    Author: lipixun
+    Created Time : 日 10/18 07:21:15 2026
+
+    File Name: restclient.py
+    Description:
+
+        Compare the throughput of the RestfulWebClient (The calls one by one) and the AsyncRestfulWebClient (The calls
+        fanned out and gathered) at 1, 10 and 100 concurrent calls of getOne, on a local threaded stand-in server which
+        delays each response (The latency of the backend). Run it in the test/buildtest directory:
+
+            python ../benchmark/restclient.py [calls] [delay] [processes]
+
+        The stand-in is served in the benchmark process by default, which shares the GIL (And the cpu) with the client.
+        Set [processes] to serve it in that count of forked processes instead. The client cpu column is the cpu time of
+        the benchmark process over the elapsed time, a column near the count of the cores means the client (Or the
+        in-process server) is cpu bound instead of waiting for the responses.
+
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+
+from datahub.futures import gather
+from datahub.dataservice.unifiedrpc.client import RestfulWebClient, AsyncRestfulWebClient, createSession
+
+from model import ATestModel, createBigModel
+from utils import StandInServer
+
+def getCPUTime():
+    """Get the cpu time (User and system) of this process
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+def measure(method, calls):
+    """Run the method
+    Returns:
+        A tuple of (The calls per second, the cpu time over the elapsed time)
+    """
+    startTime, startCPUTime = time.time(), getCPUTime()
+    method()
+    elapsed = time.time() - startTime
+    return calls / elapsed, (getCPUTime() - startCPUTime) / elapsed
+
+def benchmarkSync(uri, calls):
+    """Call one by one
+    Returns:
+        See measure
+    """
+    client = RestfulWebClient(uri, ATestModel, createSession(1))
+    def run():
+        for _ in xrange(calls):
+            client.getOne('model')
+    return measure(run, calls)
+
+def benchmarkAsync(uri, calls, concurrency):
+    """Call by batches of concurrency calls
+    Returns:
+        See measure
+    """
+    client = AsyncRestfulWebClient(uri, ATestModel, workers = concurrency)
+    def run():
+        for _ in xrange(calls / concurrency):
+            gather([ client.getOne('model') for _ in xrange(concurrency) ]).result()
+    try:
+        return measure(run, calls)
+    finally:
+        client.executor.shutdown()
+
+def main():
+    """The main entry
+    """
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    model = createBigModel()
+    model.id = 'model'
+    server = StandInServer({ model.id: model.dump() }, delay)
+    if processes:
+        server.startProcesses(processes)
+    else:
+        server.start()
+    try:
+        print 'getOne x %d, delay %.3fs, server processes %d (0 is in process), cores %d' % (calls, delay, processes, multiprocessing.cpu_count())
+        print '%-12s %12s %16s %12s' % ('Client', 'Concurrency', 'Calls / second', 'Client cpu')
+        print '%-12s %12d %16.1f %12.2f' % (('sync', 1) + benchmarkSync(server.uri, calls))
+        for concurrency in (1, 10, 100):
+            print '%-12s %12d %16.1f %12.2f' % (('async', concurrency) + benchmarkAsync(server.uri, calls, concurrency))
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# encoding=utf8
+
+""" The asynchronous restful web client test script
+    Author: lipixun
+    Created Time : 日 10/18 07:02:48 2026
+
+    File Name: test_asyncclient.py
+    Description:
+
+"""
+
+from requests.exceptions import Timeout
+
+from datahub.errors import FutureTimeoutError
+from datahub.futures import gather
+from datahub.dataservice.unifiedrpc.client import AsyncRestfulWebClient
+
+from model import ATestModel, createBigModel
+from utils import StandInServer
+
+def test_async_restful_webclient():
+    """Test the asynchronous restful web client on the stand-in server
+    """
+    docs = {}
+    for i in range(3):
+        model = createBigModel()
+        model.id = 'model%d' % i
+        docs[model.id] = model.dump()
+    server = StandInServer(docs, delay = 0.05).start()
+    try:
+        client = AsyncRestfulWebClient(server.uri, ATestModel, workers = 4)
+        # Fan out and gather
+        results = gather([ client.getOne('model1'), client.exist('none'), client.gets([ 'model2', 'model0' ]), client.counts(None) ]).result(10)
+        assert results[0].id == 'model1' and results[1] is False
+        assert [ x.id for x in results[2] ] == [ 'model2', 'model0' ] and results[3] == 3
+        # The connections are kept alive and pooled
+        gather([ client.getOne('model%d' % (i % 3)) for i in range(40) ]).result(10)
+        assert server.requests == 44 and server.connections <= 4
+        # The timeout of a socket operation of a call
+        assert isinstance(client.getOne('model1', timeout = 0.01).exception(10), Timeout)
+        # The deadline of the wait, the call is left running
+        future = client.getOne('model1')
+        try:
+            future.result(0.01)
+            raise AssertionError
+        except FutureTimeoutError:
+            pass
+        assert future.result(10).id == 'model1'
+        client.executor.shutdown()
+    finally:
+        server.stop()
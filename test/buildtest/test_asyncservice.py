@@ -0,0 +1,133 @@
+# encoding=utf8
+
+""" The asynchronous data service test script
+    Author: lipixun
+    Created Time : 日 10/18 06:24:37 2026
+
+    File Name: test_asyncservice.py
+    Description:
+
+"""
+
+import threading
+
+from datahub.futures import Future, Executor
+from datahub.errors import FutureTimeoutError, DataHubError
+from datahub.dataservice.asyncinterface import SyncDataService
+from datahub.dataservice.mongodb.service import StaticMongodbCollectionContext, AsyncMongodbDataService
+
+from model import ATestModel, createBigModel
+
+class DeleteResult(object):
+    """The delete result
+    """
+    def __init__(self, deleted_count):
+        """Create a new DeleteResult
+        """
+        self.deleted_count = deleted_count
+
+class FakeCollection(object):
+    """The in-process fake collection which supports the queries by ids
+    """
+    def __init__(self):
+        """Create a new FakeCollection
+        """
+        self.docs = {}
+        self.threads = set()
+
+    def match(self, query):
+        """Get the matched documents
+        """
+        self.threads.add(threading.current_thread().name)
+        if not isinstance(query, dict):
+            query = { '_id': query }
+        if not '_id' in query:
+            return sorted(self.docs.values(), key = lambda x: x['_id'])
+        elif isinstance(query['_id'], dict):
+            return [ self.docs[x] for x in query['_id']['$in'] if x in self.docs ]
+        return [ self.docs[query['_id']] ] if query['_id'] in self.docs else []
+
+    def find(self, query, projection = None, sort = None, skip = 0, limit = 0, batch_size = 0):
+        """Find the documents
+        """
+        docs = self.match(query)[skip: ]
+        return docs[: limit] if limit else docs
+
+    def find_one(self, query, projection = None):
+        """Find one document
+        """
+        docs = self.match(query)
+        if docs:
+            return docs[0]
+
+    def count(self, query):
+        """Count the documents
+        """
+        return len(self.match(query))
+
+    def insert_one(self, doc):
+        """Insert a document
+        """
+        self.docs[doc['_id']] = doc
+
+    def delete_one(self, query):
+        """Delete a document
+        """
+        return DeleteResult(1 if self.docs.pop(query['_id'], None) else 0)
+
+def test_future():
+    """Test the future
+    """
+    future = Future()
+    called = []
+    future.addCallback(lambda x: called.append(x.result()))
+    chained = future.then(lambda x: x + 1)
+    try:
+        future.result(0.01)
+        raise AssertionError
+    except FutureTimeoutError:
+        pass
+    future.setResult(1)
+    assert future.done() and called == [ 1 ] and chained.result() == 2
+    # The errors are passed through
+    failed = Future.resolved(0).then(lambda x: 1 / x).then(lambda x: x + 1)
+    assert isinstance(failed.exception(), ZeroDivisionError)
+    executor = Executor(workers = 2)
+    futures = [ executor.submit(lambda x: x * 2, i) for i in range(10) ]
+    assert [ x.result() for x in futures ] == range(0, 20, 2) and executor.getStats()['workers'] == 2
+    error = executor.submit(lambda: (_ for _ in ()).throw(DataHubError('Failed')))
+    try:
+        error.result()
+        raise AssertionError
+    except DataHubError:
+        pass
+    executor.shutdown()
+    assert executor.getStats() == { 'workers': 0, 'pending': 0 }
+
+def test_async_mongodb_dataservice():
+    """Test the asynchronous mongodb data service on the fake collection
+    """
+    collection = FakeCollection()
+    executor = Executor(workers = 2)
+    service = AsyncMongodbDataService(ATestModel, StaticMongodbCollectionContext(collection), executor = executor)
+    ids = []
+    for i in range(5):
+        model = createBigModel()
+        model.id = 'model%d' % i
+        ids.append(service.create(model))
+    assert [ x.result() for x in ids ] == [ 'model%d' % i for i in range(5) ]
+    # Read
+    assert service.getOne('model1').result().id == 'model1' and service.exist('model1').result()
+    assert [ x.id for x in service.gets([ 'model3', 'model0', 'none' ]).result() ] == [ 'model3', 'model0' ]
+    assert service.counts(None).result() == 5
+    # The cursor fetches the models batch by batch
+    cursor = service.iterGets(None)
+    assert [ x.id for x in cursor.fetch(2).result() ] == [ 'model0', 'model1' ]
+    assert len(cursor.fetch(10).result()) == 3 and cursor.fetch(10).result() == []
+    assert len(list(service.iterGets(None))) == 5
+    # The calls are run by the workers of the executor
+    assert not threading.current_thread().name in collection.threads and len(collection.threads) <= 2
+    # The sync service
+    sync = SyncDataService(service, timeout = 10)
+    assert sync.deleteOne('model1') and not sync.exist('model1') and len(sync.gets(None)) == 4
+    executor.shutdown()
@@ -0,0 +1,237 @@
+# encoding=utf8
+
+""" The caching test script
+    Author: lipixun
+    Created Time : 日 10/18 03:20:44 2026
+
+    File Name: test_caching.py
+    Description:
+
+"""
+
+from datahub.utils import LRUCache
+from datahub.caching import CachingRepository, CachingDataService
+from datahub.repository import Repository
+from datahub.dataservice.interface import DataServiceInterface
+from datahub.updates import SetAction
+from datahub.bulk import DeleteOperation
+from datahub.sorts import SortRule
+from datahub.errors import FrozenModelError
+
+from model import ATestModel, createBigModel
+
+class MemoryRepository(Repository):
+    """The in memory repository which counts the reads
+    """
+    def __init__(self, cls):
+        """Create a new MemoryRepository
+        """
+        super(MemoryRepository, self).__init__(cls)
+        self.models = {}
+        self.reads = 0
+
+    def exist(self, id = None, configs = None):
+        """Exist
+        """
+        self.reads += 1
+        return id in self.models
+
+    def getOne(self, id, configs = None):
+        """Get one by id
+        """
+        self.reads += 1
+        model = self.models.get(id)
+        if model:
+            return model.clone()
+
+    def get(self, id = None, start = 0, size = 0, sorts = None, configs = None):
+        """Get
+        """
+        self.reads += 1
+        for x in id:
+            if x in self.models:
+                yield self.models[x].clone()
+
+    def create(self, model, configs = None):
+        """Create a new model
+        """
+        self.models[model.id] = model.clone()
+        return model
+
+    def update(self, id, updates, configs = None):
+        """Update model
+        """
+        model = self.models.get(id)
+        if not model:
+            return 0
+        for update in updates:
+            setattr(model, update.key, update.value)
+        return 1
+
+    def delete(self, id, configs = None):
+        """Delete model
+        """
+        return 1 if self.models.pop(id, None) else 0
+
+class MemoryDataService(DataServiceInterface):
+    """The in memory data service on the MemoryRepository
+    """
+    def __init__(self, repository):
+        """Create a new MemoryDataService
+        """
+        self.repository = repository
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        return self.repository.getOne(id)
+
+    def gets(self, ids = None, start = 0, size = 0, sorts = None, **ctx):
+        """Get models
+        """
+        return list(self.repository.get(ids))
+
+    def updateOne(self, id, updates, **ctx):
+        """Update a model
+        """
+        return self.repository.update(id, updates) == 1
+
+    def deleteOne(self, id, **ctx):
+        """Delete a model
+        """
+        return self.repository.delete(id) == 1
+
+def test_lru_cache_ttl():
+    """Test the ttl and the evictions of the LRUCache
+    """
+    now = [ 0 ]
+    cache = LRUCache(2, ttl = 10, timer = lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None and cache.get('b') == 2 and cache.evictions == 1
+    now[0] = 10
+    assert cache.get('b') is None and cache.get('c') is None and cache.expirations == 2
+    cache.set('d', 4)
+    assert cache.delete('d') and not cache.delete('d')
+    assert cache.getStats() == { 'size': 0, 'maxSize': 2, 'hits': 1, 'misses': 3, 'evictions': 1, 'expirations': 2 }
+    # The counters are kept when cleared
+    cache.set('e', 5)
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 1 and cache.evictions == 1
+    cache.resetStats()
+    assert cache.getStats() == { 'size': 0, 'maxSize': 2, 'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0 }
+
+def test_caching_repository():
+    """Test the caching repository
+    """
+    underlying = MemoryRepository(ATestModel)
+    repo = CachingRepository(underlying, size = 10)
+    model = repo.create(createBigModel())
+    # Read through
+    assert repo.getOne(model.id) == model and underlying.reads == 1
+    cached = repo.getOne(model.id)
+    assert cached == model and underlying.reads == 1
+    # The cached model is cloned before returned
+    cached.intType = 2
+    assert repo.getOne(model.id).intType == 1 and repo.exist(model.id) and underlying.reads == 1
+    # The not found ids are cached
+    assert repo.getOne('notfound') is None and not repo.exist('notfound') and underlying.reads == 2
+    assert [ x.id for x in repo.get([ model.id, 'notfound', 'other' ]) ] == [ model.id ] and underlying.reads == 3
+    assert repo.get([ 'other' ]) == [] and underlying.reads == 3
+    # The writes invalidate the cache
+    assert repo.update(model.id, [ SetAction(key = 'intType', value = 3) ]) == 1
+    assert repo.getOne(model.id).intType == 3 and underlying.reads == 4
+    other = createBigModel()
+    other.id = 'other'
+    repo.create(other)
+    assert [ x.id for x in repo.get([ model.id, 'other' ]) ] == [ model.id, 'other' ] and underlying.reads == 5
+    assert repo.delete(model.id) == 1
+    assert repo.getOne(model.id) is None and underlying.reads == 6
+    # The reads with configs are not cached
+    repo.getOne('other', { 'strictLoad': True })
+    assert underlying.reads == 7
+    stats = repo.getStats()
+    assert stats['hits'] == 8 and stats['size'] == 3
+
+def test_caching_read_write_race():
+    """Test the model read before a concurrent write is not cached
+    """
+    underlying = MemoryRepository(ATestModel)
+    repo = CachingRepository(underlying, ttl = None)
+    model = repo.create(createBigModel())
+    getOne = underlying.getOne
+    def getOneAndWrite(id, configs = None):
+        """Read the old model, then the model is written before the read returns
+        """
+        old = getOne(id, configs)
+        repo.update(id, [ SetAction(key = 'intType', value = 2) ])
+        return old
+    underlying.getOne = getOneAndWrite
+    assert repo.getOne(model.id).intType == 1
+    underlying.getOne = getOne
+    assert repo.getOne(model.id).intType == 2 and underlying.reads == 2
+    assert repo.getOne(model.id).intType == 2 and underlying.reads == 2
+    # The cache is cleared during the read
+    def getAndClear(id = None, start = 0, size = 0, sorts = None, configs = None):
+        """Read the models, then the cache is cleared before the read returns
+        """
+        models = list(MemoryRepository.get(underlying, id))
+        repo.deleteByQuery(None)
+        return models
+    underlying.deleteByQuery = lambda query, configs = None: 0
+    underlying.get = getAndClear
+    repo.cache.clear()
+    assert len(repo.get([ model.id, 'none' ])) == 1 and repo.getStats()['size'] == 0 and not repo.cache.reads
+
+def test_caching_order():
+    """Test the models read by ids are in the same order whatever is cached
+    """
+    underlying = MemoryRepository(ATestModel)
+    repo = CachingRepository(underlying)
+    service = CachingDataService(MemoryDataService(underlying))
+    for id, value in (('a', 3), ('b', 1), ('c', 2)):
+        model = createBigModel()
+        model.id, model.intType = id, value
+        repo.create(model)
+    repo.getOne('c')
+    service.getOne('c')
+    assert [ x.id for x in repo.get([ 'b', 'c', 'a', 'b' ]) ] == [ 'b', 'c', 'a' ]
+    assert [ x.id for x in service.gets([ 'a', 'x', 'c', 'b' ]) ] == [ 'a', 'c', 'b' ]
+    # The default sorts of the repository
+    repo = CachingRepository(MemoryRepository(ATestModel))
+    repo.repository.models, repo.sorts = underlying.models, [ SortRule(key = 'intType', ascending = False) ]
+    repo.getOne('b')
+    assert [ x.id for x in repo.get([ 'b', 'c', 'a' ]) ] == [ 'a', 'c', 'b' ]
+
+def test_caching_frozen():
+    """Test the frozen caching repository
+    """
+    underlying = MemoryRepository(ATestModel)
+    repo = CachingRepository(underlying, frozen = True)
+    model = repo.create(createBigModel())
+    cached = repo.getOne(model.id)
+    assert cached.isFrozen() and repo.getOne(model.id) is cached and underlying.reads == 1
+    try:
+        cached.intType = 2
+        raise AssertionError
+    except FrozenModelError:
+        pass
+    assert not cached.clone().isFrozen()
+
+def test_caching_dataservice():
+    """Test the caching data service
+    """
+    repository = MemoryRepository(ATestModel)
+    service = CachingDataService(MemoryDataService(repository), size = 1)
+    model = repository.create(createBigModel())
+    assert service.getOne(model.id) == model and service.getOne(model.id) == model and repository.reads == 1
+    assert service.gets([ model.id ]) == [ model ] and repository.reads == 1
+    assert service.updateOne(model.id, [ SetAction(key = 'intType', value = 2) ])
+    assert service.getOne(model.id).intType == 2 and repository.reads == 2
+    # The size is bounded
+    assert service.getOne('notfound') is None and service.getOne(model.id).intType == 2 and repository.reads == 4
+    assert service.getStats()['evictions'] == 2
+    # The bulk writes invalidate the written ids
+    service.bulkWrite([ DeleteOperation(model.id) ])
+    assert service.getOne(model.id) is None and repository.reads == 5
@@ -9,7 +9,17 @@
 
 """
 
-from datahub.conditions import Condition, AndCondition, KeyValueCondition
+import pickle
+
+from copy import deepcopy
+
+from datahub.sorts import SortRule
+from datahub.updates import UpdateAction, SetAction, PushsAction
+from datahub.errors import BadValueError, FrozenModelError
+from datahub.parsing import ParseCache, loadUpdateActions
+from datahub.conditions import *
+
+from model import ATestModel, createBigModel
 
 def test_condition_basic():
     """Test the condition basic
@@ -34,3 +44,154 @@ def test_condition_basic():
     assert condition.conditions[0].key == 'akey' and condition.conditions[0].value == 'avalue'
     dumpJson = condition.dump()
     assert dumpJson == js
+
+def test_condition_value_set():
+    """Test the hashed value set of the key values condition
+    """
+    values = ValueSet([ 'a', 1, { 'k': 'v' }, [ 1, 2 ] ])
+    assert 'a' in values and 1 in values and 1.0 in values
+    assert { 'k': 'v' } in values and [ 1, 2 ] in values
+    assert not 'b' in values and not { 'k': 'x' } in values and not [ 1 ] in values
+    assert len(values) == 4
+    assert ValueSet.unique([ 'b', 'a', 'b', { 'k': 'v' }, { 'k': 'v' }, 'a' ]) == [ 'b', 'a', { 'k': 'v' } ]
+    # The value set is rebuilt when the values are changed
+    condition = KeyValuesCondition(key = 'akey', values = [ 'a', 'b' ])
+    assert 'a' in condition.getValueSet() and not 'c' in condition.getValueSet()
+    condition.values = [ 'c' ]
+    assert 'c' in condition.getValueSet() and not 'a' in condition.getValueSet()
+    condition.values.append('d')
+    assert 'd' in condition.getValueSet()
+    # The in place changes of the same count of values
+    condition.values[0] = 'e'
+    assert 'e' in condition.getValueSet() and not 'c' in condition.getValueSet()
+    condition.values.remove('d')
+    condition.values.extend([ 'f' ])
+    assert 'f' in condition.getValueSet() and not 'd' in condition.getValueSet()
+    # The loaded, cloned, copied and frozen conditions
+    for other in (KeyValuesCondition.loadTrusted(condition.dump()[KeyValuesCondition.NAME]), condition.clone(), deepcopy(condition), pickle.loads(pickle.dumps(condition.values))):
+        values = other if isinstance(other, list) else other.values
+        assert isinstance(values, ValueList) and 'f' in values.getValueSet()
+    frozen = condition.clone().freeze()
+    assert 'f' in frozen.getValueSet() and frozen.getValueSet() is frozen.getValueSet()
+
+def test_condition_normalize():
+    """Test the condition normalizer
+    """
+    a1, a2 = KeyValueCondition(key = 'a', value = 1), KeyValueCondition(key = 'a', value = 2)
+    b = KeyValueCondition(key = 'b', value = 'x')
+    # Flatten and remove the duplicated conditions
+    condition = AndCondition(conditions = [ a1, AndCondition(conditions = [ b, KeyValueCondition(key = 'a', value = 1) ]) ]).normalize()
+    assert condition.dump() == AndCondition(conditions = [ a1, b ]).dump()
+    # Constants
+    assert AndCondition(conditions = [ a1, OrCondition(conditions = []) ]).normalize().isAlwaysFalse()
+    assert OrCondition(conditions = [ a1, AndCondition(conditions = []) ]).normalize().isAlwaysTrue()
+    assert NotCondition(condition = NotCondition(condition = a1)).normalize() is a1
+    assert isinstance(NotCondition(condition = ExistCondition(key = 'a')).normalize(), NonExistCondition)
+    assert KeyValuesCondition(key = 'a', values = []).normalize().isAlwaysFalse()
+    assert KeyValuesCondition(key = 'a', values = [ 1, 1 ]).normalize().dump() == a1.dump()
+    # Merge kv to kvs in or condition
+    condition = OrCondition(conditions = [ a1, b, a2, KeyValuesCondition(key = 'a', values = [ 2, 3 ]) ]).normalize()
+    assert condition.dump() == OrCondition(conditions = [ KeyValuesCondition(key = 'a', values = [ 1, 2, 3 ]), b ]).dump()
+    # Merge the bounds
+    condition = AndCondition(conditions = [
+        GreaterCondition(key = 'a', value = 1), GreaterCondition(key = 'a', value = 3, equals = True), LesserCondition(key = 'a', value = 10)
+        ]).normalize()
+    assert condition.dump() == AndCondition(conditions = [ GreaterCondition(key = 'a', value = 3, equals = True), LesserCondition(key = 'a', value = 10) ]).dump()
+    condition = OrCondition(conditions = [ GreaterCondition(key = 'a', value = 1), GreaterCondition(key = 'a', value = 3) ]).normalize()
+    assert condition.dump() == GreaterCondition(key = 'a', value = 1).dump()
+    # Contradictions
+    assert AndCondition(conditions = [ ExistCondition(key = 'a'), NonExistCondition(key = 'a') ]).normalize().isAlwaysFalse()
+    assert AndCondition(conditions = [ a1, NonExistCondition(key = 'a') ]).normalize().isAlwaysFalse()
+    assert AndCondition(conditions = [ a1, NotCondition(condition = a1) ]).normalize().isAlwaysFalse()
+    assert OrCondition(conditions = [ ExistCondition(key = 'a'), NonExistCondition(key = 'a') ]).normalize().isAlwaysTrue()
+    # The values of a key without the model class may be multiple
+    condition = AndCondition(conditions = [ a1, a2 ])
+    assert condition.normalize().dump() == condition.dump()
+
+def test_condition_normalize_model():
+    """Test the condition normalizer with the model class
+    """
+    i1, i2 = KeyValueCondition(key = 'intType', value = 1), KeyValueCondition(key = 'intType', value = 2)
+    assert AndCondition(conditions = [ i1, i2 ]).normalize(ATestModel).isAlwaysFalse()
+    assert AndCondition(conditions = [ GreaterCondition(key = 'intType', value = 5), LesserCondition(key = 'intType', value = 5, equals = True) ]).normalize(ATestModel).isAlwaysFalse()
+    condition = AndCondition(conditions = [
+        KeyValuesCondition(key = 'intType', values = [ 1, 2, 3, 4 ]),
+        KeyValueCondition(key = 'intType', value = 2, equals = False),
+        GreaterCondition(key = 'intType', value = 1),
+        ]).normalize(ATestModel)
+    assert condition.dump() == KeyValuesCondition(key = 'intType', values = [ 3, 4 ]).dump()
+    # The list values are not single valued
+    condition = AndCondition(conditions = [ KeyValueCondition(key = 'listType.intType', value = 1), KeyValueCondition(key = 'listType.intType', value = 2) ])
+    assert condition.normalize(ATestModel).dump() == condition.dump()
+    # The normalized condition checks the same as the original one
+    model = createBigModel()
+    for condition in (
+        AndCondition(conditions = [ i1, ExistCondition(key = 'intType'), NotCondition(condition = NonExistCondition(key = 'stringType')) ]),
+        OrCondition(conditions = [ i2, KeyValueCondition(key = 'intType', value = 1), GreaterCondition(key = 'floatType', value = 100) ]),
+        ):
+        assert condition.normalize(ATestModel).check(model) == condition.check(model)
+
+def test_condition_canonical():
+    """Test the canonical form and the fingerprint
+    """
+    a, b = KeyValueCondition(key = 'a', value = 1), ExistCondition(key = 'b')
+    c1 = AndCondition(conditions = [ a, OrCondition(conditions = [ b, KeyValuesCondition(key = 'c', values = [ 'x', 'y' ]) ]) ])
+    c2 = Condition.load({ 'and': { 'conditions': [
+        { 'or': { 'conditions': [ { 'kvs': { 'key': u'c', 'values': [ u'y', u'x', u'y' ] } }, { 'exist': { 'key': u'b' } } ] } },
+        { 'kv': { 'key': u'a', 'value': 1 } },
+        ] } })
+    assert c1.canonical() == c2.canonical() and hash(c1.canonical()) == hash(c2.canonical())
+    assert c1.fingerprint() == c2.fingerprint() and len(c1.fingerprint()) == 40
+    # Different conditions
+    assert KeyValueCondition(key = 'a', value = True).fingerprint() != a.fingerprint()
+    assert KeyValueCondition(key = 'a', value = 1, equals = False).fingerprint() != a.fingerprint()
+    assert OrCondition(conditions = [ a, b ]).fingerprint() != AndCondition(conditions = [ a, b ]).fingerprint()
+    assert KeyValueCondition(key = 'a', value = { 'x': [ 1, 2 ] }).canonical() == KeyValueCondition(key = 'a', value = { u'x': [ 1, 2 ] }).canonical()
+    assert KeyValueCondition(key = 'a', value = { 'x': [ 1, 2 ] }).canonical() != KeyValueCondition(key = 'a', value = { 'x': [ 2, 1 ] }).canonical()
+    # Sort rules and update actions
+    assert SortRule(key = 'a').fingerprint() == SortRule(key = u'a', ascending = True).fingerprint()
+    assert SortRule(key = 'a').fingerprint() != SortRule(key = 'a', ascending = False).fingerprint()
+    assert SetAction(key = 'a', value = [ 1 ]).canonical() == UpdateAction.load({ 'set': { 'key': u'a', 'value': [ 1 ] } }).canonical()
+    assert SetAction(key = 'a', value = [ 1 ]).canonical() != PushsAction(key = 'a', values = [ 1 ]).canonical()
+
+def test_condition_parse_cache():
+    """Test the parse cache
+    """
+    cache = ParseCache(Condition.load, size = 2)
+    raw = { 'and': { 'conditions': [ { 'kv': { 'key': 'a', 'value': [ 1, 2 ] } } ] } }
+    condition = cache.load(raw)
+    assert isinstance(condition, AndCondition) and condition.isFrozen() and condition.conditions[0].isFrozen()
+    assert cache.load({ 'and': { 'conditions': [ { 'kv': { 'value': [ 1, 2 ], 'key': u'a' } } ] } }) is condition
+    assert cache.hits == 1 and cache.misses == 1
+    # The int and the float values are not the same payload
+    actions = ParseCache(UpdateAction.load)
+    assert type(actions.load({ 'set': { 'key': 'x', 'value': 1 } }).value) is int
+    assert type(actions.load({ 'set': { 'key': 'x', 'value': 1.0 } }).value) is float and actions.hits == 0
+    # The cached condition cannot be changed
+    for change in (
+        lambda: setattr(condition, 'conditions', []),
+        lambda: condition.conditions.append(ExistCondition(key = 'b')),
+        lambda: setattr(condition.conditions[0], 'key', 'b'),
+        lambda: condition.conditions[0].value.append(3),
+        ):
+        try:
+            change()
+            assert False, 'Changed a frozen condition'
+        except FrozenModelError:
+            pass
+    # The cloned condition could be changed
+    cloned = condition.clone()
+    cloned.conditions.append(ExistCondition(key = 'b'))
+    cloned.conditions[0].value.append(3)
+    assert len(condition.conditions) == 1 and condition.conditions[0].value == [ 1, 2 ]
+    # The least recently used one is evicted
+    cache.load({ 'exist': { 'key': 'b' } })
+    cache.load({ 'exist': { 'key': 'c' } })
+    assert len(cache) == 2 and cache.load(raw) is not condition and cache.getStats()['misses'] == 4
+    # The errors are not cached
+    try:
+        cache.load({ 'unknown': {} })
+        assert False, 'Loaded an unknown condition'
+    except BadValueError:
+        pass
+    assert loadUpdateActions([ { 'set': { 'key': 'a', 'value': 1 } } ])[0] is loadUpdateActions([ { 'set': { 'key': 'a', 'value': 1 } } ])[0]
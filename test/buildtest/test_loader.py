@@ -0,0 +1,87 @@
+# encoding=utf8
+
+""" The model loader test script
+    Author: lipixun
+    Created Time : 日 10/18 04:52:03 2026
+
+    File Name: test_loader.py
+    Description:
+
+"""
+
+from datahub.loader import ModelLoader
+from datahub.dataservice.mongodb import MongodbDataStorage
+from datahub.errors import DataHubError
+
+from model import ATestModel, createBigModel
+
+class FakeInCollection(object):
+    """The fake collection which records the $in queries
+    """
+    def __init__(self, models):
+        """Create a new FakeInCollection
+        """
+        self.docs = {}
+        for model in models:
+            model.validate()
+            self.docs[model.id] = model.dump()
+        self.queries = []
+
+    def find(self, query, projection = None, sort = None, skip = 0, limit = 0, batch_size = 0):
+        """Find the documents by ids
+        """
+        self.queries.append(query)
+        return [ self.docs[x] for x in query['_id']['$in'] if x in self.docs ]
+
+def createModels(ids):
+    """Create the models with the ids
+    """
+    models = []
+    for id in ids:
+        model = createBigModel()
+        model.id = id
+        models.append(model)
+    return models
+
+def test_loader_batch():
+    """Test batching the loads into one $in query
+    """
+    collection = FakeInCollection(createModels([ 'a', 'b', 'c' ]))
+    loader = ModelLoader(lambda ids: MongodbDataStorage.gets(collection, ATestModel, ids))
+    with loader.batch():
+        handles = [ loader.load(x) for x in [ 'c', 'a', 'x', 'c' ] ]
+        exists = loader.loadExist('b')
+        with loader.batch():
+            other = loader.load('a')
+        assert not collection.queries
+    # One query with the deduplicated ids in order
+    assert collection.queries == [ { '_id': { '$in': [ 'c', 'a', 'x', 'b' ] } } ]
+    models = [ x.get() for x in handles ]
+    assert [ x and x.id for x in models ] == [ 'c', 'a', None, 'c' ] and models[0] is models[3]
+    assert exists.get() and other.get() is models[1]
+    # The read models are kept by the loader
+    assert loader.gets([ 'a', 'b' ])[1].id == 'b' and not loader.exist('x') and loader.batches == 1
+
+def test_loader_without_batch():
+    """Test the loads before the first get are batched
+    """
+    collection = FakeInCollection(createModels([ 'a', 'b', 'c' ]))
+    loader = ModelLoader(lambda ids: MongodbDataStorage.gets(collection, ATestModel, ids), maxBatchSize = 2)
+    handles = loader.loadMany([ 'a', 'b', 'c' ])
+    assert handles[2].get().id == 'c' and [ x.get().id for x in handles ] == [ 'a', 'b', 'c' ]
+    assert collection.queries == [ { '_id': { '$in': [ 'a', 'b' ] } }, { '_id': { '$in': [ 'c' ] } } ]
+    loader.clear('a')
+    assert loader.getOne('a').id == 'a' and loader.batches == 3
+    # The failed loads could be loaded again
+    def getMany(ids):
+        if failed:
+            raise DataHubError('Failed')
+        return MongodbDataStorage.gets(collection, ATestModel, ids)
+    failed, loader = True, ModelLoader(getMany)
+    try:
+        loader.getOne('a')
+        raise AssertionError
+    except DataHubError:
+        pass
+    failed = False
+    assert loader.getOne('a').id == 'a'
@@ -12,8 +12,11 @@
 from sets import Set
 from datetime import datetime, date, time, timedelta
 
-from datahub.errors import MissingRequiredFieldError
+from datahub.model import ModelMetadata, LoadContext
+from datahub.errors import DataModelError, MissingRequiredFieldError, UnknownFieldError, TypeValidationError
 from datahub.conditions import *
+from datahub.diff import diff
+from datahub.updates import SetAction, ClearAction, PushsAction
 
 from model import ATestModel, ATestSubModel, createBigModel
 from utils import json
@@ -93,6 +96,15 @@ def test_model_query():
     assert len(res) == 1 and res[0] == 'estring'
     res = list(model.query('anyType.key.akey'))
     assert len(res) == 3 and res == [ 'value1', 'value2', 'value3' ]
+    # Not matched
+    assert model.query('notExistType') == []
+    assert model.query('dictType.notExistKey.stringType') == []
+    assert model.query('listType.notExistType') == []
+    assert model.query('anyType.notExistKey') == []
+    model.listType = []
+    assert model.query('listType.stringType') == []
+    # The compiled query paths are cached by the class
+    assert ATestModel._datahub_datamodel_querypaths['listType.stringType'].path == 'listType.stringType'
 
 def test_model_condition():
     """The the model condition
@@ -121,3 +133,302 @@ def test_model_condition():
     assert model.match(GreaterCondition(key = 'floatType', value = 0.9))
     assert model.match(LesserCondition(key = 'floatType', value = 1.0, equals = True))
     assert model.match(LesserCondition(key = 'floatType', value = 1.1))
+
+def test_model_compiled_condition():
+    """Test the compiled condition against the check method
+    """
+    model = createBigModel()
+    model.validate()
+    conditions = [
+        KeyValueCondition(key = 'intType', value = 1),
+        KeyValueCondition(key = 'intType', value = 2, equals = False),
+        KeyValueCondition(key = 'notExistType', value = 2, equals = False),
+        KeyValuesCondition(key = 'stringType', values = [ 'astring', 'aaaaa' ]),
+        KeyValuesCondition(key = 'stringType', values = [ 'aaaa' ]),
+        KeyValuesCondition(key = 'stringType', values = [ 'astring' ], includes = False),
+        NotCondition(condition = KeyValuesCondition(key = 'stringType', values = [ 'aaaa' ])),
+        AndCondition(conditions = []),
+        OrCondition(conditions = []),
+        AndCondition(conditions = [
+            KeyValueCondition(key = 'stringType', value = 'astring'),
+            KeyValueCondition(key = 'modelType.stringType', value = 'dstring'),
+            OrCondition(conditions = [
+                NonExistCondition(key = 'asas'),
+                ExistCondition(key = 'asas'),
+                KeyValueCondition(key = 'listType.stringType', value = 'bstring'),
+                ])
+            ]),
+        ExistCondition(key = 'anyType.key.akey'),
+        KeyValueCondition(key = 'anyType.key.akey', value = 'value1'),
+        GreaterCondition(key = 'floatType', value = 1.0, equals = True),
+        GreaterCondition(key = 'floatType', value = 1.0),
+        LesserCondition(key = 'floatType', value = 1.0, equals = True),
+        LesserCondition(key = 'floatType', value = 1.0),
+        ]
+    for condition in conditions:
+        predicate = condition.compile(ATestModel)
+        assert predicate(model) == condition.check(model), condition.dump()
+    # Fallback to the check method for the models of other classes
+    assert KeyValueCondition(key = 'intType', value = 1).compile(ATestSubModel)(model)
+
+def test_model_codec():
+    """Test the compiled codec against the interpretive path
+    """
+    model = createBigModel()
+    # The compiled path
+    assert ATestModel.getCodec()
+    compiledDump = model.dump()
+    compiledModel = ATestModel(compiledDump)
+    try:
+        ATestModel({ 'unknownField': 1 })
+        raise AssertionError
+    except UnknownFieldError:
+        pass
+    # Fall back to the interpretive path
+    metadata, defaultMetadata = ATestModel.getMetadata(), ModelMetadata.getDefault()
+    metadata.compiled = False
+    ModelMetadata.setDefault(ModelMetadata(compiled = False))
+    try:
+        assert not ATestModel.getCodec() and not ATestSubModel.getCodec()
+        assert model.dump() == compiledDump
+        assert ATestModel(compiledDump) == compiledModel
+        try:
+            ATestModel({ 'unknownField': 1 })
+            raise AssertionError
+        except UnknownFieldError:
+            pass
+    finally:
+        metadata.compiled = True
+        ModelMetadata.setDefault(defaultMetadata)
+    assert compiledModel == model
+
+def test_model_compact():
+    """Test the compact store
+    """
+    model = createBigModel()
+    raw = model.dump()
+    metadata, defaultMetadata = ATestModel.getMetadata(), ModelMetadata.getDefault()
+    metadata.compact = True
+    ModelMetadata.setDefault(ModelMetadata(compact = True))
+    try:
+        for compiled in (True, False):
+            metadata.compiled = compiled
+            compactModel = ATestModel(raw)
+            assert isinstance(compactModel._datahub_datamodel_store, list)
+            assert compactModel == model and compactModel.dump() == raw
+            # The descriptor semantics
+            assert compactModel.defaultType2 == 'defaultValue2'
+            compactModel.stringType = 'bstring'
+            assert compactModel.stringType == 'bstring' and compactModel['stringType'] == 'bstring'
+            del compactModel.stringType
+            assert compactModel.stringType is None and not compactModel.__existvalue__('stringType')
+            assert not 'stringType' in compactModel.dump()
+            try:
+                compactModel['stringType']
+                raise AssertionError
+            except KeyError:
+                pass
+            # Clone
+            assert compactModel.clone() == compactModel
+        # The model created before the switch is still dumped correctly
+        metadata.compiled = True
+        metadata.compact = False
+        model = ATestModel(raw)
+        metadata.compact = True
+        assert model.dump() == raw
+    finally:
+        metadata.compiled = True
+        metadata.compact = False
+        ModelMetadata.setDefault(defaultMetadata)
+
+def test_model_trusted_load():
+    """Test loading from a trusted source
+    """
+    model = createBigModel()
+    raw = model.dump()
+    metadata = ATestModel.getMetadata()
+    try:
+        for compiled in (True, False):
+            metadata.compiled = compiled
+            assert ATestModel.loadTrusted(raw) == model
+            assert not LoadContext.isTrusted()
+            # The validation is skipped (Including the nested models)
+            badRaw = dict(raw, stringType = 1, modelType = { 'stringType': 2 })
+            try:
+                ATestModel(dict(badRaw))
+                raise AssertionError
+            except TypeValidationError:
+                pass
+            trustedModel = ATestModel.loadTrusted(dict(badRaw))
+            assert trustedModel.stringType == 1 and trustedModel.modelType.stringType == 2
+            # The values set after loading are validated
+            try:
+                trustedModel.stringType = 1
+                raise AssertionError
+            except TypeValidationError:
+                pass
+    finally:
+        metadata.compiled = True
+
+def test_model_partial_load():
+    """Test loading a projection of the model
+    """
+    raw = createBigModel().dump()
+    partialRaw = { '_id': raw['_id'], 'intType': 1, 'modelType': { 'stringType': 'dstring' } }
+    for trusted, lazy in ((False, False), (True, False), (True, True)):
+        model = ATestModel.loadPartial(dict(partialRaw), trusted = trusted, lazy = lazy)
+        assert model.intType == 1 and model.modelType.stringType == 'dstring'
+        # The missing fields are not set by the defaults and the required ones are not checked
+        assert model.dump() == partialRaw
+        assert model.defaultType is None
+        model.validate(required = False)
+        try:
+            model.validate()
+            raise AssertionError
+        except MissingRequiredFieldError:
+            pass
+    assert not LoadContext.getCurrent()
+    # The values are still validated
+    try:
+        ATestModel.loadPartial({ 'stringType': 1 })
+        raise AssertionError
+    except TypeValidationError:
+        pass
+
+def test_model_lazy_load():
+    """Test loading lazily
+    """
+    model = createBigModel()
+    raw = model.dump()
+    lazyModel = ATestModel.loadLazy(dict(raw))
+    store = lazyModel._datahub_datamodel_store
+    assert 'listType' in store.pending and lazyModel.__existvalue__('listType')
+    # Dump without decoding
+    assert lazyModel.dump() == raw
+    assert store.pending['anyType'] is raw['anyType']
+    # Decode on access
+    assert lazyModel.stringType == 'astring' and not 'stringType' in store.pending
+    assert lazyModel.listType[0].stringType == 'bstring'
+    assert lazyModel.dump() == raw
+    # Set and delete
+    lazyModel.intType = 2
+    assert not 'intType' in store.pending and lazyModel.dump()['intType'] == 2
+    del lazyModel.anyType
+    assert lazyModel.anyType is None and not 'anyType' in lazyModel.dump()
+    # Compare with the eager model
+    assert ATestModel.loadLazy(dict(raw)) == model
+    # The errors are raised when the field is accessed
+    lazyModel = ATestModel.loadLazy(dict(raw, stringType = 1), trusted = False)
+    try:
+        lazyModel.stringType
+        raise AssertionError
+    except TypeValidationError:
+        pass
+
+def test_model_changes():
+    """Test the changes of model
+    """
+    model = ATestModel(createBigModel().dump())
+    assert model.changes() == []
+    # Assign & delete
+    model.stringType = 'bstring'
+    model.modelType.stringType = 'fstring'
+    del model.intType
+    changes = dict((x.key, x) for x in model.changes())
+    assert len(changes) == 3
+    assert isinstance(changes['stringType'], SetAction) and changes['stringType'].value == 'bstring'
+    assert isinstance(changes['modelType.stringType'], SetAction) and changes['modelType.stringType'].value == 'fstring'
+    assert isinstance(changes['intType'], ClearAction)
+    model.resetChanges()
+    assert model.changes() == []
+    # The in-place changes are detected by tracking
+    model.listType.append(ATestSubModel(stringType = 'gstring'))
+    assert model.changes() == []
+    metadata = ATestModel.getMetadata()
+    metadata.tracking = True
+    try:
+        model = ATestModel(createBigModel().dump())
+        model.listType.append(ATestSubModel(stringType = 'gstring'))
+        model.anyType['key'] = 'value'
+        changes = dict((x.key, x) for x in model.changes())
+        assert len(changes) == 2
+        assert isinstance(changes['listType'], PushsAction) and changes['listType'].values == [ { 'stringType': 'gstring' } ]
+        assert isinstance(changes['anyType'], SetAction) and changes['anyType'].value == { 'key': 'value' }
+        model.resetChanges()
+        assert model.changes() == []
+        # The lazy model
+        model = ATestModel.loadLazy(createBigModel().dump())
+        model.anyType['key'] = 'value'
+        assert [ x.key for x in model.changes() ] == [ 'anyType' ]
+    finally:
+        metadata.tracking = False
+
+def test_model_diff():
+    """Test the model diff
+    """
+    old, new = createBigModel(), createBigModel()
+    new.id = old.id
+    assert diff(old, new) == []
+    new.stringType = 'bstring'
+    new.listType.append(ATestSubModel(stringType = 'gstring'))
+    new.dictType['key'].stringType = 'hstring'
+    new.dictType['key2'] = ATestSubModel(stringType = 'istring')
+    new.modelType.stringType = None
+    del new.intType
+    updates = dict((x.key, x) for x in diff(old, new))
+    assert len(updates) == 6
+    assert isinstance(updates['stringType'], SetAction) and updates['stringType'].value == 'bstring'
+    assert isinstance(updates['listType'], PushsAction) and updates['listType'].values == [ { 'stringType': 'gstring' } ]
+    assert isinstance(updates['dictType.key.stringType'], SetAction) and updates['dictType.key.stringType'].value == 'hstring'
+    assert isinstance(updates['dictType.key2'], SetAction) and updates['dictType.key2'].value == { 'stringType': 'istring' }
+    assert isinstance(updates['modelType.stringType'], ClearAction)
+    assert isinstance(updates['intType'], ClearAction)
+    # Remove list items
+    new.listType = []
+    assert [ (type(x), x.key) for x in diff(old, new) if x.key.startswith('listType') ] == [ (ClearAction, 'listType') ]
+    new.listType = [ ATestSubModel(stringType = 'jstring') ]
+    updates = [ x for x in diff(old, new) if x.key.startswith('listType') ]
+    assert len(updates) == 1 and updates[0].key == 'listType.0.stringType' and updates[0].value == 'jstring'
+
+def test_model_update():
+    """Test the model update
+    """
+    model = createBigModel()
+    model.update([
+        SetAction(key = 'stringType', value = 'bstring'),
+        SetAction(key = 'modelType.stringType', value = 'cstring'),
+        SetAction(key = 'dictType.key.stringType', value = 'dstring'),
+        SetAction(key = 'listType.0.stringType', value = 'estring'),
+        PushsAction(key = 'listType', values = [ { 'stringType': 'fstring' } ]),
+        ClearAction(key = 'intType'),
+        ])
+    assert model.stringType == 'bstring'
+    assert model.modelType.stringType == 'cstring'
+    assert model.dictType['key'].stringType == 'dstring'
+    assert [ x.stringType for x in model.listType ] == [ 'estring', 'fstring' ] and isinstance(model.listType[1], ATestSubModel)
+    assert model.intType is None
+    model.validate()
+    # Create the missing nested model
+    model = ATestModel(requiredType = 'requiredValue')
+    model.update([ SetAction(key = 'modelType.stringType', value = 'gstring') ])
+    assert isinstance(model.modelType, ATestSubModel) and model.modelType.stringType == 'gstring'
+    # Apply the diff
+    old, new = createBigModel(), createBigModel()
+    new.id = old.id
+    new.stringType = 'hstring'
+    new.listType.append(ATestSubModel(stringType = 'istring'))
+    new.modelType.stringType = None
+    del new.intType
+    old.update(diff(old, new))
+    assert diff(old, new) == []
+    # Bad paths
+    try:
+        model.update([ SetAction(key = 'stringType.key', value = 'jstring') ])
+        assert False, 'Should fail'
+    except DataModelError:
+        pass
+    try:
+        model.update([ SetAction(key = 'unknownType', value = 'jstring') ])
+        assert False, 'Should fail'
+    except UnknownFieldError:
+        pass
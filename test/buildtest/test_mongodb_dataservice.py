@@ -11,10 +11,29 @@
 
 from uuid import uuid4
 
+from pymongo.errors import BulkWriteError
+
 from datahub.updates import UpdateAction, PushAction, PushsAction, PopAction, SetAction, ClearAction
 from datahub.conditions import KeyValueCondition, KeyValuesCondition, ExistCondition, NonExistCondition, GreaterCondition, LesserCondition, \
     AndCondition, OrCondition, NotCondition
+from datahub.spec import FEATURE_KEYSET_PAGING
 from datahub.dataservice.mongodb import MongodbDataStorage
+from datahub.dataservice.mongodb.service import MongodbDataService, StaticMongodbCollectionContext
+from datahub.dataservice.interface import DataServiceInterface
+from datahub.dataservice.asyncinterface import AsyncDataService, SyncDataService
+from datahub.caching import CachingDataService, CachingRepository
+from datahub.singleflight import SingleFlightDataService
+from datahub.adapters.repository import MongodbRepository
+from datahub.mongoquery import MongodbQueryCompiler, optimize, getKeysetFind
+from datahub.sorts import SortRule
+from datahub.paging import PageTracker, dumpToken, loadToken, getKeysetSorts
+from datahub.streaming import FORMAT_JSON, FORMAT_NDJSON, iterModels, iterJsonArray, iterJsonArrayLines, iterNDJSONLines, iterStream, \
+    iterStreamLines
+from datahub.bulk import WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_SKIPPED, WriteOperation, CreateOperation, ReplaceOperation, \
+    UpdateOperation, DeleteOperation
+from datahub.errors import DuplicatedKeyError, InvalidParameterError, ModelNotFoundError
+from datahub.projection import loadFields, getMongoProjection
+from datahub import mongobulk
 
 from model import ATestModel, createBigModel, ATestSubModel
 from utils import json
@@ -116,6 +135,401 @@ def test_mongodb_repository_basic():
     assert len(models) == 0
     models = list(mongodbDataService.getByQuery(NotCondition(condition = KeyValueCondition(key = 'stringType', value = 'UpdatedString1'))))
     assert len(models) == 0
+    # Save the changes
+    model = mongodbDataService.getOne(modelID)
+    model.stringType = 'SavedString'
+    model.modelType.stringType = 'SavedSubString'
+    assert mongodbDataService.save(model) == modelID
+    assert mongodbDataService.getOne(modelID) == model
     # Delete the model
     assert mongodbDataService.deleteOne(modelID)
     assert not mongodbDataService.getOne(modelID)
+
+def test_mongodb_optimize_query():
+    """Test the optimized mongodb query
+    """
+    a, b, c = { 'a': 1 }, { 'b': 2 }, { 'c': 3 }
+    assert optimize({ '$and': [ a, { '$and': [ b, c ] } ] }) == { '$and': [ a, b, c ] }
+    assert optimize({ '$and': [ a, { '$or': [ b, c ] }, { '$or': [ a, c ] } ] }) == { '$and': [ a, { '$or': [ b, c ] }, { '$or': [ a, c ] } ] }
+    assert optimize({ '$or': [ a, { '$and': [ b, c ] }, { '$and': [ a, c ] } ] }) == { '$or': [ a, { '$and': [ b, c ] }, { '$and': [ a, c ] } ] }
+    assert optimize({ '$and': [ { '$and': [ a ] } ] }) == a
+    assert optimize({ '$and': [] }) == {}
+    # nor(a, nor(b, c)) is not(a) and (b or c)
+    assert optimize({ '$nor': [ a, { '$nor': [ b, c ] } ] }) == { '$and': [ { '$nor': [ a ] }, { '$or': [ b, c ] } ] }
+    assert optimize({ '$nor': [ { '$nor': [ b ] } ] }) == b
+    assert optimize({ '$nor': [ { '$and': [ b, c ] } ] }) == { '$nor': [ { '$and': [ b, c ] } ] }
+    # The always false condition is not queried
+    assert MongodbDataStorage.getQueryByCondition(AndCondition(conditions = [ ExistCondition(key = 'a'), NonExistCondition(key = 'a') ])) is None
+    assert MongodbDataStorage.getQueryByCondition(AndCondition(conditions = [ KeyValueCondition(key = 'a', value = 1) ])) == a
+
+def test_mongodb_query_compiler():
+    """Test the cached mongodb query compiler
+    """
+    compiler = MongodbQueryCompiler()
+    condition = AndCondition(conditions = [
+        KeyValueCondition(key = 'a', value = 1),
+        OrCondition(conditions = [ KeyValuesCondition(key = 'b', values = [ 1, 2 ]), NotCondition(condition = GreaterCondition(key = 'c', value = 3)) ]),
+        ])
+    query = compiler.compile(condition)
+    assert query == { '$and': [ { 'a': 1 }, { '$or': [ { 'b': { '$in': [ 1, 2 ] } }, { '$nor': [ { 'c': { '$gt': 3 } } ] } ] } ] }
+    assert compiler.compile(condition) is query
+    assert compiler.queries.hits == 1 and compiler.templates.misses == 1
+    # The conditions of the same shape share the template
+    condition.conditions[0].value = 2
+    assert compiler.compile(condition) == { '$and': [ { 'a': 2 }, { '$or': [ { 'b': { '$in': [ 1, 2 ] } }, { '$nor': [ { 'c': { '$gt': 3 } } ] } ] } ] }
+    assert compiler.templates.hits == 1 and compiler.templates.misses == 1
+    # The cached query is not changed by the condition
+    condition.conditions[1].conditions[0].values.append(3)
+    assert query['$and'][1]['$or'][0] == { 'b': { '$in': [ 1, 2 ] } }
+    # The data model class is a part of the cache key
+    condition = AndCondition(conditions = [ KeyValueCondition(key = 'intType', value = 1), KeyValueCondition(key = 'intType', value = 2) ])
+    assert compiler.compile(condition) == { '$and': [ { 'intType': 1 }, { 'intType': 2 } ] }
+    assert compiler.compile(condition, ATestModel) is None
+
+class FakeInsertCollection(object):
+    """The fake collection which only supports insert_many
+    """
+    def __init__(self):
+        """Create a new FakeInsertCollection
+        """
+        self.docs = {}
+        self.calls = 0
+
+    def insert_many(self, docs, ordered = True):
+        """Insert the documents
+        """
+        self.calls += 1
+        writeErrors = []
+        for index, doc in enumerate(docs):
+            if doc['_id'] in self.docs:
+                writeErrors.append({ 'index': index, 'code': 11000, 'errmsg': 'E11000 duplicate key error' })
+                if ordered:
+                    break
+            else:
+                self.docs[doc['_id']] = doc
+        if writeErrors:
+            raise BulkWriteError({ 'writeErrors': writeErrors })
+
+def createModels(ids):
+    """Create the big models with the ids
+    """
+    models = []
+    for id in ids:
+        model = createBigModel()
+        model.id = id
+        models.append(model)
+    return models
+
+def test_mongodb_create_many():
+    """Test the bulk create of the mongodb
+    """
+    collection = FakeInsertCollection()
+    result = mongobulk.createMany(collection, createModels([ 'a', 'b', 'c' ]), batchSize = 2)
+    assert result.isOK() and result.created == 3 and collection.calls == 2
+    # Unordered: all models are tried
+    models = createModels([ 'd', 'a', 'e', 'f' ])
+    del models[3].requiredType
+    result = mongobulk.createMany(collection, models, batchSize = 2)
+    assert result.created == 2 and sorted(collection.docs.keys()) == [ 'a', 'b', 'c', 'd', 'e' ]
+    assert [ x.status for x in result.results ] == [ WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_OK, WRITE_STATUS_ERROR ]
+    errors = result.getErrors()
+    assert [ x[0] for x in errors ] == [ 1, 3 ]
+    assert isinstance(errors[0][1], DuplicatedKeyError) and errors[0][1].key == 'a'
+    assert not isinstance(errors[1][1], DuplicatedKeyError)
+    # Ordered: stop at the first failed model
+    result = mongobulk.createMany(collection, createModels([ 'g', 'b', 'h', 'i' ]), ordered = True, batchSize = 3)
+    assert result.created == 1 and not 'h' in collection.docs and not 'i' in collection.docs
+    assert [ x.status for x in result.results ] == [ WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_SKIPPED, WRITE_STATUS_SKIPPED ]
+
+def test_mongodb_storage_create_many():
+    """Test the bulk create of the mongodb data storage
+    """
+    service = MongodbDataStorage.collection(ATestModel, mongodb.test)
+    result = service.createMany(createModels([ 'x', 'y', 'x' ]), batchSize = 2)
+    assert result.created == 2 and [ x.index for x in result.results if not x.isOK() ] == [ 2 ]
+    assert service.deletes([ 'x', 'y' ]) == 2
+
+class FakeBulkCollection(object):
+    """The fake collection which only supports bulk_write and fails the requests at the specified indexes
+    """
+    def __init__(self, failures):
+        """Create a new FakeBulkCollection
+        """
+        self.failures = failures
+        self.requests = None
+
+    def bulk_write(self, requests, ordered = True):
+        """Write the requests
+        """
+        self.requests = requests
+        writeErrors = [ { 'index': x, 'code': 11000, 'errmsg': 'E11000 duplicate key error' } for x in self.failures if x < len(requests) ]
+        if ordered:
+            writeErrors = writeErrors[: 1]
+        raise BulkWriteError({ 'writeErrors': writeErrors, 'nInserted': 1, 'nMatched': 1, 'nModified': 1, 'nRemoved': 0, 'nUpserted': 0 })
+
+def test_mongodb_bulk_write():
+    """Test the bulk write of the mongodb
+    """
+    models = createModels([ 'a', 'b', 'c' ])
+    del models[1].requiredType
+    operations = [
+        CreateOperation(models[0]),
+        ReplaceOperation(models[1]),
+        UpdateOperation('c', [ SetAction(key = 'intType', value = 2) ]),
+        CreateOperation(models[2]),
+        DeleteOperation('d'),
+        ]
+    # Dump & load
+    loaded = [ WriteOperation.load(x.dump(), ATestModel) for x in operations ]
+    assert [ x.dump() for x in loaded ] == [ x.dump() for x in operations ]
+    # Unordered: the invalid model is reported and not written, the indexes of the write errors are mapped back
+    collection = FakeBulkCollection([ 2 ])
+    result = mongobulk.bulkWrite(collection, operations, False, MongodbDataStorage.getUpdatesByUpdates)
+    assert len(collection.requests) == 4
+    assert [ x.status for x in result.results ] == [ WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_OK ]
+    assert isinstance(result.results[3].getError(), DuplicatedKeyError) and result.results[3].id == 'c'
+    assert result.inserted == 1 and result.matched == 1 and result.modified == 1
+    # Ordered: stop at the invalid model
+    collection = FakeBulkCollection([])
+    result = mongobulk.bulkWrite(collection, operations, True, MongodbDataStorage.getUpdatesByUpdates)
+    assert len(collection.requests) == 1
+    assert [ x.status for x in result.results ] == [ WRITE_STATUS_OK, WRITE_STATUS_ERROR, WRITE_STATUS_SKIPPED, WRITE_STATUS_SKIPPED, WRITE_STATUS_SKIPPED ]
+
+def test_mongodb_storage_bulk_write():
+    """Test the bulk write of the mongodb data storage
+    """
+    service = MongodbDataStorage.collection(ATestModel, mongodb.test)
+    a, b = createModels([ 'bulka', 'bulkb' ])
+    result = service.bulkWrite([
+        CreateOperation(a),
+        CreateOperation(b),
+        UpdateOperation('bulka', [ SetAction(key = 'intType', value = 2) ]),
+        CreateOperation(a),
+        DeleteOperation('bulkb'),
+        ])
+    assert [ x.index for x in result.results if not x.isOK() ] == [ 3 ]
+    assert result.inserted == 2 and result.matched == 1 and result.modified == 1 and result.deleted == 1
+    assert service.getOne('bulka').intType == 2 and not service.exist('bulkb')
+    assert service.deleteOne('bulka')
+
+def test_mongodb_keyset_query():
+    """Test the keyset pagination query
+    """
+    model = createBigModel()
+    model.id = 'a'
+    sorts = getKeysetSorts([ SortRule(key = 'datetimeType', ascending = False), SortRule(key = 'modelType.stringType') ])
+    assert [ x.key for x in sorts ] == [ 'datetimeType', 'modelType.stringType', '_id' ]
+    token = dumpToken(sorts, model)
+    assert loadToken(sorts, token) == [ model.datetimeType, 'dstring', 'a' ]
+    try:
+        loadToken(sorts[1: ], token)
+        raise AssertionError
+    except InvalidParameterError:
+        pass
+    # The first page
+    assert getKeysetFind({ 'intType': 1 }, sorts[: 2], None) == ({ 'intType': 1 }, sorts)
+    # The next page
+    query, _ = getKeysetFind({ 'intType': 1 }, sorts[: 2], token)
+    assert query == { '$and': [ { 'intType': 1 }, { '$or': [
+        { '$or': [ { 'datetimeType': { '$lt': model.datetimeType } }, { 'datetimeType': None } ] },
+        { '$and': [ { 'datetimeType': model.datetimeType }, { 'modelType.stringType': { '$gt': 'dstring' } } ] },
+        { '$and': [ { 'datetimeType': model.datetimeType }, { 'modelType.stringType': 'dstring' }, { '_id': { '$gt': 'a' } } ] },
+        ] } ] }
+    # The null values
+    del model.modelType
+    query, _ = getKeysetFind({}, sorts[1: 2], dumpToken(sorts[1: ], model))
+    assert query == { '$or': [ { 'modelType.stringType': { '$ne': None } }, { '$and': [ { 'modelType.stringType': None }, { '_id': { '$gt': 'a' } } ] } ] }
+    # The page tracker
+    tracker = PageTracker(iter([ model ]), sorts[: 2], 1)
+    assert list(tracker) == [ model ] and tracker.getNextToken() == dumpToken(sorts, model)
+    tracker = PageTracker(iter([ model ]), sorts[: 2], 2)
+    assert list(tracker) == [ model ] and tracker.getNextToken() is None
+
+def test_mongodb_storage_keyset_pagination():
+    """Test the keyset pagination of the mongodb data storage
+    """
+    service = MongodbDataStorage.collection(ATestModel, mongodb.testkeyset)
+    models = createModels([ 'p%d' % x for x in range(7) ])
+    for index, model in enumerate(models):
+        model.intType = index % 3
+    assert service.createMany(models).created == 7
+    sorts = [ SortRule(key = 'intType', ascending = False) ]
+    ids, after = [], None
+    while True:
+        tracker = PageTracker(service.gets(None, size = 3, sorts = sorts, after = after), sorts, 3)
+        ids.extend([ x.id for x in tracker ])
+        after = tracker.getNextToken()
+        if not after:
+            break
+    assert ids == [ 'p2', 'p5', 'p1', 'p4', 'p0', 'p3', 'p6' ]
+    assert service.deletes([ x.id for x in models ]) == 7
+
+class FakeFindCollection(object):
+    """The fake collection which only supports find and records the fetched documents
+    """
+    def __init__(self, docs):
+        """Create a new FakeFindCollection
+        """
+        self.docs = docs
+        self.fetched = 0
+        self.batchSize = None
+        self.projection = None
+
+    def find(self, query, projection = None, sort = None, skip = 0, limit = 0, batch_size = 0):
+        """Find the documents (Only the top level fields are projected)
+        """
+        self.batchSize, self.projection = batch_size, projection
+        for doc in self.docs:
+            self.fetched += 1
+            if projection:
+                doc = dict((k, v) for k, v in doc.iteritems() if k == '_id' or projection.get(k))
+            yield doc
+
+class FakeUpdateResult(object):
+    """The fake result of update_one
+    """
+    def __init__(self, matched_count):
+        """Create a new FakeUpdateResult
+        """
+        self.matched_count = matched_count
+
+class FakeWriteCollection(object):
+    """The fake collection which fails the writes by query and matches the updates of the ids in [ids]
+    """
+    def __init__(self, ids = ()):
+        """Create a new FakeWriteCollection
+        """
+        self.ids = ids
+        self.updates = []
+
+    def update_one(self, query, updates):
+        """Update the document by id
+        """
+        self.updates.append(updates)
+        return FakeUpdateResult(1 if query['_id'] in self.ids else 0)
+
+    def update_many(self, query, updates):
+        """Update the documents
+        """
+        raise AssertionError('Updated by query %s' % query)
+
+    def delete_many(self, query):
+        """Delete the documents
+        """
+        raise AssertionError('Deleted by query %s' % query)
+
+def test_mongodb_repository_require_query():
+    """Test the writes by the always true query are rejected
+    """
+    repo = MongodbRepository(ATestModel, { 'testmodel.a': FakeWriteCollection() })
+    for query in (AndCondition(conditions = []), OrCondition(conditions = [ ExistCondition(key = 'a'), NonExistCondition(key = 'a') ])):
+        for write in (lambda: repo.updateByQuery(query, [ SetAction(key = 'intType', value = 1) ]), lambda: repo.deleteByQuery(query)):
+            try:
+                write()
+                raise AssertionError('Wrote by the always true query')
+            except InvalidParameterError:
+                pass
+
+def test_mongodb_save_returns_id():
+    """Test the save of the repository and the data service both return the model id
+    """
+    model = ATestModel(createBigModel().dump())
+    collection = FakeWriteCollection([ model.id ])
+    repo = MongodbRepository(ATestModel, { 'testmodel.a': collection })
+    service = MongodbDataService(ATestModel, StaticMongodbCollectionContext(collection))
+    for save in (repo.save, service.save):
+        model.stringType = 'saved'
+        assert save(model) == model.id and not model.changes()
+    assert len(collection.updates) == 2
+    # No update without changes
+    assert repo.save(model) == model.id and len(collection.updates) == 2
+    model.id = 'missing'
+    try:
+        repo.save(model)
+        raise AssertionError
+    except ModelNotFoundError:
+        pass
+
+def test_mongodb_support_keyset_paging():
+    """Test the keyset pagination is supported by mongodb only, and the wrappers pass it through
+    """
+    service = MongodbDataService(ATestModel, StaticMongodbCollectionContext(FakeWriteCollection()))
+    assert service.support(FEATURE_KEYSET_PAGING) and not DataServiceInterface().support(FEATURE_KEYSET_PAGING)
+    for wrapper in (CachingDataService(service), SingleFlightDataService(service), SyncDataService(AsyncDataService(service))):
+        assert wrapper.support(FEATURE_KEYSET_PAGING)
+    assert not CachingDataService(DataServiceInterface()).support(FEATURE_KEYSET_PAGING)
+    repo = MongodbRepository(ATestModel, { 'testmodel.a': FakeWriteCollection() })
+    assert repo.support(FEATURE_KEYSET_PAGING) and CachingRepository(repo).support(FEATURE_KEYSET_PAGING)
+
+def test_mongodb_stream():
+    """Test the streaming read of the mongodb data storage
+    """
+    docs = []
+    for model in createModels([ 's%d' % x for x in range(5) ]):
+        model.validate()
+        docs.append(model.dump())
+    collection = FakeFindCollection(docs)
+    # The models are loaded, mapped and dumped lazily
+    models = iterModels(MongodbDataStorage.gets(collection, ATestModel, batchSize = 2), lambda x: x if x.id != 's1' else None)
+    chunks = iterJsonArray((x.dump() for x in models), chunkSize = 2)
+    chunk = next(chunks)
+    assert collection.batchSize == 2 and collection.fetched == 1
+    chunks = [ chunk ] + list(chunks)
+    assert len(chunks) == 3 and collection.fetched == 5
+    # The stream is a json array which could be decoded line by line as well
+    text = ''.join(chunks)
+    assert [ x['_id'] for x in json.loads(text) ] == [ 's0', 's2', 's3', 's4' ]
+    assert list(iterJsonArrayLines(text.splitlines())) == json.loads(text)
+    assert ''.join(iterJsonArray([])) == '[\n]\n' and json.loads(''.join(iterJsonArray([]))) == []
+
+def test_mongodb_stream_ndjson():
+    """Test the NDJSON streaming read of the mongodb data storage
+    """
+    docs = []
+    for model in createModels([ 'n%d' % x for x in range(5) ]):
+        model.validate()
+        docs.append(model.dump())
+    collection = FakeFindCollection(docs)
+    # One model per line, the chunks are yielded as the cursor yields
+    chunks = iterStream((x.dump() for x in MongodbDataStorage.gets(collection, ATestModel)), FORMAT_NDJSON, chunkSize = 2)
+    chunk = next(chunks)
+    assert collection.fetched == 2 and chunk.count('\n') == 2
+    text = chunk + ''.join(chunks)
+    assert collection.fetched == 5 and len(text.splitlines()) == 5
+    assert [ x['_id'] for x in iterNDJSONLines(text.splitlines()) ] == [ 'n0', 'n1', 'n2', 'n3', 'n4' ]
+    assert ''.join(iterStream([], FORMAT_NDJSON)) == ''
+    # Decode by the format
+    assert list(iterStreamLines(text.splitlines(), FORMAT_NDJSON)) == list(iterNDJSONLines(text.splitlines()))
+    assert list(iterStreamLines(''.join(iterStream([ 1, 2 ], FORMAT_JSON)).splitlines())) == [ 1, 2 ]
+    try:
+        iterStreamLines([], 'xml')
+        raise AssertionError
+    except ValueError:
+        pass
+
+def test_mongodb_projection():
+    """Test the field projection of the mongodb data storage
+    """
+    assert loadFields(None) is None and loadFields('') is None
+    assert loadFields('modelType.stringType, intType,modelType') == ('intType', 'modelType')
+    assert loadFields([ 'modelType.stringType', 'intType' ], ATestModel) == ('intType', 'modelType.stringType')
+    for fields in ('a..b', 'unknown', [ 1 ], 1):
+        try:
+            loadFields(fields, ATestModel)
+            raise AssertionError
+        except InvalidParameterError:
+            pass
+    assert getMongoProjection(('intType', 'modelType.stringType')) == { 'intType': True, 'modelType.stringType': True }
+    # The models are partially loaded
+    docs = []
+    for model in createModels([ 'f%d' % x for x in range(3) ]):
+        model.validate()
+        docs.append(model.dump())
+    collection = FakeFindCollection(docs)
+    models = list(MongodbDataStorage.gets(collection, ATestModel, fields = 'intType,modelType', strictLoad = True))
+    assert collection.projection == { 'intType': True, 'modelType': True }
+    assert [ x.dump() for x in models ] == [ { '_id': x['_id'], 'intType': 1, 'modelType': { 'stringType': 'dstring' } } for x in docs ]
+    # The sort keys are selected for the continuation token
+    models = list(MongodbDataStorage.gets(collection, ATestModel, size = 2, sorts = [ SortRule(key = 'stringType') ], fields = 'intType', after = None))
+    assert collection.projection == { 'intType': True, 'stringType': True, '_id': True }
+    assert PageTracker(models, [ SortRule(key = 'stringType') ], 2) and models[0].stringType == 'astring'
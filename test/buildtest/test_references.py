@@ -0,0 +1,51 @@
+# encoding=utf8
+
+""" The references test script
+    Author: lipixun
+    Created Time : 日 10/18 05:28:14 2026
+
+    File Name: test_references.py
+    Description:
+
+"""
+
+from sets import Set
+
+from datahub.loader import ModelLoader
+from datahub.references import Reference, resolveReferences
+
+from model import ATestModel, ATestSubModel, createBigModel
+
+def test_resolve_references():
+    """Test resolving the references of a page in bulk
+    """
+    targets = {}
+    for id in [ 'a', 'b', 'c' ]:
+        targets[id] = ATestSubModel(stringType = id)
+    calls = []
+    def getMany(ids):
+        calls.append(ids)
+        return [ x for x in (targets.get(y) for y in ids) if x ]
+    # Hack the id of the sub models
+    for id, target in targets.iteritems():
+        target.id = id
+    loader = ModelLoader(getMany)
+    models = []
+    for i in range(100):
+        model = createBigModel()
+        model.stringType = [ 'a', 'b', 'x' ][i % 3]
+        model.setType = Set([ 'c', 'x' ])
+        model.listType = [ ATestSubModel(stringType = 'c'), ATestSubModel(stringType = 'a') ]
+        models.append(model)
+    models = resolveReferences(iter(models), [
+        Reference('stringType', loader, attach = 'stringRef'),
+        Reference('setType', loader, attach = 'setRefs'),
+        Reference('listType.stringType', loader, attach = 'ref'),
+        Reference('modelType.stringType', loader),
+        ])
+    # One read for all the references of the same loader
+    assert len(models) == 100 and len(calls) == 1 and sorted(calls[0]) == [ 'a', 'b', 'c', 'dstring', 'x' ]
+    assert models[0].stringRef is targets['a'] and models[1].stringRef is targets['b'] and models[2].stringRef is None
+    assert models[0].setRefs == [ targets['c'] ] and [ x.ref for x in models[0].listType ] == [ targets['c'], targets['a'] ]
+    # The attached attributes are not dumped
+    assert not 'stringRef' in models[0].dump() and not hasattr(models[0].modelType, 'ref')
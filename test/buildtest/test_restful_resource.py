@@ -0,0 +1,90 @@
+# encoding=utf8
+
+""" Test the restful resource service
+    Author: lipixun
+    Created Time : 六 10/17 10:20:15 2026
+
+    File Name: test_restful_resource.py
+    Description:
+
+"""
+
+import mime
+
+from webtest import TestApp
+
+from unifiedrpc import Server, CONFIG_RESPONSE_MIMETYPE, CONFIG_RESPONSE_CONTENT_CONTAINER
+from unifiedrpc.adapters.web import WebAdapter
+from unifiedrpc.content.container import APIContentContainer
+
+from datahub.utils import json
+from datahub.bulk import CreateOperation, ReplaceOperation, UpdateOperation, DeleteOperation
+from datahub.updates import SetAction
+from datahub.streaming import FORMAT_JSON, FORMAT_NDJSON, iterStreamLines
+from datahub.adapters.repository import MongodbRepository
+from datahub.adapters.web.restful import ResourceService, ResourceLocation
+
+from model import TestResource
+
+def test_restful_resource_location_writes():
+    """Test the many creates and the bulk writes of a scoped location
+    """
+    # Create adapter and test application
+    adapter = WebAdapter()
+    webTestApp = TestApp(adapter)
+    # Create web app
+    repo = MongodbRepository(TestResource, mongodb)
+    server = Server([ ResourceService(repo, [
+        ResourceLocation('/resources'),
+        ResourceLocation('/authors/<author>/resources', modelAttrParams = { 'author': 'author' }),
+        ]) ], [ adapter ], {
+        CONFIG_RESPONSE_MIMETYPE: mime.APPLICATION_JSON,
+        CONFIG_RESPONSE_CONTENT_CONTAINER: APIContentContainer,
+        })
+    server.start()
+    # Create many, the location attributes are applied to the models
+    result = json.loads(webTestApp.post_json("/authors/alice/resources/_creates", params = { "models": [
+        { "_id": "1", "name": "a" },
+        { "_id": "2", "name": "b", "author": "bob" },
+        ] }).body)["value"]
+    assert result["created"] == 2
+    assert [ x.author for x in repo.get([ "1", "2" ]) ] == [ "alice", "alice" ]
+    # Bulk write, the location attributes are applied to the created and replaced models
+    result = json.loads(webTestApp.post_json("/authors/alice/resources/_bulk", params = { "operations": [
+        CreateOperation(TestResource(id = "3", name = "c", author = "bob")).dump(),
+        ReplaceOperation(TestResource(id = "1", name = "d")).dump(),
+        ] }).body)["value"]
+    assert result["inserted"] == 1 and result["matched"] == 1
+    assert sorted((x.id, x.name, x.author) for x in repo.get([ "1", "3" ])) == [ ("1", "d", "alice"), ("3", "c", "alice") ]
+    # The update and delete operations cannot be scoped to the location
+    for operation in (UpdateOperation("3", [ SetAction(key = "name", value = "e") ]), DeleteOperation("3")):
+        assert webTestApp.post_json("/authors/bob/resources/_bulk", params = { "operations": [ operation.dump() ] }, expect_errors = True).status_int == 400
+    # The invalid models are rejected
+    assert webTestApp.post_json("/authors/alice/resources/_bulk", params = { "operations": [ { "create": { "model": { "_id": "4" } } } ] }, expect_errors = True).status_int == 400
+    # The general location is not scoped
+    result = json.loads(webTestApp.post_json("/resources/_bulk", params = { "operations": [
+        UpdateOperation("3", [ SetAction(key = "name", value = "e") ]).dump(),
+        DeleteOperation("2").dump(),
+        ] }).body)["value"]
+    assert result["matched"] == 1 and result["deleted"] == 1
+    assert sorted(x.name for x in repo.get([ "1", "2", "3" ])) == [ "d", "e" ]
+
+def test_restful_resource_stream():
+    """Test the streams of the resource are sent with the mimetypes of the formats
+    """
+    # Create adapter and test application
+    adapter = WebAdapter()
+    webTestApp = TestApp(adapter)
+    # Create web app
+    repo = MongodbRepository(TestResource, mongodb)
+    server = Server([ ResourceService(repo, [ ResourceLocation('/streams') ]) ], [ adapter ], {
+        CONFIG_RESPONSE_MIMETYPE: mime.APPLICATION_JSON,
+        CONFIG_RESPONSE_CONTENT_CONTAINER: APIContentContainer,
+        })
+    server.start()
+    repo.create(TestResource(id = "s1", name = "a"))
+    # Stream
+    for path, format, contentType in (("/streams/_stream", FORMAT_JSON, "application/json"), ("/streams/_stream/ndjson", FORMAT_NDJSON, "application/x-ndjson")):
+        rsp = webTestApp.post_json(path, params = { "id": [ "s1" ] })
+        assert rsp.content_type == contentType
+        assert [ x["_id"] for x in iterStreamLines(rsp.body.splitlines(), format) ] == [ "s1" ]
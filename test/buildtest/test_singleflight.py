@@ -0,0 +1,145 @@
+# encoding=utf8
+
+""" The singleflight test script
+    Author: lipixun
+    Created Time : 日 10/18 04:05:37 2026
+
+    File Name: test_singleflight.py
+    Description:
+
+"""
+
+import time
+import threading
+
+from datahub.singleflight import SingleFlight, SingleFlightRepository, SingleFlightDataService
+from datahub.repository import Repository
+from datahub.dataservice.interface import DataServiceInterface
+from datahub.conditions import KeyValueCondition
+from datahub.errors import DataHubError
+
+from model import ATestModel, createBigModel
+
+class BlockingRepository(Repository):
+    """The repository of which the reads are blocked until released
+    """
+    def __init__(self, cls, model):
+        """Create a new BlockingRepository
+        """
+        super(BlockingRepository, self).__init__(cls)
+        self.model = model
+        self.release = threading.Event()
+        self.reads = 0
+
+    def getOne(self, id, configs = None):
+        """Get one by id
+        """
+        self.reads += 1
+        self.release.wait()
+        if id == 'bad':
+            raise DataHubError('Bad id')
+        if id == self.model.id:
+            return self.model.clone()
+
+    def getByQuery(self, query, sorts = None, start = 0, size = 0, configs = None):
+        """Gets by query
+        """
+        self.reads += 1
+        self.release.wait()
+        yield self.model.clone()
+
+class BlockingDataService(DataServiceInterface):
+    """The data service on the BlockingRepository
+    """
+    def __init__(self, repository):
+        """Create a new BlockingDataService
+        """
+        self.repository = repository
+
+    def getOne(self, id, **ctx):
+        """Get one model
+        """
+        return self.repository.getOne(id)
+
+def runConcurrently(count, method, flight):
+    """Run the method in threads, the backend is released after all the calls are coalesced
+    Returns:
+        A list of (result, error)
+    """
+    results = [ None ] * count
+    def run(index):
+        try:
+            results[index] = (method(), None)
+        except Exception as error:
+            results[index] = (None, error)
+    threads = [ threading.Thread(target = run, args = (x, )) for x in range(count) ]
+    coalesced = flight.coalesced
+    for thread in threads:
+        thread.start()
+    # Wait until the followers are waiting
+    for _ in range(500):
+        if flight.coalesced - coalesced == count - 1:
+            break
+        time.sleep(0.01)
+    return results, threads
+
+def test_singleflight_repository():
+    """Test the singleflight repository
+    """
+    model = createBigModel()
+    underlying = BlockingRepository(ATestModel, model)
+    repo = SingleFlightRepository(underlying)
+    # The concurrent identical calls share one backend call
+    results, threads = runConcurrently(8, lambda: repo.getOne(model.id), repo.flight)
+    underlying.release.set()
+    for thread in threads:
+        thread.join()
+    assert underlying.reads == 1 and all(x == model and not error for x, error in results)
+    assert len(set(id(x) for x, _ in results)) == 8
+    assert repo.getStats() == { 'inflight': 0, 'leads': 1, 'coalesced': 7 }
+    # The errors are propagated to all the calls
+    underlying.release.clear()
+    results, threads = runConcurrently(4, lambda: repo.getOne('bad'), repo.flight)
+    underlying.release.set()
+    for thread in threads:
+        thread.join()
+    assert underlying.reads == 2 and all(isinstance(error, DataHubError) for _, error in results)
+    # The yields are read into a list, the different arguments are not coalesced
+    assert [ x.id for x in repo.getByQuery(KeyValueCondition(key = '_id', value = model.id)) ] == [ model.id ]
+    assert repo.getOne('other') is None and underlying.reads == 4
+
+def test_singleflight_dataservice_frozen():
+    """Test the frozen singleflight data service
+    """
+    model = createBigModel()
+    repository = BlockingRepository(ATestModel, model)
+    service = SingleFlightDataService(BlockingDataService(repository), frozen = True)
+    results, threads = runConcurrently(4, lambda: service.getOne(model.id), service.flight)
+    repository.release.set()
+    for thread in threads:
+        thread.join()
+    # The frozen copy is shared by the followers, the model of the leader is not frozen
+    assert repository.reads == 1 and len(set(id(x) for x, _ in results)) == 2
+    assert [ x.isFrozen() for x, _ in results ].count(False) == 1 and all(x == model for x, _ in results)
+
+def test_singleflight_mutable_results():
+    """Test the dicts and tuples of models are copied for the followers
+    """
+    model, release = createBigModel(), threading.Event()
+    def read():
+        release.wait()
+        return { 'models': [ model ], 'pair': (model, [ 'a' ]) }
+    for frozen in (False, True):
+        flight = SingleFlight(frozen)
+        release.clear()
+        results, threads = runConcurrently(4, lambda: flight.do('read', read), flight)
+        release.set()
+        for thread in threads:
+            thread.join()
+        results = [ x for x, _ in results ]
+        # The leader gets the result itself
+        assert sum(1 for x in results if x['models'][0] is model) == 1 and not model.isFrozen()
+        for name in ('models', 'pair'):
+            assert len(set(id(x[name]) for x in results)) == 4
+        assert len(set(id(x['pair'][1]) for x in results)) == 4
+        assert all(x['models'][0] == model and x['pair'][1] == [ 'a' ] for x in results)
@@ -21,11 +21,13 @@ from unifiedrpc.content.container import APIContentContainer
 
 from datahub.utils import json
 _json = json
+from datahub.bulk import CreateOperation, UpdateOperation, DeleteOperation
 from datahub.errors import ModelNotFoundError, DuplicatedKeyError
 from datahub.updates import UpdateAction, PushAction, PushsAction, PopAction, SetAction, ClearAction
 from datahub.conditions import KeyValueCondition, KeyValuesCondition, ExistCondition, NonExistCondition, GreaterCondition, LesserCondition, \
     AndCondition, OrCondition, NotCondition
 from datahub.dataservice.mongodb import MongodbDataStorage
+from datahub.streaming import FORMAT_JSON, FORMAT_NDJSON, iterStreamLines
 from datahub.dataservice.unifiedrpc.client import RestfulWebClient
 from datahub.dataservice.unifiedrpc.service import RestfulWebService
 
@@ -99,6 +101,11 @@ def test_unifiedrpc_restful_webservice():
     assert fetchedModel.intType == 101010
     # Count by query
     assert json.loads(webTestApp.post_json("/_countbyquery", params = { "query": KeyValueCondition(key = "intType", value = 101010).dump() }).body)["value"] == 1
+    # Stream, each format is sent with its mimetype
+    for path, format, contentType in (("/_stream", FORMAT_JSON, "application/json"), ("/_stream/ndjson", FORMAT_NDJSON, "application/x-ndjson")):
+        rsp = webTestApp.post_json(path, params = { "ids": [ model.id ] })
+        assert rsp.content_type == contentType
+        assert [ x["_id"] for x in iterStreamLines(rsp.body.splitlines(), format) ] == [ model.id ]
     # Delete
     assert json.loads(webTestApp.delete("/%s" % model.id).body)["value"] == True
     # Create a new one, test delete by query
@@ -154,6 +161,8 @@ class WebTestSession(object):
             requests.Response object
         """
         path = path or "/"
+        kwargs.pop("stream", None)
+        kwargs.pop("timeout", None)
         if "data" in kwargs:
             kwargs["body"] = kwargs.pop("data")
         if "params" in kwargs:
@@ -163,6 +172,8 @@ class WebTestSession(object):
         # Send
         rsp = self.app.request(path, method = method, expect_errors = True, **kwargs)
         rsp.content = rsp.body
+        rsp.iter_lines = lambda: iter(rsp.body.splitlines())
+        rsp.close = lambda: None
         rsp.raise_for_status = lambda: self.raise_for_status(rsp)
         return rsp
 
@@ -251,3 +262,36 @@ def test_unifiedrpc_restful_webclient():
     assert client.counts() == 3
     assert client.deleteByQuery(KeyValueCondition(key = "intType", value = 1)) == 3
     assert client.counts() == 0
+    # Create many
+    models = [ createBigModel() for _ in range(3) ]
+    models[2].id = models[0].id
+    result = client.createMany(models)
+    assert result.created == 2 and [ x.index for x in result.results if not x.isOK() ] == [ 2 ]
+    assert isinstance(result.results[2].getError(), DuplicatedKeyError)
+    assert client.counts() == 2
+    assert client.deletes([ x.id for x in models ]) == 2
+    # Bulk write
+    model = createBigModel()
+    result = client.bulkWrite([ CreateOperation(model), UpdateOperation(model.id, [ SetAction(key = "intType", value = 2) ]), CreateOperation(model) ])
+    assert result.inserted == 1 and result.matched == 1 and [ x.index for x in result.results if not x.isOK() ] == [ 2 ]
+    assert client.getOne(model.id).intType == 2
+    result = client.bulkWrite([ DeleteOperation(model.id) ], ordered = True)
+    assert result.isOK() and result.deleted == 1
+    # Keyset pagination
+    models = [ createBigModel() for _ in range(3) ]
+    assert client.createMany(models).created == 3
+    page = client.listPage(size = 2)
+    assert len(page.models) == 2 and page.next
+    nextPage = client.getPageByQuery(KeyValueCondition(key = "intType", value = 1), size = 2, after = page.next)
+    assert len(nextPage.models) == 1 and not nextPage.next
+    assert sorted([ x.id for x in page.models + nextPage.models ]) == sorted([ x.id for x in models ])
+    # Stream
+    assert sorted([ x.id for x in client.stream(batchSize = 2) ]) == sorted([ x.id for x in models ])
+    assert [ x.id for x in client.stream(query = KeyValueCondition(key = "_id", value = models[0].id)) ] == [ models[0].id ]
+    # NDJSON
+    assert sorted([ x.id for x in client.stream([ x.id for x in models ], format = FORMAT_NDJSON) ]) == sorted([ x.id for x in models ])
+    assert [ x.id for x in client.stream(query = KeyValueCondition(key = "_id", value = models[1].id), format = FORMAT_NDJSON) ] == [ models[1].id ]
+    # Projection
+    assert [ x.dump() for x in client.gets([ models[0].id ], fields = [ "intType" ]) ] == [ { "_id": models[0].id, "intType": 1 } ]
+    assert client.getOne(models[0].id, fields = "modelType").modelType.stringType == "dstring"
+    assert client.deletes([ x.id for x in models ]) == 3
@@ -14,3 +14,140 @@ try:
 except ImportError:
     import json
 
+
+import time
+import threading
+import multiprocessing
+
+from urllib import unquote_plus
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """The request handler of the stand-in restful server
+    """
+    protocol_version = 'HTTP/1.1'
+    # Send the response in one write without the delay of the nagle algorithm
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """Setup a connection
+        """
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        """Do not log
+        """
+        pass
+
+    def reply(self, status, value = None, head = False):
+        """Reply the value
+        """
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = json.dumps({ 'value': value }) if status == 200 else ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def readBody(self):
+        """Read the json body
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_HEAD(self):
+        """Head a model
+        """
+        self.reply(200 if unquote_plus(self.path[1: ]) in self.server.docs else 404, head = True)
+
+    def do_GET(self):
+        """Get a model
+        """
+        doc = self.server.docs.get(unquote_plus(self.path[1: ].split('?')[0]))
+        self.reply(200 if doc else 404, doc)
+
+    def do_POST(self):
+        """Get or count models
+        """
+        body = self.readBody()
+        ids = body.get('ids')
+        docs = [ self.server.docs[x] for x in ids if x in self.server.docs ] if ids else self.server.docs.values()
+        if self.path == '/_gets':
+            self.reply(200, docs)
+        elif self.path == '/_counts':
+            self.reply(200, len(docs))
+        else:
+            self.reply(404)
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """The local stand-in of the restful web service, which serves the exist, getOne, gets and counts of the dumped
+    models in memory
+    Attributes:
+        docs                        The dumped models by id
+        delay                       The seconds to delay each response (The latency of the backend)
+        connections                 The count of the accepted connections
+        requests                    The count of the served requests
+    """
+    daemon_threads = True
+
+    def __init__(self, docs = None, delay = 0):
+        """Create a new StandInServer on a random local port
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInRequestHandler)
+        self.docs = docs or {}
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+        self.processes = []
+        self.lock = threading.Lock()
+
+    @property
+    def uri(self):
+        """The uri of the server
+        """
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def handle_error(self, request, client_address):
+        """Ignore the errors of the requests (For example, the connection closed by the timed out client)
+        """
+        pass
+
+    def start(self):
+        """Start serving in a thread
+        """
+        thread = threading.Thread(target = self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def startProcesses(self, count):
+        """Start serving in the forked processes, which don't share the GIL with the client
+        NOTE: The counts of the connections and the requests are not collected from the processes
+        """
+        for _ in range(count):
+            process = multiprocessing.Process(target = self.serve_forever)
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def stop(self):
+        """Stop serving
+        """
+        if self.processes:
+            for process in self.processes:
+                process.terminate()
+                process.join()
+            self.processes = []
+        else:
+            self.shutdown()
+        self.server_close()